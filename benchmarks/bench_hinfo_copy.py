@@ -0,0 +1,91 @@
+"""Benchmark of hinfo ccdexposure writes: multi-row VALUES versus COPY.
+
+Writes synthetic ccdexposure rows for 1, 9 and 205 detectors (LATISS,
+LSSTComCam and LSSTCam) through `hinfo.upsert`, both with a multi-row
+``INSERT ... VALUES`` and with COPY into a staging table followed by
+``INSERT ... SELECT``, in insert and update mode.  Needs a scratch
+PostgreSQL database, given by POSTGRES_URL; a ``hinfo_bench`` schema is
+created in it and dropped afterwards.
+
+Usage::
+
+    POSTGRES_URL=... python benchmarks/bench_hinfo_copy.py [-n ITERATIONS]
+"""
+
+import argparse
+import os
+import time
+
+import sqlalchemy
+from lsst.consdb import hinfo
+
+SCHEMA = "hinfo_bench"
+
+
+def make_table(engine: sqlalchemy.Engine) -> sqlalchemy.Table:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.exec_driver_sql(f"CREATE SCHEMA {SCHEMA}")
+        conn.exec_driver_sql(
+            f"""CREATE TABLE {SCHEMA}.ccdexposure (
+                ccdexposure_id BIGINT PRIMARY KEY,
+                exposure_id BIGINT NOT NULL,
+                detector INTEGER NOT NULL,
+                day_obs INTEGER NOT NULL,
+                seq_num INTEGER NOT NULL,
+                s_region TEXT
+            )"""
+        )
+    return sqlalchemy.Table("ccdexposure", sqlalchemy.MetaData(schema=SCHEMA), autoload_with=engine)
+
+
+def make_recs(exposure_id: int, n_detectors: int, note: str) -> list[dict]:
+    return [
+        {
+            "ccdexposure_id": exposure_id * 1000 + detector,
+            "exposure_id": exposure_id,
+            "detector": detector,
+            "day_obs": 20240801,
+            "seq_num": exposure_id % 100000,
+            "s_region": f"POLYGON ICRS {note} 10.0 -30.0 10.1 -30.0 10.1 -30.1 10.0 -30.1",
+        }
+        for detector in range(n_detectors)
+    ]
+
+
+def run(engine, table, n_detectors: int, use_copy: bool, update: bool, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        # In update mode rewrite the same exposure with a changed value.
+        exposure_id = 1 if update else 2024080100000 + i
+        recs = make_recs(exposure_id, n_detectors, f"{i}")
+        with engine.begin() as conn:
+            hinfo.upsert(conn, table, recs, "ccdexposure_id", update, use_copy)
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(os.environ["POSTGRES_URL"])
+    try:
+        for update in (False, True):
+            for n_detectors in (1, 9, 205):
+                results = []
+                for use_copy in (False, True):
+                    table = make_table(engine)
+                    results.append(run(engine, table, n_detectors, use_copy, update, args.iterations))
+                mode = "update" if update else "insert"
+                print(
+                    f"{mode} {n_detectors:3d} detectors: VALUES {results[0] * 1e3:7.3f} ms, "
+                    f"COPY {results[1] * 1e3:7.3f} ms ({results[0] / results[1]:.2f}x)"
+                )
+    finally:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
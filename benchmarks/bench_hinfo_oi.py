@@ -0,0 +1,64 @@
+"""Microbenchmark of the ObservationInfo column translation in hinfo.
+
+Compares, per header:
+
+* ``per-column``: every OI_MAPPING column evaluated by a `ColumnPlan` of
+  its own, so the AltAz midpoint is transformed three times;
+* ``plan``: the compiled `ColumnPlan`, sharing the midpoint within the
+  exposure.
+
+Usage::
+
+    python benchmarks/bench_hinfo_oi.py [header.yaml] [-n ITERATIONS]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import yaml
+from astro_metadata_translator import ObservationInfo
+from lsst.consdb import hinfo
+from lsst.obs.lsst.translators import LatissTranslator
+
+DEFAULT_HEADER = Path(__file__).parent.parent / "tests" / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+
+
+def per_column(plans: list[hinfo.ColumnPlan], obs_info: ObservationInfo) -> dict:
+    values = dict()
+    for plan in plans:
+        values.update(plan.evaluate(obs_info))
+    return values
+
+
+def timeit(label: str, fn, iterations: int) -> float:
+    fn()  # Exclude one-time setup such as IERS table loading.
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - start) / iterations
+    print(f"{label:>14}: {per_call * 1e3:8.3f} ms/header")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("header", nargs="?", default=DEFAULT_HEADER, type=Path)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.header) as f:
+        info = {h["keyword"]: h["value"] for h in yaml.safe_load(f)["PRIMARY"]}
+    obs_info = ObservationInfo(info, translator_class=LatissTranslator)
+    plan = hinfo.ColumnPlan([hinfo.OI_MAPPING], oi=True)
+    plans = [
+        hinfo.ColumnPlan([{column: column_def}], oi=True) for column, column_def in hinfo.OI_MAPPING.items()
+    ]
+
+    baseline = timeit("per-column", lambda: per_column(plans, obs_info), args.iterations)
+    planned = timeit("plan", lambda: plan.evaluate(obs_info), args.iterations)
+    print(f"saving per header: {(baseline - planned) * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
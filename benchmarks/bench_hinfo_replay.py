@@ -0,0 +1,171 @@
+"""Replay benchmark of hinfo header ingest.
+
+Replays header YAML files through `hinfo.process_resource` against the
+database given by POSTGRES_URL, at a configurable rate and concurrency,
+and reports throughput, end-to-end latency percentiles and the time
+spent in each stage of ingest.  Latency is measured from the time a
+header is due to be submitted, so it includes any queueing behind the
+concurrency limit.
+
+Each input header can be replicated with synthetic sequence numbers
+(``--copies``), rewriting SEQNUM and OBSID so that every copy is a
+distinct exposure.  With ``--create-schema`` the instrument's schema is
+first created from ``sdm_schemas`` with felis, which is convenient for a
+scratch PostgreSQL database.
+
+Usage::
+
+    INSTRUMENT=LATISS POSTGRES_URL=... \\
+        python benchmarks/bench_hinfo_replay.py HEADER.yaml [DIR ...] \\
+        [--copies N] [-r RATE] [-c CONCURRENCY] [--update] [--create-schema]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import sqlalchemy
+import yaml
+from lsst.consdb import hinfo
+from lsst.consdb.utils import setup_postgres
+from lsst.resources import ResourcePath
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def list_headers(paths: list[str]) -> list[Path]:
+    headers = []
+    for path in map(Path, paths):
+        headers.extend(sorted(path.rglob("*.yaml")) if path.is_dir() else [path])
+    return headers
+
+
+def synthesize(templates: list[Path], copies: int, first_seq: int, out_dir: Path) -> list[Path]:
+    """Write ``copies`` of each template with new SEQNUM and OBSID."""
+    headers = []
+    seq_num = first_seq
+    for template in templates:
+        content = yaml.load(template.read_bytes(), Loader=hinfo.Loader)
+        for _ in range(copies):
+            obsid = None
+            for header in content["PRIMARY"]:
+                if header["keyword"] == "SEQNUM":
+                    header["value"] = seq_num
+                elif header["keyword"] == "OBSID":
+                    header["value"] = obsid = re.sub(r"\d+$", f"{seq_num:06d}", header["value"])
+            path = out_dir / f"{obsid or template.stem}_{seq_num:06d}.yaml"
+            path.write_text(yaml.dump(content, Dumper=yaml.SafeDumper, sort_keys=False))
+            headers.append(path)
+            seq_num += 1
+    return headers
+
+
+def create_schema(engine, instrument_name: str) -> None:
+    import lsst.utils
+    from felis.datamodel import Schema
+    from felis.db.utils import DatabaseContext
+    from felis.metadata import MetaDataBuilder
+
+    schema_name = f"cdb_{instrument_name}"
+    schema_file = os.path.join(lsst.utils.getPackageDir("sdm_schemas"), "yml", f"{schema_name}.yaml")
+    with open(schema_file) as f:
+        md = MetaDataBuilder(Schema.model_validate(yaml.safe_load(f))).build()
+    for table in md.tables.values():
+        if table.name in ("exposure", "ccdexposure") and "pgs_region" not in table.columns:
+            table.append_column(sqlalchemy.Column("pgs_region", sqlalchemy.String(1024)))
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
+    context = DatabaseContext(md, engine)
+    context.initialize()
+    context.create_all()
+
+
+def replay(
+    headers: list[Path], instrument_dict: dict, rate: float, concurrency: int, update: bool
+) -> tuple[float, list[float], dict[str, list[float]], int]:
+    latencies = []
+    stages: dict[str, list[float]] = {stage: [] for stage in hinfo.STAGES}
+    failures = 0
+    lock = threading.Lock()
+
+    def ingest(path: Path, due: float) -> None:
+        nonlocal failures
+        try:
+            record = hinfo.process_resource(ResourcePath(path), instrument_dict, update)
+        except Exception:
+            with lock:
+                failures += 1
+            return
+        elapsed = time.perf_counter() - due
+        with lock:
+            latencies.append(elapsed)
+            for stage, value in (record.timings if record is not None else {}).items():
+                stages[stage].append(value)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for i, path in enumerate(headers):
+            due = start + i / rate if rate > 0 else start
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(ingest, path, due))
+        concurrent.futures.wait(futures)
+    return time.perf_counter() - start, latencies, stages, failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Header YAML files, or directories searched for them.")
+    parser.add_argument("--copies", type=int, default=0, help="Replicate each header this many times.")
+    parser.add_argument("--first-seq", type=int, default=50000, help="First synthetic sequence number.")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="Headers per second; 0 is unlimited.")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Headers processed at once.")
+    parser.add_argument("--update", action="store_true", help="Update existing rows instead of skipping.")
+    parser.add_argument("--create-schema", action="store_true", help="(Re)create the instrument schema.")
+    args = parser.parse_args()
+
+    hinfo.engine = setup_postgres()
+    instrument = hinfo.instrument
+    if args.create_schema:
+        for spec in hinfo.INSTRUMENT_SPECS[instrument].values():
+            create_schema(hinfo.engine, spec[0])
+    instrument_dict = hinfo.get_instrument_dict(instrument)
+    hinfo.warm_up(instrument_dict)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        headers = list_headers(args.paths)
+        if args.copies > 0:
+            headers = synthesize(headers, args.copies, args.first_seq, Path(tmp_dir))
+        elapsed, latencies, stages, failures = replay(
+            headers, instrument_dict, args.rate, args.concurrency, args.update
+        )
+
+    throughput = len(latencies) / elapsed
+    print(f"{len(headers)} headers in {elapsed:.3f} s: {throughput:.2f} headers/s, {failures} failed")
+    if latencies:
+        p50, p95, p99 = (percentile(latencies, q) * 1e3 for q in (0.5, 0.95, 0.99))
+        print(
+            f"latency: p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, "
+            f"max {max(latencies) * 1e3:.1f} ms"
+        )
+    for stage, values in stages.items():
+        if values:
+            print(
+                f"  {stage:20s} mean {statistics.fmean(values) * 1e3:8.2f} ms  "
+                f"p95 {percentile(values, 0.95) * 1e3:8.2f} ms  total {sum(values):8.3f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark of header YAML parsing in hinfo.
+
+Compares loading the whole document with `yaml.load` and copying the
+keywords into dictionaries, as hinfo used to, against
+`hinfo.iter_header_sections` reading PRIMARY in full and only the
+detector-mapping keywords of each detector section.  Reports time and
+peak traced memory per header.
+
+Usage::
+
+    python benchmarks/bench_hinfo_yaml.py [header.yaml] [-n ITERATIONS]
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+import yaml
+from lsst.consdb import hinfo
+
+DEFAULT_HEADER = Path(__file__).parent.parent / "tests" / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+
+# Keywords read from each detector section by the default detector mapping.
+DETECTOR_KEYWORDS = {"exposure_id", "detector", "vertices", "IMGTYPE", "ccdname", "translator"}
+
+
+def full_load(data: bytes) -> tuple[dict, list]:
+    content = yaml.load(data, Loader=hinfo.Loader)
+    info = {header["keyword"]: header["value"] for header in content["PRIMARY"]}
+    detectors = [
+        {header["keyword"]: header["value"] for header in content[section]}
+        for section in content
+        if section.endswith("_PRIMARY")
+    ]
+    return info, detectors
+
+
+def section_filter(section: str) -> set[str] | None | bool:
+    if section == "PRIMARY":
+        return None
+    if section.endswith("_PRIMARY"):
+        return DETECTOR_KEYWORDS
+    return False
+
+
+def streaming(data: bytes) -> tuple[dict, list]:
+    info = dict()
+    detectors = []
+    for section, values in hinfo.iter_header_sections(data, section_filter):
+        if section == "PRIMARY":
+            info = values
+        else:
+            detectors.append(values)
+    return info, detectors
+
+
+def measure(label: str, fn, data: bytes, iterations: int) -> float:
+    fn(data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(data)
+    per_call = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:>10}: {per_call * 1e3:8.3f} ms/header, peak {peak / 1024:8.1f} KiB")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("header", nargs="?", default=DEFAULT_HEADER, type=Path)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    data = args.header.read_bytes()
+    print(f"Loader: {hinfo.Loader.__name__}, {len(data)} bytes")
+    baseline = measure("yaml.load", full_load, data, args.iterations)
+    streamed = measure("streaming", streaming, data, args.iterations)
+    print(f"speedup: {baseline / streamed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
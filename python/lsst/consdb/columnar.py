@@ -0,0 +1,240 @@
+# This file is part of consdb.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Columnar (Apache Arrow and Parquet) encodings of query results.
+
+``pyarrow`` is optional; `pyarrow_available` reports whether these
+encodings can be used.
+"""
+import io
+import itertools
+import json
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__all__ = [
+    "ARROW_STREAM_MEDIA_TYPE",
+    "PARQUET_MEDIA_TYPE",
+    "arrow_schema",
+    "iter_arrow_stream",
+    "iter_parquet",
+    "pyarrow_available",
+]
+
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+"""Media type of the Arrow IPC streaming format."""
+
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+"""Media type of Parquet files."""
+
+# Arrow type for each PostgreSQL type OID, as reported in the DBAPI cursor
+# description, with a conversion for values the Arrow type does not accept
+# directly.  Arbitrary-precision numbers have no exact Arrow equivalent in
+# general, so numeric is sent as its decimal string, without loss.
+_POSTGRES_TYPES: dict[int, tuple[str, Callable[[Any], Any] | None]] = {
+    16: ("bool", None),
+    17: ("binary", bytes),
+    18: ("string", None),
+    19: ("string", None),
+    20: ("int64", None),
+    21: ("int16", None),
+    23: ("int32", None),
+    25: ("string", None),
+    26: ("int64", None),
+    114: ("string", json.dumps),
+    700: ("float32", None),
+    701: ("float64", None),
+    1042: ("string", None),
+    1043: ("string", None),
+    1082: ("date32", None),
+    1083: ("time64", None),
+    1114: ("timestamp", None),
+    1184: ("timestamptz", None),
+    1186: ("duration", None),
+    1700: ("string", str),
+    2950: ("string", str),
+    3802: ("string", json.dumps),
+}
+
+
+def pyarrow_available() -> bool:
+    """Return True if ``pyarrow`` is installed."""
+    return pyarrow is not None
+
+
+def _arrow_type(name: str) -> "pyarrow.DataType":
+    if name == "time64":
+        return pyarrow.time64("us")
+    if name == "timestamp":
+        return pyarrow.timestamp("us")
+    if name == "timestamptz":
+        return pyarrow.timestamp("us", tz="UTC")
+    if name == "duration":
+        return pyarrow.duration("us")
+    return getattr(pyarrow, name)()
+
+
+def arrow_schema(
+    columns: Sequence[str], type_codes: Sequence[Any], first_rows: Sequence[Sequence[Any]]
+) -> tuple["pyarrow.Schema", list[Callable[[Any], Any] | None]]:
+    """Return the Arrow schema of a query result.
+
+    Column types come from the PostgreSQL type OIDs of the result.  Columns
+    of other types, or results from other databases, get the type Arrow
+    infers from ``first_rows``, or string if nothing can be inferred.
+
+    Parameters
+    ----------
+    columns : `~collections.abc.Sequence` [ `str` ]
+        Column names.
+    type_codes : `~collections.abc.Sequence`
+        ``type_code`` of each column in the cursor description.
+    first_rows : `~collections.abc.Sequence`
+        The first rows of the result, used to infer unknown types.
+
+    Returns
+    -------
+    schema : `pyarrow.Schema`
+        The schema.
+    converters : `list`
+        Function to apply to each non-null value of each column, or None.
+    """
+    fields = []
+    converters = []
+    for i, (name, type_code) in enumerate(zip(columns, type_codes)):
+        if type_code in _POSTGRES_TYPES:
+            type_name, converter = _POSTGRES_TYPES[type_code]
+            arrow_type = _arrow_type(type_name)
+        else:
+            converter = None
+            try:
+                arrow_type = pyarrow.array([row[i] for row in first_rows]).type
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                arrow_type = pyarrow.null()
+            if pyarrow.types.is_null(arrow_type) or pyarrow.types.is_nested(arrow_type):
+                arrow_type, converter = pyarrow.string(), str
+        fields.append(pyarrow.field(name, arrow_type))
+        converters.append(converter)
+    return pyarrow.schema(fields), converters
+
+
+def _record_batch(
+    schema: "pyarrow.Schema", converters: list[Callable[[Any], Any] | None], rows: Sequence[Sequence[Any]]
+) -> "pyarrow.RecordBatch":
+    arrays = []
+    for i, (field, converter) in enumerate(zip(schema, converters)):
+        values = [row[i] for row in rows]
+        if converter is not None:
+            values = [None if v is None else converter(v) for v in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file that hands out what was written in chunks."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        """Return everything written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_encoded(
+    columns: Sequence[str],
+    type_codes: Sequence[Any],
+    batches: Iterable[Sequence[Sequence[Any]]],
+    open_writer: Callable[[_ChunkSink, "pyarrow.Schema"], Any],
+) -> Iterator[bytes]:
+    batches = iter(batches)
+    first = next(batches, [])
+    schema, converters = arrow_schema(columns, type_codes, first)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    try:
+        for rows in itertools.chain([first], batches):
+            writer.write_batch(_record_batch(schema, converters, rows))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def iter_arrow_stream(
+    columns: Sequence[str], type_codes: Sequence[Any], batches: Iterable[Sequence[Sequence[Any]]]
+) -> Iterator[bytes]:
+    """Encode rows in the Arrow IPC streaming format, batch by batch.
+
+    Parameters
+    ----------
+    columns : `~collections.abc.Sequence` [ `str` ]
+        Column names.
+    type_codes : `~collections.abc.Sequence`
+        ``type_code`` of each column in the cursor description.
+    batches : `~collections.abc.Iterable`
+        Batches of rows; each becomes one Arrow record batch.
+
+    Yields
+    ------
+    data : `bytes`
+        The encoded stream, in pieces.
+    """
+    yield from _iter_encoded(columns, type_codes, batches, pyarrow.ipc.new_stream)
+
+
+def iter_parquet(
+    columns: Sequence[str], type_codes: Sequence[Any], batches: Iterable[Sequence[Sequence[Any]]]
+) -> Iterator[bytes]:
+    """Encode rows as a Parquet file, batch by batch.
+
+    Parameters are as for `iter_arrow_stream`; each batch becomes one row
+    group.
+
+    Yields
+    ------
+    data : `bytes`
+        The encoded file, in pieces.
+    """
+    yield from _iter_encoded(columns, type_codes, batches, pyarrow.parquet.ParquetWriter)
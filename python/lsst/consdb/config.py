@@ -34,6 +34,21 @@ class Configuration(BaseSettings):
         title="Maximum time to allow a database connection to idle (seconds).",
     )
 
+    async_db_driver: str = Field(
+        "psycopg",
+        title="Asynchronous DBAPI driver used by the query and insert endpoints.",
+    )
+
+    async_pool_size: int = Field(
+        10,
+        title="Number of connections kept open by the asynchronous database engine.",
+    )
+
+    async_max_overflow: int = Field(
+        10,
+        title="Number of connections the asynchronous database engine may open beyond its pool size.",
+    )
+
     statement_timeout_seconds: int = Field(
         600,
         title="Timeout duration for sqlalchemy queries (seconds).",
@@ -43,6 +58,20 @@ class Configuration(BaseSettings):
 
     fetch_size: int = Field(10_000, title="Number of rows to fetch at once in the query endpoint.")
 
+    query_itersize: int = Field(
+        10_000, title="Number of rows read per round trip from the server-side cursor of the query endpoint."
+    )
+
+    query_cache_ttl_seconds: float = Field(
+        0,
+        title="Lifetime of cached read-only query results (seconds); 0 disables the cache.",
+    )
+
+    query_cache_max_bytes: int = Field(
+        64 * 1024 * 1024,
+        title="Approximate maximum memory used by cached query results (bytes).",
+    )
+
     log_config: str = Field(
         "",
         title="Log levels",
@@ -99,6 +128,13 @@ class Configuration(BaseSettings):
 
         raise ValueError("Database connection not specified")
 
+    @property
+    def async_database_url(self) -> str:
+        """The database URL, with the PostgreSQL driver replaced by
+        ``async_db_driver``."""
+
+        return re.sub(r"^postgresql(\+\w+)?://", f"postgresql+{self.async_db_driver}://", self.database_url)
+
     @field_validator("log_config")
     @classmethod
     def configure_logging(cls, log_config, values):
@@ -19,26 +19,47 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import logging
 from functools import cache
 from typing import Annotated
 
 from fastapi import Depends, Path, Request
 from pydantic import AfterValidator
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from .cdb_schema import InstrumentTable
 from .config import config
 from .exceptions import UnknownInstrumentException
+from .query_cache import QueryCache
 
-__all__ = ["get_logger", "get_db"]
+__all__ = ["get_logger", "get_db", "get_async_db", "get_query_cache"]
 
 _database_url = None
 _engine = None
 _SessionLocal = None
+_async_engine: AsyncEngine | None = None
+_AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
 _instrument_tables: dict[str, InstrumentTable] = dict()
+_query_cache: QueryCache | None = None
+
+# Tables and views directly read by each view or materialized view.
+_VIEW_DEPENDENCIES_QUERY = """
+SELECT DISTINCT vn.nspname || '.' || v.relname AS view_name, tn.nspname || '.' || t.relname AS table_name
+FROM pg_depend d
+JOIN pg_rewrite r ON r.oid = d.objid
+JOIN pg_class v ON v.oid = r.ev_class
+JOIN pg_namespace vn ON vn.oid = v.relnamespace
+JOIN pg_class t ON t.oid = d.refobjid
+JOIN pg_namespace tn ON tn.oid = t.relnamespace
+WHERE d.classid = 'pg_rewrite'::regclass
+  AND d.refclassid = 'pg_class'::regclass
+  AND v.relkind IN ('v', 'm')
+  AND v.oid <> t.oid
+"""
 
 
 def get_engine():
@@ -76,6 +97,80 @@ def get_db():
         db.close()
 
 
+def get_async_engine() -> AsyncEngine:
+    """Return the asynchronous database engine.
+
+    Requests served through it wait on the event loop rather than holding
+    a worker thread, so the number of concurrent queries is bounded by
+    ``config.async_pool_size`` and ``config.async_max_overflow``.
+    """
+    global _async_engine
+
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            config.async_database_url,
+            pool_pre_ping=True,
+            pool_recycle=config.pool_recycle_time,
+            pool_size=config.async_pool_size,
+            max_overflow=config.async_max_overflow,
+        )
+
+    return _async_engine
+
+
+async def get_async_db():
+    global _AsyncSessionLocal
+
+    if _AsyncSessionLocal is None:
+        _AsyncSessionLocal = async_sessionmaker(bind=get_async_engine(), expire_on_commit=False)
+
+    async with _AsyncSessionLocal() as db:
+        yield db
+
+
+def get_view_tables(engine: Engine) -> dict[str, set[str]]:
+    """Return the tables each view reads, directly or through other views."""
+    direct: dict[str, set[str]] = dict()
+    with engine.connect() as connection:
+        for view_name, table_name in connection.execute(text(_VIEW_DEPENDENCIES_QUERY)):
+            direct.setdefault(view_name.lower(), set()).add(table_name.lower())
+
+    view_tables = dict()
+    for view_name in direct:
+        tables: set[str] = set()
+        pending = [view_name]
+        while pending:
+            for name in direct.get(pending.pop(), ()):
+                if name not in tables:
+                    tables.add(name)
+                    pending.append(name)
+        view_tables[view_name] = tables
+    return view_tables
+
+
+def get_query_cache() -> QueryCache:
+    """Return the cache of read-only query results.
+
+    The cache is disabled unless ``config.query_cache_ttl_seconds`` is
+    positive, or if the views of the database cannot be listed, since
+    writes could then not be matched to the queries of views they change.
+    """
+    global _query_cache
+
+    if _query_cache is None:
+        ttl = config.query_cache_ttl_seconds
+        view_tables = dict()
+        if ttl > 0:
+            try:
+                view_tables = get_view_tables(get_engine())
+            except Exception:
+                logging.getLogger(__name__).exception("Unable to list view dependencies; not caching")
+                ttl = 0
+        _query_cache = QueryCache(config.query_cache_max_bytes, ttl, view_tables)
+
+    return _query_cache
+
+
 def get_logger(request: Request):
     endpoint_name = request.url.path
     return logging.getLogger(endpoint_name)
@@ -116,9 +211,22 @@ InstrumentName = Annotated[str, AfterValidator(validate_instrument_name)]
 
 
 def reset_dependencies():
-    global _database_url, _engine, _SessionLocal, _instrument_tables
+    global _database_url, _engine, _SessionLocal, _async_engine, _AsyncSessionLocal
+    global _instrument_tables, _query_cache
     _database_url = None
     _engine = None
     _SessionLocal = None
+    if _async_engine is not None:
+        # Close the pooled connections rather than leaving them to the
+        # garbage collector.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(_async_engine.dispose())
+        else:
+            loop.create_task(_async_engine.dispose())
+    _async_engine = None
+    _AsyncSessionLocal = None
     _instrument_tables = dict()
+    _query_cache = None
     get_instrument_list.cache_clear()
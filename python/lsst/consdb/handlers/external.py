@@ -19,16 +19,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence
 
 import astropy
 import sqlalchemy
 import sqlalchemy.dialects.postgresql
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from sqlalchemy.orm import Session
 
+from .. import columnar
 from ..cdb_schema import (
     AllowedFlexType,
     AllowedFlexTypeEnum,
@@ -39,7 +44,16 @@ from ..cdb_schema import (
 )
 from ..config import config
 from ..consistency_queries import CONSISTENCY_QUERIES
-from ..dependencies import InstrumentName, get_db, get_instrument_list, get_instrument_table, get_logger
+from ..dependencies import (
+    InstrumentName,
+    get_async_db,
+    get_async_engine,
+    get_db,
+    get_instrument_list,
+    get_instrument_table,
+    get_logger,
+    get_query_cache,
+)
 from ..exceptions import BadValueException
 from ..models import (
     AddKeyRequestModel,
@@ -54,11 +68,15 @@ from ..models import (
     QueryResponseModel,
     TableConsistencyModel,
 )
+from ..query_cache import QueryCache, is_read_only, normalize_sql, referenced_tables
 from .consistency_page import TABLE_CONSISTENCY_HTML
 
 external_router = APIRouter()
 """FastAPI router for all external handlers."""
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+"""Media type of streamed query results."""
+
 
 @external_router.get(
     "/",
@@ -133,13 +151,14 @@ def table_consistency(
     summary="Add a flexible metadata key",
     description="Add a flexible metadata key for the specified instrument and obs_type.",
 )
-def add_flexible_metadata_key(
+async def add_flexible_metadata_key(
     instrument: InstrumentName,
     obs_type: ObsTypeEnum,
     data: AddKeyRequestModel,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> AddKeyResponseModel:
     """Add a key to a flexible metadata table."""
 
@@ -151,8 +170,9 @@ def add_flexible_metadata_key(
         unit=data.unit,
         ucd=data.ucd,
     )
-    db.execute(insert_stmt)
-    db.commit()
+    await db.execute(insert_stmt)
+    await db.commit()
+    query_cache.invalidate(f"{schema_table.schema}.{schema_table.name}")
     # Update cached copy without re-querying database.
     instrument_table.flexible_metadata_schemas[obs_type.lower()][data.key] = [
         data.dtype.value,
@@ -222,15 +242,16 @@ def get_flexible_metadata(
 
 
 @external_router.post("/flex/{instrument}/{obs_type}/obs/{obs_id}")
-def insert_flexible_metadata(
+async def insert_flexible_metadata(
     instrument: InstrumentName,
     obs_type: ObsTypeEnum,
     obs_id: ObservationIdType,
     data: InsertDataModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if exists"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertFlexDataResponse:
     """Insert or update key/value pairs in a flexible metadata table."""
     table = instrument_table.get_flexible_metadata_table(obs_type)
@@ -238,7 +259,7 @@ def insert_flexible_metadata(
 
     value_dict = data.values
     if any(key not in schema for key in value_dict):
-        instrument_table.refresh_flexible_metadata_schema(obs_type)
+        await run_in_threadpool(instrument_table.refresh_flexible_metadata_schema, obs_type)
         schema = instrument_table.flexible_metadata_schemas[obs_type]
     for key, value in value_dict.items():
         if key not in schema:
@@ -253,11 +274,13 @@ def insert_flexible_metadata(
     # so no need to check whether this is the case or to branch accordingly.
 
     if obs_type == "exposure":
-        day_obs, seq_num = instrument_table.get_day_obs_and_seq_num(obs_id)
+        day_obs, seq_num = await run_in_threadpool(instrument_table.get_day_obs_and_seq_num, obs_id)
         primary_key_columns = ["day_obs", "seq_num", "key"]
         primary_key_values = {"day_obs": day_obs, "seq_num": seq_num}
     elif obs_type == "ccdexposure":
-        day_obs, seq_num, detector = instrument_table.get_day_obs_and_seq_num_and_detector(obs_id)
+        day_obs, seq_num, detector = await run_in_threadpool(
+            instrument_table.get_day_obs_and_seq_num_and_detector, obs_id
+        )
         primary_key_columns = ["day_obs", "seq_num", "detector", "key"]
         primary_key_values = {"day_obs": day_obs, "seq_num": seq_num, "detector": detector}
     else:
@@ -275,9 +298,10 @@ def insert_flexible_metadata(
             stmt = stmt.on_conflict_do_update(index_elements=primary_key_columns, set_={"value": value_str})
 
         logger.debug(str(stmt))
-        _ = db.execute(stmt)
+        _ = await db.execute(stmt)
 
-        db.commit()
+        await db.commit()
+    query_cache.invalidate(instrument_table.compute_flexible_metadata_table_name(obs_type))
     return InsertFlexDataResponse(
         message="Flexible metadata inserted",
         instrument=instrument,
@@ -363,7 +387,7 @@ def validate_columns(
 # ---------------------------------------------------------------------------
 
 
-def _insert_by_day_obs_seq_num(
+async def _insert_by_day_obs_seq_num(
     instrument: InstrumentName,
     table: str,
     day_obs: int,
@@ -371,9 +395,10 @@ def _insert_by_day_obs_seq_num(
     detector: int | None,
     data: InsertDataModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if data already exist"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertDataResponse:
     """Shared implementation for the two ``by_seq_num`` endpoints.
 
@@ -429,8 +454,9 @@ def _insert_by_day_obs_seq_num(
         update_dict = {k: v for k, v in valdict_insert.items() if k not in conflict_columns}
         stmt = stmt.on_conflict_do_update(index_elements=conflict_columns, set_=update_dict)
     logger.debug(str(stmt))
-    _ = db.execute(stmt)
-    db.commit()
+    _ = await db.execute(stmt)
+    await db.commit()
+    query_cache.invalidate(table_name)
     obs_id = (day_obs, seq_num, detector) if detector is not None else (day_obs, seq_num)
     return InsertDataResponse(
         message="Data inserted",
@@ -444,18 +470,19 @@ def _insert_by_day_obs_seq_num(
     "/insert/{instrument}/{table}/by_seq_num/{day_obs}/{seq_num}",
     summary="Insert data row indexed by day_obs and seq_num",
 )
-def insert_by_day_obs_seq_num(
+async def insert_by_day_obs_seq_num(
     instrument: InstrumentName,
     table: str,
     day_obs: int,
     seq_num: int,
     data: InsertDataModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if data already exist"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertDataResponse:
-    return _insert_by_day_obs_seq_num(
+    return await _insert_by_day_obs_seq_num(
         instrument,
         table,
         day_obs,
@@ -466,6 +493,7 @@ def insert_by_day_obs_seq_num(
         db,
         logger,
         instrument_table,
+        query_cache,
     )
 
 
@@ -473,7 +501,7 @@ def insert_by_day_obs_seq_num(
     "/insert/{instrument}/{table}/by_seq_num/{day_obs}/{seq_num}/{detector}",
     summary="Insert data row indexed by day_obs, seq_num, and detector",
 )
-def insert_by_day_obs_seq_num_detector(
+async def insert_by_day_obs_seq_num_detector(
     instrument: InstrumentName,
     table: str,
     day_obs: int,
@@ -481,11 +509,12 @@ def insert_by_day_obs_seq_num_detector(
     detector: int = Path(title="Detector number (if applicable)"),
     data: InsertDataModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if data already exist"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertDataResponse:
-    return _insert_by_day_obs_seq_num(
+    return await _insert_by_day_obs_seq_num(
         instrument,
         table,
         day_obs,
@@ -496,6 +525,7 @@ def insert_by_day_obs_seq_num_detector(
         db,
         logger,
         instrument_table,
+        query_cache,
     )
 
 
@@ -503,15 +533,16 @@ def insert_by_day_obs_seq_num_detector(
     "/insert/{instrument}/{table}/obs/{obs_id}",
     summary="Insert data row",
 )
-def insert(
+async def insert(
     instrument: InstrumentName,
     table: str,
     obs_id: ObservationIdType,
     data: InsertDataModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if data already exist"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertDataResponse:
     """Insert or update column/value pairs in a ConsDB table.
 
@@ -547,7 +578,9 @@ def insert(
     # Look up any composite-key columns the body omitted; merge so body
     # values win on collisions. Unlike ``by_seq_num``, this endpoint
     # doesn't carry composite-key columns in the URL.
-    valdict = instrument_table.composite_key_for(table_name, obs_id, valdict) | valdict
+    valdict = (
+        await run_in_threadpool(instrument_table.composite_key_for, table_name, obs_id, valdict)
+    ) | valdict
 
     validate_columns(table_obj, valdict, u == 0)
 
@@ -563,8 +596,9 @@ def insert(
             primary_key_columns = [obs_id_colname]
         stmt = stmt.on_conflict_do_update(index_elements=primary_key_columns, set_=valdict)
     logger.debug(str(stmt))
-    _ = db.execute(stmt)
-    db.commit()
+    _ = await db.execute(stmt)
+    await db.commit()
+    query_cache.invalidate(table_name)
     return InsertDataResponse(
         message="Data inserted",
         instrument=instrument,
@@ -577,14 +611,15 @@ def insert(
     "/insert/{instrument}/{table}",
     summary="Insert multiple data rows",
 )
-def insert_multiple(
+async def insert_multiple(
     instrument: InstrumentName,
     table: str,
     data: InsertMultipleRequestModel = Body(title="Data to insert or update"),
     u: int | None = Query(0, title="Update if data already exist"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> InsertMultipleResponseModel:
     """Insert or update multiple observations in a ConsDB table.
 
@@ -630,7 +665,9 @@ def insert_multiple(
     for obs_id, valdict in data.obs_dict.items():
         valdict[obs_id_colname] = obs_id
 
-        valdict = instrument_table.composite_key_for(table_name, obs_id, valdict) | valdict
+        valdict = (
+            await run_in_threadpool(instrument_table.composite_key_for, table_name, obs_id, valdict)
+        ) | valdict
 
         # Convert timestamps in the input from string to datetime
         for column in timestamp_columns:
@@ -656,12 +693,13 @@ def insert_multiple(
                     primary_key_columns = [obs_id_colname]
                 stmt = stmt.on_conflict_do_update(index_elements=primary_key_columns, set_=update_dict)
 
-            db.execute(stmt)
-        db.commit()
+            await db.execute(stmt)
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         logger.exception("Failed to insert or update data")
         raise
+    query_cache.invalidate(table_name)
 
     return InsertMultipleResponseModel(
         message="Data inserted",
@@ -684,6 +722,7 @@ def get_all_metadata(
     db: Session = Depends(get_db),
     logger: logging.Logger = Depends(get_logger),
     instrument_table: InstrumentTable = Depends(get_instrument_table),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> dict[str, Any]:
     """Get all information about an observation.
 
@@ -710,6 +749,11 @@ def get_all_metadata(
 
     obs_type = obs_type.lower()
     view_name = instrument_table.compute_wide_view_name(obs_type)
+    cache_key = ("obs", instrument, obs_type, obs_id, flex)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
     view = instrument_table.schemas[view_name]
     obs_id_column = instrument_table.obs_id_column[view_name]
     result = dict()
@@ -719,19 +763,196 @@ def get_all_metadata(
         raise HTTPException(status_code=404, detail=f"Observation {obs_id} not found.")
 
     result = dict(row)
+    tables = [view_name]
 
     if flex:
         flex_result = get_flexible_metadata(instrument, obs_type, obs_id)
         result.update(flex_result)
+        tables.append(instrument_table.compute_flexible_metadata_table_name(obs_type))
+    query_cache.put(cache_key, dict(result), tables)
     return result
 
 
-@external_router.post("/query")
-def query(
+def _execute_query(connection: sqlalchemy.Connection, query: str) -> sqlalchemy.CursorResult:
+    """Execute a user query with the configured statement timeout.
+
+    Must be called inside a transaction, which bounds the timeout and the
+    server-side cursor.  Read-only queries, as recognized by
+    `is_read_only`, are fetched from a named server-side cursor
+    ``config.query_itersize`` rows at a time, so that the driver never
+    buffers the whole result.  Others, such as data-modifying CTEs or
+    ``SELECT INTO``, which PostgreSQL does not accept in ``DECLARE CURSOR``,
+    use a client-side cursor.
+    """
+    # SET takes no bind parameters with server-side binding, as in
+    # psycopg 3, so the (integer) timeout is written into the statement.
+    statement_timeout_ms = int(config.statement_timeout_seconds * 1000)
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {statement_timeout_ms}")
+    execution_options = dict()
+    if is_read_only(query):
+        execution_options["yield_per"] = config.query_itersize
+    return connection.exec_driver_sql(query, execution_options=execution_options)
+
+
+def _json_default(value: Any) -> Any:
+    """Convert values the `json` module does not know, such as datetimes,
+    the same way as FastAPI responses do."""
+    return jsonable_encoder(value)
+
+
+def _fetch_batches(result: sqlalchemy.CursorResult) -> Iterator[Sequence[sqlalchemy.Row]]:
+    """Yield the rows of a result ``config.fetch_size`` at a time, up to
+    ``config.max_rows`` rows in all."""
+    rows_fetched = 0
+    while rows_fetched < config.max_rows:
+        batch = result.fetchmany(min(config.fetch_size, config.max_rows - rows_fetched))
+        if not batch:
+            break
+        yield batch
+        rows_fetched += len(batch)
+
+
+def _iter_ndjson(result: sqlalchemy.CursorResult, commit: int | None) -> Iterator[bytes]:
+    """Encode a query result as newline-delimited JSON.
+
+    The first line is an object with a ``columns`` key; each following
+    line is one row, as a list.
+    """
+    if not result.returns_rows:
+        yield (json.dumps({"columns": ["commit"]}) + "\n" + json.dumps([commit]) + "\n").encode()
+        return
+    yield (json.dumps({"columns": list(result.keys())}) + "\n").encode()
+    for batch in _fetch_batches(result):
+        yield "".join(json.dumps(list(r), default=_json_default) + "\n" for r in batch).encode()
+
+
+def _columnar_encoder(
+    encode: Callable[..., Iterator[bytes]],
+) -> Callable[[sqlalchemy.CursorResult, int | None], Iterator[bytes]]:
+    """Adapt an encoder from `columnar` to a query result."""
+
+    def encode_result(result: sqlalchemy.CursorResult, commit: int | None) -> Iterator[bytes]:
+        if not result.returns_rows:
+            # bigint, like the commit flag in the JSON response.
+            return encode(["commit"], [20], [[(commit,)]])
+        type_codes = [column[1] for column in result.cursor.description]
+        return encode(list(result.keys()), type_codes, _fetch_batches(result))
+
+    return encode_result
+
+
+# Encoders of streamed query results, by media type.
+STREAM_ENCODERS: dict[str, Callable[[sqlalchemy.CursorResult, int | None], Iterator[bytes]]] = {
+    NDJSON_MEDIA_TYPE: _iter_ndjson,
+    columnar.ARROW_STREAM_MEDIA_TYPE: _columnar_encoder(columnar.iter_arrow_stream),
+    columnar.PARQUET_MEDIA_TYPE: _columnar_encoder(columnar.iter_parquet),
+}
+
+
+def _next_chunk(connection: sqlalchemy.Connection, chunks: Iterator[bytes]) -> bytes | None:
+    """Return the next chunk of an encoded result, or None at the end.
+
+    Run through `AsyncConnection.run_sync`, so that the rows the encoder
+    fetches are awaited on the event loop.
+    """
+    return next(chunks, None)
+
+
+async def _stream_query(
+    connection: AsyncConnection,
+    result: sqlalchemy.CursorResult,
+    commit: int | None,
+    media_type: str,
+    logger: logging.Logger,
+    query_cache: QueryCache | None = None,
+) -> AsyncIterator[bytes]:
+    """Yield a query result encoded as ``media_type``.
+
+    Rows are fetched ``config.fetch_size`` at a time, and the connection
+    is released once the result is exhausted.  If ``query_cache`` is
+    given, it is cleared once the transaction is committed.
+    """
+    try:
+        chunks = STREAM_ENCODERS[media_type](result, commit)
+        while (chunk := await connection.run_sync(_next_chunk, chunks)) is not None:
+            yield chunk
+
+        if commit != 1:
+            await connection.rollback()
+        else:
+            await connection.commit()
+            if query_cache is not None:
+                query_cache.clear()
+    except Exception:
+        logger.exception("Failed while streaming query results")
+        raise
+    finally:
+        await connection.close()
+
+
+def _negotiate_stream(request: Request, stream: bool) -> str | None:
+    """Return the media type in which to stream a query result, or None
+    for a plain JSON response.
+
+    Raises
+    ------
+    HTTPException
+        Raised if a columnar format is requested but ``pyarrow`` is not
+        installed.
+    """
+    accept = request.headers.get("accept", "")
+    for media_type in (columnar.ARROW_STREAM_MEDIA_TYPE, columnar.PARQUET_MEDIA_TYPE):
+        if media_type in accept:
+            if not columnar.pyarrow_available():
+                raise HTTPException(status_code=406, detail=f"{media_type} output is not available.")
+            return media_type
+    if stream or NDJSON_MEDIA_TYPE in accept:
+        return NDJSON_MEDIA_TYPE
+    return None
+
+
+def _query_rows(db: Session, query: str, commit: int | None) -> tuple[list[str], list[list[Any]]]:
+    """Run a user query and return its columns and rows.
+
+    Run through `AsyncSession.run_sync`.
+    """
+    columns = []
+    rows = []
+
+    with db.begin() as transaction:
+        result = None
+        try:
+            connection = db.connection()
+            result = _execute_query(connection, query)
+            if result.returns_rows:
+                columns = list(result.keys())
+                for batch in _fetch_batches(result):
+                    rows.extend([list(r) for r in batch])
+            else:
+                columns = ["commit"]
+                rows = [[commit]]
+
+            if commit != 1:
+                transaction.rollback()
+        finally:
+            if result is not None:
+                result.close()
+
+    return columns, rows
+
+
+@external_router.post(
+    "/query",
+    responses={200: {"content": {media_type: {} for media_type in STREAM_ENCODERS}}},
+)
+async def query(
+    request: Request,
     data: QueryRequestModel = Body(title="SQL query string"),
     commit: int | None = Query(1, title="Apply commit to the transaction."),
-    db: Session = Depends(get_db),
+    stream: bool = Query(False, title="Stream the result as newline-delimited JSON."),
+    db: AsyncSession = Depends(get_async_db),
     logger: logging.Logger = Depends(get_logger),
+    query_cache: QueryCache = Depends(get_query_cache),
 ) -> QueryResponseModel:
     """Query the ConsDB database.
 
@@ -739,6 +960,15 @@ def query(
     ----------
     query: `str`
         SQL query string (JSON POST data).
+    stream: `bool`
+        Stream the result as newline-delimited JSON if set to "1" (URL
+        query parameter).  Also selected by an ``Accept`` header of
+        ``application/x-ndjson``.
+
+    An ``Accept`` header of ``application/vnd.apache.arrow.stream`` or
+    ``application/vnd.apache.parquet`` instead streams the result in the
+    Arrow IPC streaming format or as a Parquet file, with column types
+    taken from the database.
 
     Returns
     -------
@@ -753,42 +983,67 @@ def query(
     Results are capped at ``config.max_rows`` rows. This is 1 million rows
     by default. If the query returns more rows than this limit, the remaining
     rows are discarded.
+
+    A streamed result is sent as newline-delimited JSON: a first line with
+    the ``columns`` object, then one line per row.  In the Arrow and
+    Parquet formats, each batch of rows is a record batch or row group.
+    Rows are sent as they arrive, ``config.fetch_size`` at a time, so the
+    whole result is never held in memory.
+
+    ``SELECT``, ``VALUES``, ``TABLE`` and ``WITH`` queries are read from a
+    server-side cursor, ``config.query_itersize`` rows per round trip.
+
+    If ``config.query_cache_ttl_seconds`` is set, JSON results of queries
+    recognized as read-only are cached, keyed by the normalized SQL, until
+    they expire or a table they read is written through this service.
+
+    Queries run on the asynchronous database engine, so a slow query holds
+    a pooled connection but no worker thread.
     """
 
     logger.info("pqserver query endpoint:\n%r", data.query)
 
-    columns = []
-    rows = []
+    # Only statements recognized as read-only are cached; any other
+    # statement, once committed, may have written anything.
+    read_only = is_read_only(data.query)
 
-    with db.begin() as transaction:
-        result = None
+    media_type = _negotiate_stream(request, stream)
+    if media_type is not None:
+        # The response outlives this handler and its session, so it gets a
+        # connection of its own.  Errors in the query itself are raised
+        # here, before any of the response has been sent.
+        connection = await get_async_engine().connect()
         try:
-            connection = db.connection()
-            statement_timeout_ms = config.statement_timeout_seconds * 1000
-            connection.exec_driver_sql(
-                "SET LOCAL statement_timeout = %s",
-                (statement_timeout_ms,),
-            )
-            result = connection.exec_driver_sql(data.query)
-            if result.returns_rows:
-                columns = list(result.keys())
-                rows_fetched = 0
-
-                while rows_fetched < config.max_rows:
-                    batch = result.fetchmany(min(config.fetch_size, config.max_rows - rows_fetched))
-                    if not batch:
-                        break
-                    rows.extend([list(r) for r in batch])
-                    rows_fetched += len(batch)
-            else:
-                columns = ["commit"]
-                rows = [[commit]]
-
-            if commit != 1:
-                transaction.rollback()
-        finally:
-            if result is not None:
-                result.close()
+            await connection.begin()
+            result = await connection.run_sync(_execute_query, data.query)
+        except Exception:
+            await connection.close()
+            raise
+        return StreamingResponse(
+            _stream_query(
+                connection,
+                result,
+                commit,
+                media_type,
+                logger,
+                None if read_only else query_cache,
+            ),
+            media_type=media_type,
+        )
+
+    cache_key = ("query", normalize_sql(data.query))
+    if read_only:
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            return QueryResponseModel(columns=cached[0], data=cached[1])
+
+    columns, rows = await db.run_sync(_query_rows, data.query, commit)
+
+    if read_only:
+        # Sizing a large result takes a while; keep it off the event loop.
+        await run_in_threadpool(query_cache.put, cache_key, (columns, rows), referenced_tables(data.query))
+    elif commit == 1:
+        query_cache.clear()
 
     return QueryResponseModel(
         columns=columns,
@@ -796,6 +1051,15 @@ def query(
     )
 
 
+@external_router.get("/query/cache_stats")
+def query_cache_stats(
+    query_cache: QueryCache = Depends(get_query_cache),
+) -> dict[str, int | float | bool]:
+    """Report the use of the cache of read-only query results."""
+
+    return query_cache.stats()
+
+
 @external_router.get("/schema")
 def list_instruments(
     instrument_list: list[str] = Depends(get_instrument_list),
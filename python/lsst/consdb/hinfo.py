@@ -1,31 +1,43 @@
+import argparse
 import asyncio
+import concurrent.futures
+import hashlib
+import io
+import json
+import multiprocessing
 import os
 import random
 import re
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, Callable, Iterable, Union
+import threading
+import time
+from collections import ChainMap
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Iterator, Union
 
 import aiokafka  # type: ignore
 import astropy.time  # type: ignore
 import astropy.units as u  # type: ignore
+import fastavro  # type: ignore
 import httpx  # type: ignore
 import kafkit.registry
 import kafkit.registry.httpx  # type: ignore
 import lsst.geom  # type: ignore
 import lsst.obs.lsst  # type: ignore
 import numpy as np  # type: ignore
+import yaml
 from astro_metadata_translator import ObservationInfo
 from astropy.coordinates import AltAz, CartesianRepresentation, EarthLocation, SkyCoord  # type: ignore
+from lsst.afw.cameraGeom import FIELD_ANGLE, PIXELS, Camera  # type: ignore
 from lsst.obs.lsst.rawFormatter import LsstCamRawFormatter  # type: ignore
 from lsst.resources import ResourcePath
-from sqlalchemy import MetaData, Table
+from sqlalchemy import Column, Connection, MetaData, Table, literal_column, or_, select
 from sqlalchemy.dialects.postgresql import insert
 
-# Set up C-based YAML loader falling back to Python
-from yaml import load
-
-from .utils import setup_logging, setup_postgres
+from .metrics import REGISTRY, Counter, Histogram, start_http_server
+from .retry import RetryStore
+from .utils import setup_async_postgres, setup_logging, setup_postgres, warm_up_astropy
 
+# Set up C-based YAML loader falling back to Python
 try:
     from yaml import CLoader as Loader
 except ImportError:
@@ -33,6 +45,7 @@ except ImportError:
 
 if TYPE_CHECKING:
     import lsst.afw.cameraGeom  # type: ignore
+    from sqlalchemy.ext.asyncio import AsyncEngine
 
 
 # If set, only these columns will be updated.
@@ -43,13 +56,95 @@ ccd_columns_to_update: list[str] | None = None
 # Header Processing Functions #
 ###############################
 
-VerticesType = dict[
-    str, tuple[lsst.geom.SpherePoint, lsst.geom.SpherePoint, lsst.geom.SpherePoint, lsst.geom.SpherePoint]
-]
+# Each CCD maps to a (4, 2) array holding the (longitude, latitude), in
+# degrees, of its (0, 0), (0, 1), (1, 0), (1, 1) corners, in that order.
+VerticesType = dict[str, np.ndarray]
 
 RegionFormatter = Callable[[VerticesType, Iterable[tuple[str, int]]], str]
 
 
+class FocalPlaneVertices:
+    """Sky positions of the CCD corners of a camera, for any pointing.
+
+    The pixel-to-field-angle transform of every CCD is evaluated once, at
+    construction, for the four corners of the CCD.  Projecting those corners
+    onto the sky for a given boresight and rotator angle is then a single
+    vectorized rotation and gnomonic deprojection.  This reproduces
+    ``LsstCamRawFormatter.makeRawSkyWcsFromBoresight`` (field angle, then
+    the orientation/flip CD matrix, then a TAN projection at the boresight)
+    without building a `SkyWcs` per CCD; see `get_vertices_from_wcs` for
+    the reference implementation.
+
+    Parameters
+    ----------
+    camera : `lsst.afw.cameraGeom.Camera`
+        The camera whose CCD corners will be projected.
+    """
+
+    def __init__(self, camera: lsst.afw.cameraGeom.Camera):
+        self.ccdnames: list[str] = []
+        field_angles = []
+        for ccd in camera:
+            bbox = ccd.getBBox()
+            pixels_to_field_angle = ccd.getTransform(
+                ccd.makeCameraSys(PIXELS), ccd.makeCameraSys(FIELD_ANGLE)
+            )
+            corners = pixels_to_field_angle.applyForward(
+                [
+                    lsst.geom.Point2D(bbox.getMinX(), bbox.getMinY()),
+                    lsst.geom.Point2D(bbox.getMinX(), bbox.getMinY() + bbox.getHeight()),
+                    lsst.geom.Point2D(bbox.getMinX() + bbox.getWidth(), bbox.getMinY()),
+                    lsst.geom.Point2D(bbox.getMinX() + bbox.getWidth(), bbox.getMinY() + bbox.getHeight()),
+                ]
+            )
+            self.ccdnames.append(ccd.getName())
+            field_angles.append([(corner.getX(), corner.getY()) for corner in corners])
+
+        # Field angles in radians, with shape (number of CCDs, 4, 2).
+        self.field_angles = np.array(field_angles, dtype=float)
+        self.xmult = 1.0 if getattr(LsstCamRawFormatter, "wcsFlipX", False) else -1.0
+
+    def compute(self, ra: float, dec: float, rotpa: float) -> VerticesType:
+        """Return the sky positions of all CCD corners.
+
+        Parameters
+        ----------
+        ra : `float`
+            Right ascension of the boresight, in degrees.
+        dec : `float`
+            Declination of the boresight, in degrees.
+        rotpa : `float`
+            Rotator position angle, in degrees.
+
+        Returns
+        -------
+        vertices : `VerticesType`
+            Dictionary mapping CCD name to its corner positions.
+        """
+        # Rotate (and possibly flip) field angles to intermediate world
+        # coordinates, the same as makeCdMatrix(1 deg, rotpa, flipX).
+        theta = np.radians(rotpa)
+        cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+        fa_x = self.field_angles[..., 0]
+        fa_y = self.field_angles[..., 1]
+        xi = self.xmult * cos_theta * fa_x + sin_theta * fa_y
+        eta = -self.xmult * sin_theta * fa_x + cos_theta * fa_y
+
+        # Gnomonic (TAN) deprojection about the boresight.
+        ra0 = np.radians(ra)
+        dec0 = np.radians(dec)
+        denom = np.cos(dec0) - eta * np.sin(dec0)
+        lon = np.degrees(ra0 + np.arctan2(xi, denom)) % 360.0
+        lat = np.degrees(np.arctan2(np.sin(dec0) + eta * np.cos(dec0), np.hypot(xi, denom)))
+
+        lonlat = np.stack((lon, lat), axis=-1)
+        return dict(zip(self.ccdnames, lonlat))
+
+
+# Cache of FocalPlaneVertices, keyed by camera name.
+focal_plane_vertices: dict[str, FocalPlaneVertices] = dict()
+
+
 def get_vertices(
     camera: lsst.afw.cameraGeom.Camera,
     ra: float,
@@ -58,9 +153,26 @@ def get_vertices(
 ) -> VerticesType:
     """Return a dictionary with the geometry of all CCDs in the camera.
 
-    The dictionary maps CCD name (as a string) to a tuple containing
-    four SpherePoint objects. They correspond to the (0, 0), (0, 1),
-    (1, 0), (1, 1) corners of the CCD, in that order.
+    The dictionary maps CCD name (as a string) to a (4, 2) array of the
+    longitude and latitude, in degrees, of the (0, 0), (0, 1), (1, 0),
+    (1, 1) corners of the CCD, in that order.
+    """
+    camera_name = camera.getName()
+    if camera_name not in focal_plane_vertices:
+        focal_plane_vertices[camera_name] = FocalPlaneVertices(camera)
+    return focal_plane_vertices[camera_name].compute(ra, dec, rotpa)
+
+
+def get_vertices_from_wcs(
+    camera: lsst.afw.cameraGeom.Camera,
+    ra: float,
+    dec: float,
+    rotpa: float,
+) -> VerticesType:
+    """Return the same as `get_vertices`, building one SkyWcs per CCD.
+
+    This is much slower than `get_vertices` and is kept as the reference
+    implementation against which `FocalPlaneVertices` is checked.
     """
     skywcs_all = {
         ccd.getName(): (
@@ -73,15 +185,17 @@ def get_vertices(
         )
         for ccd in camera
     }
-    vertices = {
-        ccdname: (
+    vertices = dict()
+    for ccdname, (skywcs, bbox) in skywcs_all.items():
+        points = (
             skywcs.pixelToSky(bbox.getMinX(), bbox.getMinY()),
             skywcs.pixelToSky(bbox.getMinX(), bbox.getMinY() + bbox.getHeight()),
             skywcs.pixelToSky(bbox.getMinX() + bbox.getWidth(), bbox.getMinY()),
             skywcs.pixelToSky(bbox.getMinX() + bbox.getWidth(), bbox.getMinY() + bbox.getHeight()),
         )
-        for ccdname, (skywcs, bbox) in skywcs_all.items()
-    }
+        vertices[ccdname] = np.array(
+            [(point.getLongitude().asDegrees(), point.getLatitude().asDegrees()) for point in points]
+        )
     return vertices
 
 
@@ -95,8 +209,8 @@ def region_ivoa(
 ) -> str:
     region = "Polygon ICRS"
     for ccdname, corner_index in corners:
-        point = vertices[ccdname][corner_index]
-        region += f" {point.getLongitude().asDegrees():.6f} {point.getLatitude().asDegrees():.6f}"
+        lon, lat = vertices[ccdname][corner_index]
+        region += f" {lon:.6f} {lat:.6f}"
     return region
 
 
@@ -124,15 +238,10 @@ def region_spoly(
         `{(lon_rad,lat_rad),(lon_rad,lat_rad),...}`
         with longitude/latitude in radians.
     """
-    # Build the WCS at the given boresight/rotator for each detector and
-    # sample the requested pixel.
     verts_rad: list[tuple[float, float]] = []
 
     for ccdname, corner_index in corners:
-        sky_pt = vertices[ccdname][corner_index]
-        lon = sky_pt.getLongitude().asRadians()
-        lat = sky_pt.getLatitude().asRadians()
-
+        lon, lat = np.radians(vertices[ccdname][corner_index])
         verts_rad.append((lon, lat))
 
     if len(verts_rad) < 3:
@@ -190,26 +299,26 @@ def ccd_region_spoly(
 def fp_region(
     vertices: VerticesType,
     imgtype: str,
+    instrument_name: str,
     region_formatter: RegionFormatter,
 ) -> str | None:
-    # global instrument
     if imgtype != "OBJECT":
         return None
-    if instrument == "LATISS":
+    if instrument_name == "latiss":
         corners = [
             ("RXX_S00", 0),
             ("RXX_S00", 2),
             ("RXX_S00", 3),
             ("RXX_S00", 1),
         ]
-    elif instrument == "LSSTComCam" or instrument == "LSSTComCamSim":
+    elif instrument_name == "lsstcomcam" or instrument_name == "lsstcomcamsim":
         corners = [
             ("R22_S00", 0),
             ("R22_S02", 2),
             ("R22_S20", 1),
             ("R22_S22", 3),
         ]
-    elif instrument == "LSSTCam":
+    elif instrument_name == "lsstcam":
         corners = [
             ("R01_S00", 0),
             ("R03_S02", 2),
@@ -248,22 +357,26 @@ def fp_region(
 def fp_region_ivoa(
     vertices: VerticesType,
     imgtype: str,
+    instrument_name: str,
 ) -> str | None:
-    return fp_region(vertices, imgtype, region_ivoa)
+    return fp_region(vertices, imgtype, instrument_name, region_ivoa)
 
 
 def fp_region_spoly(
     vertices: VerticesType,
     imgtype: str,
+    instrument_name: str,
 ) -> str | None:
-    return fp_region(vertices, imgtype, region_spoly)
+    return fp_region(vertices, imgtype, instrument_name, region_spoly)
 
 
 #################################
 # Header Mapping Configurations #
 #################################
 
-ColumnMapping = Union[str, tuple[Callable[..., Any], *tuple[str, ...]]]
+# A column is either a keyword, or a tuple of a function and the keywords or
+# nested tuples whose values are its arguments.
+ColumnMapping = Union[str, tuple[Callable[..., Any], *tuple[Any, ...]]]
 
 # Non-instrument-specific mapping to column name from Header Service keyword
 KW_MAPPING: dict[str, ColumnMapping] = {
@@ -275,8 +388,8 @@ KW_MAPPING: dict[str, ColumnMapping] = {
     "vignette": "VIGNETTE",
     "vignette_min": "VIGN_MIN",
     "scheduler_note": "OBSANNOT",
-    "s_region": (fp_region_ivoa, "vertices", "IMGTYPE"),
-    "pgs_region": (fp_region_spoly, "vertices", "IMGTYPE"),
+    "s_region": (fp_region_ivoa, "vertices", "IMGTYPE", "instrument_name"),
+    "pgs_region": (fp_region_spoly, "vertices", "IMGTYPE", "instrument_name"),
 }
 
 # Instrument-specific mapping to column name from Header Service keyword
@@ -370,7 +483,6 @@ def altaz_midpoint_from_radec(
         Altitude–azimuth coordinates at the midpoint, using the global
         *cerro_pachon* (Cerro Pachón).
     """
-    # global cerro_pachon
     altaz_frame = AltAz(obstime=time_midpoint(t1, t2), location=cerro_pachon)
     return tracking_radec.transform_to(altaz_frame)
 
@@ -430,6 +542,19 @@ def altaz_midpoint(
         return altaz_midpoint_from_altaz(altaz_begin, altaz_end)
 
 
+# Sub-expressions shared by several OI_MAPPING columns.  The compiled
+# ColumnPlan evaluates each of them once per exposure.
+ALTAZ_MIDPOINT: ColumnMapping = (
+    altaz_midpoint,
+    "ACCEPTS_NULL",
+    "tracking_radec",
+    "datetime_begin",
+    "datetime_end",
+    "altaz_begin",
+    "altaz_end",
+)
+DATETIME_MIDPOINT: ColumnMapping = (time_midpoint, "datetime_begin", "datetime_end")
+
 # Mapping to column name from ObservationInfo keyword
 OI_MAPPING: dict[str, ColumnMapping] = {
     "exposure_name": "observation_id",
@@ -444,40 +569,16 @@ OI_MAPPING: dict[str, ColumnMapping] = {
     "sky_rotation": "boresight_rotation_angle",
     "azimuth_start": (lambda altaz: altaz.az.deg, "altaz_begin"),
     "azimuth_end": (lambda altaz: altaz.az.deg, "altaz_end"),
-    "azimuth": (
-        lambda coord, t1, t2, altaz1, altaz2: altaz_midpoint(coord, t1, t2, altaz1, altaz2).az.deg,
-        "ACCEPTS_NULL",
-        "tracking_radec",
-        "datetime_begin",
-        "datetime_end",
-        "altaz_begin",
-        "altaz_end",
-    ),
+    "azimuth": (lambda altaz: altaz.az.deg, ALTAZ_MIDPOINT),
     "altitude_start": (lambda altaz: altaz.alt.deg, "altaz_begin"),
     "altitude_end": (lambda altaz: altaz.alt.deg, "altaz_end"),
-    "altitude": (
-        lambda coord, t1, t2, altaz1, altaz2: altaz_midpoint(coord, t1, t2, altaz1, altaz2).alt.deg,
-        "ACCEPTS_NULL",
-        "tracking_radec",
-        "datetime_begin",
-        "datetime_end",
-        "altaz_begin",
-        "altaz_end",
-    ),
+    "altitude": (lambda altaz: altaz.alt.deg, ALTAZ_MIDPOINT),
     "zenith_distance_start": (lambda altaz: altaz.zen.deg, "altaz_begin"),
     "zenith_distance_end": (lambda altaz: altaz.zen.deg, "altaz_end"),
-    "zenith_distance": (
-        lambda coord, t1, t2, altaz1, altaz2: altaz_midpoint(coord, t1, t2, altaz1, altaz2).zen.deg,
-        "ACCEPTS_NULL",
-        "tracking_radec",
-        "datetime_begin",
-        "datetime_end",
-        "altaz_begin",
-        "altaz_end",
-    ),
+    "zenith_distance": (lambda altaz: altaz.zen.deg, ALTAZ_MIDPOINT),
     "airmass": "boresight_airmass",
-    "exp_midpt": (lambda t1, t2: time_midpoint(t1, t2).tai.isot, "datetime_begin", "datetime_end"),
-    "exp_midpt_mjd": (lambda t1, t2: time_midpoint(t1, t2).tai.mjd, "datetime_begin", "datetime_end"),
+    "exp_midpt": (lambda t: t.tai.isot, DATETIME_MIDPOINT),
+    "exp_midpt_mjd": (lambda t: t.tai.mjd, DATETIME_MIDPOINT),
     "obs_start": (lambda t: t.tai.isot, "datetime_begin"),
     "obs_start_mjd": (lambda t: t.tai.mjd, "datetime_begin"),
     "obs_end": (lambda t: t.tai.isot, "datetime_end"),
@@ -506,109 +607,369 @@ TOPIC_MAPPING: dict[str, ColumnMapping] = {
 }
 
 
-########################
-# Processing Functions #
-########################
+def header_topic(instrument_name: str) -> str:
+    """Return the Kafka topic announcing an instrument's headers.
+
+    Parameters
+    ----------
+    instrument_name : `str`
+        Name of the instrument (e.g. ``LATISS``).
+    """
+    return f"lsst.sal.{TOPIC_MAPPING[instrument_name]}.logevent_largeFileObjectAvailable"
 
 
-def process_column(column_def: ColumnMapping, info: dict) -> Any:
-    """Generate a column value from one or more keyword values in a dict.
+def instrument_for_url(url: str, instrument_names: Iterable[str]) -> str:
+    """Return which instrument a header resource belongs to.
 
-    The dict may contain FITS headers or ObservationInfo.
+    Header resources are stored under a directory named after the Header
+    Service that wrote them.  Resources elsewhere, such as local files,
+    can only be attributed when there is a single instrument.
 
     Parameters
     ----------
-    column_def : `str`
-        Definition of the column.  Either a string specifying the info keyword
-        to use as the column value, or a tuple containing a function to apply
-        to the values of one or more info keywords or function application
-        tuples.
-    info : `dict`
-        A dictionary containing keyword/value pairs.
+    url : `str`
+        URL of the header resource.
+    instrument_names : `~collections.abc.Iterable` [ `str` ]
+        Names of the candidate instruments.
 
     Returns
     -------
-    column_value : `Any`
-        The value to use for the column.
-        None if any input value is missing.
+    instrument_name : `str`
+        Name of the instrument.
+
+    Raises
+    ------
+    ValueError
+        Raised if the instrument cannot be determined.
     """
-    if isinstance(column_def, str):
-        if column_def in info:
-            return info[column_def]
-    elif isinstance(column_def, tuple):
-        fn = column_def[0]
-        arg_values = [process_column(a, info) for a in column_def[1:]]
-        if all(v is not None for v in arg_values):
-            return fn(*arg_values)
+    instrument_names = list(instrument_names)
+    for name in instrument_names:
+        if f"/{TOPIC_MAPPING[name]}/" in url:
+            return name
+    if len(instrument_names) == 1:
+        return instrument_names[0]
+    raise ValueError(f"Unable to determine the instrument of {url} among {instrument_names}")
 
 
-def process_oi_column(column_def: ColumnMapping, obs_info: ObservationInfo) -> Any:
-    """
-    Process a column definition from OI_MAPPING and return the processed value.
+########################
+# Processing Functions #
+########################
+
+
+class ColumnFailure:
+    """Marks a column whose evaluation raised an exception."""
+
+    def __init__(self, exception: Exception):
+        self.exception = exception
+
+
+class ColumnPlan:
+    """A column mapping compiled into a flat sequence of evaluation steps.
+
+    Each distinct keyword and each distinct function application in the
+    mapping becomes one step, so a sub-expression shared by several columns
+    (for example `ALTAZ_MIDPOINT`) is evaluated only once.  Columns that
+    are not to be updated are left out when the plan is compiled.
 
     Parameters
     ----------
-    column_def : str or Sequence
-        Either a string key to directly access a value in `info`, or a sequence
-        where the first element is a callable and the remaining elements are
-        keys in `info` whose values are passed to the callable.
-    obs_info : ObservationInfo
-        An ObservationInfo object containing exposure metadata
+    mappings : `list` [ `dict` [ `str`, `ColumnMapping` ] ]
+        Mappings from column name to column definition.
+    columns_to_update : `list` [ `str` ], optional
+        If given, only these columns are included.
+    oi : `bool`
+        If True, keywords are ObservationInfo attributes, a function whose
+        first argument is ``ACCEPTS_NULL`` is called even when some of its
+        inputs are missing, and exceptions are caught and returned as
+        `ColumnFailure`.  Otherwise keywords are dictionary keys.
+    """
 
-    Returns
-    -------
-    Any
-        The resulting value after processing the column definition.
+    def __init__(
+        self,
+        mappings: list[dict[str, ColumnMapping]],
+        columns_to_update: list[str] | None = None,
+        oi: bool = False,
+    ):
+        self.oi = oi
+        # Steps are ("key", name) or ("call", fn, accepts_null, arg_steps).
+        self.steps: list[tuple] = []
+        self._step_index: dict[tuple, int] = dict()
+        self.columns: dict[str, int] = dict()
+        for mapping in mappings:
+            for column, column_def in mapping.items():
+                if columns_to_update is None or column in columns_to_update:
+                    self.columns[column] = self._compile(column_def)
+
+    def _compile(self, column_def: ColumnMapping) -> int:
+        if isinstance(column_def, str):
+            step: tuple = ("key", column_def)
+        else:
+            fn = column_def[0]
+            accepts_null = self.oi and column_def[1] == "ACCEPTS_NULL"
+            arg_defs = column_def[2:] if accepts_null else column_def[1:]
+            step = ("call", fn, accepts_null, tuple(self._compile(a) for a in arg_defs))
+        if step not in self._step_index:
+            self._step_index[step] = len(self.steps)
+            self.steps.append(step)
+        return self._step_index[step]
+
+    @property
+    def keywords(self) -> set[str]:
+        """The keywords read by the plan."""
+        return set(step[1] for step in self.steps if step[0] == "key")
+
+    def evaluate(self, source: Any) -> dict[str, Any]:
+        """Compute the column values.
+
+        Parameters
+        ----------
+        source : `~collections.abc.Mapping` or `ObservationInfo`
+            Mapping of keywords to values, or an ObservationInfo for a plan
+            compiled with ``oi=True``.
+
+        Returns
+        -------
+        values : `dict` [ `str`, `Any` ]
+            Value of each column; None if any required input is missing,
+            or a `ColumnFailure` if evaluation raised an exception.
+        """
+        values: list[Any] = [None] * len(self.steps)
+        for index, step in enumerate(self.steps):
+            if step[0] == "key":
+                if self.oi:
+                    values[index] = getattr(source, step[1], None)
+                else:
+                    values[index] = source.get(step[1])
+                continue
+
+            _, fn, accepts_null, arg_steps = step
+            arg_values = [values[i] for i in arg_steps]
+            failure = next((v for v in arg_values if isinstance(v, ColumnFailure)), None)
+            if failure is not None:
+                values[index] = failure
+            elif accepts_null or all(v is not None for v in arg_values):
+                if self.oi:
+                    try:
+                        values[index] = fn(*arg_values)
+                    except Exception as e:
+                        values[index] = ColumnFailure(e)
+                else:
+                    values[index] = fn(*arg_values)
+        return {column: values[index] for column, index in self.columns.items()}
+
+
+# Decides which sections of a header to read.  Given a section name, returns
+# None to read every keyword, a set of keywords to read only those, or False
+# to skip the section.
+SectionFilter = Callable[[str], Union[set[str], None, bool]]
+
+
+def _construct_value(loader: Loader) -> Any:
+    """Construct the Python value of the YAML node starting at the next
+    event, without building the node graph."""
+    event = loader.get_event()
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        return constructor(loader, node)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        values = []
+        while not loader.check_event(yaml.SequenceEndEvent):
+            values.append(_construct_value(loader))
+        loader.get_event()
+        return values
+    elif isinstance(event, yaml.MappingStartEvent):
+        mapping = dict()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _construct_value(loader)
+            mapping[key] = _construct_value(loader)
+        loader.get_event()
+        return mapping
+    # Aliases do not occur in Header Service output.
+    return None
+
+
+def _skip_node(loader: Loader) -> None:
+    """Consume the events of the YAML node starting at the next event."""
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def iter_header_sections(
+    data: bytes | str, section_filter: SectionFilter = lambda section: None
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Parse a Header Service YAML header one section at a time.
+
+    The header is a mapping from section name to a list of
+    ``{keyword, value, comment}`` cards.  Rather than loading the whole
+    document, this walks the YAML event stream and only constructs the
+    values of the keywords that are asked for.
+
+    Parameters
+    ----------
+    data : `bytes` or `str`
+        The YAML document.
+    section_filter : `SectionFilter`, optional
+        Selects the sections and keywords to read; by default everything.
+
+    Yields
+    ------
+    section : `str`
+        Name of the section.
+    values : `dict` [ `str`, `Any` ]
+        Mapping of keyword to value for the selected keywords.
     """
-    if isinstance(column_def, str):
-        if hasattr(obs_info, column_def):
-            val = getattr(obs_info, column_def)
-            if val is not None:
-                return val
-        logger.debug(f"Value missing in processing of OI: {column_def}")
-    elif isinstance(column_def, tuple):
-        fn = column_def[0]
+    loader = Loader(data)
+    try:
+        loader.get_event()  # StreamStart
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()  # DocumentStart
+        loader.get_event()  # MappingStart
+        while not loader.check_event(yaml.MappingEndEvent):
+            section = _construct_value(loader)
+            wanted = section_filter(section)
+            if wanted is False:
+                _skip_node(loader)
+                continue
+
+            values = dict()
+            loader.get_event()  # SequenceStart
+            while not loader.check_event(yaml.SequenceEndEvent):
+                loader.get_event()  # MappingStart
+                keyword = None
+                value = None
+                while not loader.check_event(yaml.MappingEndEvent):
+                    key = _construct_value(loader)
+                    if key == "keyword":
+                        keyword = _construct_value(loader)
+                    elif key == "value" and (wanted is None or keyword is None or keyword in wanted):
+                        value = _construct_value(loader)
+                    else:
+                        _skip_node(loader)
+                loader.get_event()  # MappingEnd
+                if wanted is None or keyword in wanted:
+                    values[keyword] = value
+            loader.get_event()  # SequenceEnd
+            yield section, values
+    finally:
+        loader.dispose()
+
+
+# Stages of ingesting a header, each timed by a histogram.
+STAGES = (
+    "s3_wait",
+    "s3_read",
+    "yaml_parse",
+    "vertices",
+    "kw_mapping",
+    "translation",
+    "exposure_insert",
+    "ccdexposure_insert",
+)
+stage_time: dict[str, Histogram] = {
+    stage: REGISTRY.register(
+        Histogram("hinfo_stage_seconds", "Time spent in each stage of header ingest", labels={"stage": stage})
+    )
+    for stage in STAGES
+}
 
-        accepts_null = column_def[1] == "ACCEPTS_NULL"
-        arg_names = column_def[2:] if accepts_null else column_def[1:]
 
-        arg_values = [process_oi_column(a, obs_info) for a in arg_names]
-        if accepts_null or all(v is not None for v in arg_values):
-            return fn(*arg_values)
-        logger.debug(f"Missing values in processing of OI: {fn} {arg_values=}")
+def observe_timings(timings: dict[str, float]) -> None:
+    """Record the stage timings of one header in `stage_time`."""
+    for stage, elapsed in timings.items():
+        stage_time[stage].observe(elapsed)
 
 
-def process_resource(resource: ResourcePath, instrument_dict: dict, update: bool = False) -> None:
-    """Process a header resource.
+@dataclass
+class HeaderRecord:
+    """Column values translated from a single header resource."""
+
+    resource: str
+    url: str
+    controller: str
+    exposure_rec: dict[str, Any]
+    det_exposure_recs: list[dict[str, Any]]
+    timings: dict[str, float] = field(default_factory=dict)
+    """Time spent in each stage, in seconds.  Timings travel with the record
+    so that those measured in worker processes reach the parent."""
+    write_attempts: int = 0
+    """Number of times writing the record on its own has failed."""
+
+
+def translate_resource(resource: ResourcePath, instrument_dict: dict) -> HeaderRecord | None:
+    """Translate a header resource into exposure and ccdexposure rows.
 
     Uses configured mappings and the ObservationInfo translator to generate
-    column values that are inserted into the exposure table.
+    column values, without writing anything to the database.
 
     Parameters
     ----------
     resource : `ResourcePath`
         Path to the Header Service header resource.
-    """
-    assert engine is not None
+    instrument_dict : `dict` [ `str`, `Instrument` ]
+        A dictionary mapping a controller type to its metadata.
 
+    Returns
+    -------
+    record : `HeaderRecord` or `None`
+        The translated rows, or None if the controller is not handled.
+    """
     logger.info(f"Obtained for processing: {resource.basename()}")
     exposure_rec = dict()
 
+    # Only PRIMARY and the per-detector "_PRIMARY" sections are read, and of
+    # the latter only the keywords used by the detector mapping.  That set
+    # is known once PRIMARY, which comes first, has identified the
+    # controller.
+    detector_keywords: set[str] | bool = False
+
+    def section_filter(section: str) -> set[str] | None | bool:
+        if section == "PRIMARY":
+            return None
+        if section.endswith("_PRIMARY"):
+            return detector_keywords
+        return False
+
+    timings = dict()
+    start = time.perf_counter()
+    data = resource.read()
+    timings["s3_read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
     info = dict()
-    content = load(resource.read(), Loader=Loader)
-
-    for header in content["PRIMARY"]:
-        info[header["keyword"]] = header["value"]
+    detector_sections = []
+    for section, values in iter_header_sections(data, section_filter):
+        if section != "PRIMARY":
+            detector_sections.append((section, values))
+            continue
 
-    if info["CONTRLLR"] not in instrument_dict:
-        logger.warning(f"Will not process {resource}: no mapping for controller `{info['CONTRLLR']}`")
-        return
+        info.update(values)
+        if info["CONTRLLR"] not in instrument_dict:
+            logger.warning(f"Will not process {resource}: no mapping for controller `{info['CONTRLLR']}`")
+            return None
+        instrument_obj = instrument_dict[info["CONTRLLR"]]
+        if ccd_columns_to_update is not None and "@skip" in ccd_columns_to_update:
+            break  # Special keyword "@skip" stops reprocessing of the ccdexposure table.
+        detector_keywords = instrument_obj.detector_plan.keywords
+    timings["yaml_parse"] = time.perf_counter() - start
 
-    instrument_obj = instrument_dict[info["CONTRLLR"]]
     info["camera"] = instrument_obj.camera
     info["translator"] = instrument_obj.translator
+    info["instrument_name"] = instrument_obj.instrument_name
 
     # Pre-compute the WCS vertices
+    start = time.perf_counter()
     if info.get("IMGTYPE") == "OBJECT" and "RA" in info and "DEC" in info and "ROTPA" in info:
         info["vertices"] = get_vertices(
             instrument_obj.camera,
@@ -616,124 +977,628 @@ def process_resource(resource: ResourcePath, instrument_dict: dict, update: bool
             info["DEC"],
             info["ROTPA"],
         )
+    timings["vertices"] = time.perf_counter() - start
 
-    for column, column_def in KW_MAPPING.items():
-        if exp_columns_to_update is None or column in exp_columns_to_update:
-            exposure_rec[column] = process_column(column_def, info)
-    for column, column_def in instrument_obj.instrument_mapping.items():
-        if exp_columns_to_update is None or column in exp_columns_to_update:
-            exposure_rec[column] = process_column(column_def, info)
+    start = time.perf_counter()
+    exposure_rec = instrument_obj.exposure_plan.evaluate(info)
+    kw_mapping_time = time.perf_counter() - start
 
+    start = time.perf_counter()
     obs_info = ObservationInfo(info, translator_class=instrument_obj.translator)
     logger.info(f"Completed metadata translation: {resource.basename()}")
 
-    for column, column_def in OI_MAPPING.items():
-        if exp_columns_to_update is not None and column not in exp_columns_to_update:
-            continue
+    for column, value in instrument_obj.oi_plan.evaluate(obs_info).items():
+        if isinstance(value, ColumnFailure):
+            logger.error(f"Unable to process column: {column} ({resource=})", exc_info=value.exception)
+            value = None
+        elif isinstance(value, u.Quantity):
+            value = float(value.value)
+        elif isinstance(value, np.float64):
+            value = float(value)
+        exposure_rec[column] = value
+    logger.debug(exposure_rec)
+    timings["translation"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    det_exposure_recs = []
+    for detector, det_info in detector_sections:
+        det_info["exposure_id"] = obs_info.exposure_id
+        ccdname = f"{detector[0:3]}_{detector[3:6]}"
+        if ccdname == "R00_S00" and instrument_obj.instrument_name == "latiss":
+            ccdname = "RXX_S00"
+        det_info["ccdname"] = ccdname
+        det_info["detector"] = instrument_obj.camera[ccdname].getId()
+        # Detector keywords take precedence over the exposure keywords.
+        det_exposure_rec = instrument_obj.detector_plan.evaluate(ChainMap(det_info, info))
+
+        if "day_obs" in instrument_obj.ccdexposure_table.columns:  # schema version >= 3.2.0
+            det_exposure_rec["day_obs"] = exposure_rec["day_obs"]
+            det_exposure_rec["seq_num"] = exposure_rec["seq_num"]
+
+        logger.debug(det_exposure_rec)
+        det_exposure_recs.append(det_exposure_rec)
+
+    timings["kw_mapping"] = kw_mapping_time + time.perf_counter() - start
+
+    return HeaderRecord(
+        resource=resource.basename(),
+        url=str(resource),
+        controller=info["CONTRLLR"],
+        exposure_rec=exposure_rec,
+        det_exposure_recs=det_exposure_recs,
+        timings=timings,
+    )
+
+
+# Outcome of rows written in update mode, by table: "compared" rows already
+# existed; of those, "changed" rows were rewritten and "skipped" rows were
+# left alone because no value differed.
+update_counters: dict[str, dict[str, Counter]] = {
+    table: {
+        outcome: REGISTRY.register(
+            Counter(f"hinfo_{table}_rows_{outcome}", f"{table} rows {outcome} in update mode")
+        )
+        for outcome in ("compared", "changed", "skipped")
+    }
+    for table in ("exposure", "ccdexposure")
+}
+
+
+# Writes of at least this many rows go through COPY into a staging table,
+# if the database driver supports it.  Zero or less disables COPY.
+copy_min_rows = int(os.environ.get("HINFO_COPY_MIN_ROWS", "20"))
+
+# Staging tables by (target table, columns).
+staging_tables: dict[tuple[str, tuple[str, ...]], Table] = dict()
+
+
+def copy_supported(conn: Connection) -> bool:
+    """Return True if rows can be loaded with COPY over ``conn``."""
+    return conn.dialect.name == "postgresql" and conn.dialect.driver in ("psycopg2", "psycopg")
 
-        try:
-            exposure_rec[column] = process_oi_column(column_def, obs_info)
-            if isinstance(exposure_rec[column], u.Quantity):
-                exposure_rec[column] = float(exposure_rec[column].value)
-            elif isinstance(exposure_rec[column], np.float64):
-                exposure_rec[column] = float(exposure_rec[column])
-        except Exception:
-            exposure_rec[column] = None
-            logger.exception(f"Unable to process column: {column} ({resource=})")
 
-    stmt = insert(instrument_obj.exposure_table).values(exposure_rec)
+def _copy_text(value: Any) -> str:
+    """Format a value for COPY in text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = str(value)
+    for char, escaped in (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r")):
+        text = text.replace(char, escaped)
+    return text
+
+
+def copy_to_staging(conn: Connection, table: Table, recs: list[dict[str, Any]]) -> Table:
+    """Load rows into a temporary staging table with COPY.
+
+    The staging table has the columns of ``recs``, with the same types as in
+    ``table`` but no constraints.  It is created on first use in each
+    database session, emptied before each load, and emptied at commit.
+
+    Parameters
+    ----------
+    conn : `sqlalchemy.Connection`
+        Connection to write with; must satisfy `copy_supported`.
+    table : `sqlalchemy.Table`
+        The table the rows are destined for.
+    recs : `list` [ `dict` [ `str`, `Any` ] ]
+        The rows, all with the same columns.
+
+    Returns
+    -------
+    staging_table : `sqlalchemy.Table`
+        The staging table, holding the rows.
+    """
+    columns = tuple(recs[0])
+    key = (table.fullname, columns)
+    if key not in staging_tables:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        staging_tables[key] = Table(
+            f"hinfo_stage_{table.name}_{digest}",
+            MetaData(),
+            *(Column(col, table.c[col].type) for col in columns),
+        )
+    staging_table = staging_tables[key]
+
+    preparer = conn.dialect.identifier_preparer
+    staging_name = preparer.format_table(staging_table)
+    column_list = ", ".join(preparer.quote(col) for col in columns)
+    conn.exec_driver_sql(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging_name} ON COMMIT DELETE ROWS AS "
+        f"SELECT {column_list} FROM {preparer.format_table(table)} WITH NO DATA"
+    )
+    conn.exec_driver_sql(f"TRUNCATE {staging_name}")
+
+    copy_sql = f"COPY {staging_name} ({column_list}) FROM STDIN"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg":
+            with cursor.copy(copy_sql) as copy:
+                for rec in recs:
+                    copy.write_row([rec[col] for col in columns])
+        else:
+            data = "".join("\t".join(_copy_text(rec[col]) for col in columns) + "\n" for rec in recs)
+            cursor.copy_expert(copy_sql, io.StringIO(data))
+    finally:
+        cursor.close()
+    return staging_table
+
+
+# Insert statements by (table, columns, key, update mode, staging table), so
+# that each is built and compiled once.
+upsert_statements: dict[tuple, Any] = dict()
+
+
+def upsert_statement(
+    table: Table, columns: tuple[str, ...], key: str, update: bool, staging_table: Table | None = None
+) -> Any:
+    """Return the statement used by `upsert`, building it on first use.
+
+    Parameters
+    ----------
+    table : `sqlalchemy.Table`
+        The table to write to.
+    columns : `tuple` [ `str`, ... ]
+        The columns written.
+    key : `str`
+        The primary key column.
+    update : `bool`
+        If True, update existing rows whose values differ, returning whether
+        each affected row was inserted; otherwise skip existing rows.
+    staging_table : `sqlalchemy.Table`, optional
+        If given, the rows are selected from this table; otherwise they are
+        supplied as parameters.
+
+    Returns
+    -------
+    stmt : `sqlalchemy.dialects.postgresql.Insert`
+        The statement.
+    """
+    cache_key = (table, columns, key, update, staging_table)
+    if cache_key in upsert_statements:
+        return upsert_statements[cache_key]
+
+    if staging_table is not None:
+        stmt = insert(table).from_select(list(columns), select(*staging_table.c))
+    else:
+        stmt = insert(table)
     if update:
-        stmt = stmt.on_conflict_do_update(index_elements=["exposure_id"], set_=exposure_rec)
+        compared = [col for col in columns if col != key]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={col: stmt.excluded[col] for col in columns},
+            where=(
+                or_(*(table.c[col].is_distinct_from(stmt.excluded[col]) for col in compared))
+                if compared
+                else None
+            ),
+        )
+        # xmax is zero for a freshly inserted tuple and nonzero for an
+        # updated one; rows skipped by the WHERE clause are not returned.
+        stmt = stmt.returning(literal_column("xmax = 0").label("inserted"))
     else:
         stmt = stmt.on_conflict_do_nothing()
-    logger.debug(exposure_rec)
-    with engine.begin() as conn:
-        conn.execute(stmt)
+    upsert_statements[cache_key] = stmt
+    return stmt
+
+
+def upsert(
+    conn: Connection,
+    table: Table,
+    recs: list[dict[str, Any]],
+    key: str,
+    update: bool = False,
+    use_copy: bool | None = None,
+) -> None:
+    """Insert rows, either skipping or updating rows that already exist.
+
+    In update mode, an existing row is only rewritten if at least one of
+    its values ``IS DISTINCT FROM`` the new one, so reprocessing unchanged
+    headers does not generate dead tuples, WAL or index churn.  The number
+    of existing rows compared, changed and skipped is added to
+    `update_counters`.
+
+    Large sets of rows are loaded with COPY into a staging table and merged
+    with a single ``INSERT ... SELECT``, which avoids binding every value
+    of a multi-row ``INSERT ... VALUES``.
+
+    Parameters
+    ----------
+    conn : `sqlalchemy.Connection`
+        Connection to write with.
+    table : `sqlalchemy.Table`
+        The table to write to.
+    recs : `list` [ `dict` [ `str`, `Any` ] ]
+        The rows, all with the same columns.
+    key : `str`
+        The primary key column.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+    use_copy : `bool`, optional
+        Whether to load the rows with COPY; by default, if there are at
+        least `copy_min_rows` of them and the driver supports it.
+    """
+    if use_copy is None:
+        use_copy = 0 < copy_min_rows <= len(recs) and copy_supported(conn)
+    columns = tuple(recs[0])
+    if use_copy:
+        staging_table = copy_to_staging(conn, table, recs)
+        stmt = upsert_statement(table, columns, key, update, staging_table)
+        result = conn.execute(stmt)
+    else:
+        stmt = upsert_statement(table, columns, key, update)
+        # Executed with a list of parameter sets, SQLAlchemy batches the
+        # rows into multi-row VALUES itself, reusing the compiled statement.
+        result = conn.execute(stmt, recs)
+    if not update:
+        return
+
+    returned = [row.inserted for row in result]
+    inserted = sum(1 for row in returned if row)
+    compared = len(recs) - inserted
+    changed = len(returned) - inserted
+    counters = update_counters[table.name]
+    counters["compared"].inc(compared)
+    counters["changed"].inc(changed)
+    counters["skipped"].inc(compared - changed)
+    logger.debug(f"{table.name}: {compared} rows compared, {changed} changed, {compared - changed} skipped")
 
-        detectors = [section for section in content if section.endswith("_PRIMARY")]
-        if ccd_columns_to_update is not None and "@skip" in ccd_columns_to_update:
-            detectors = []  # Special keyword "@skip" stops reprocessing of the ccdexposure table.
-
-        det_exposure_recs = []
-        for detector in detectors:
-            det_exposure_rec = dict()
-            det_info = info.copy()
-            det_info["exposure_id"] = obs_info.exposure_id
-            ccdname = f"{detector[0:3]}_{detector[3:6]}"
-            if ccdname == "R00_S00" and instrument_obj.instrument_name == "latiss":
-                ccdname = "RXX_S00"
-            det_info["ccdname"] = ccdname
-            det_info["detector"] = instrument_obj.camera[ccdname].getId()
-            for header in content[detector]:
-                det_info[header["keyword"]] = header["value"]
-            for field, keyword in instrument_obj.det_mapping.items():
-                if ccd_columns_to_update is None or field in ccd_columns_to_update:
-                    det_exposure_rec[field] = process_column(keyword, det_info)
-
-            if "day_obs" in instrument_obj.ccdexposure_table.columns:  # schema version >= 3.2.0
-                det_exposure_rec["day_obs"] = exposure_rec["day_obs"]
-                det_exposure_rec["seq_num"] = exposure_rec["seq_num"]
-
-            logger.debug(det_exposure_rec)
-            det_exposure_recs.append(det_exposure_rec)
-
-        if det_exposure_recs:
-            det_stmt = insert(instrument_obj.ccdexposure_table).values(det_exposure_recs)
-            if update:
-                # ON CONFLICT DO UPDATE requires a SET clause. Use `excluded`
-                # so each conflicting row is updated with its own prior values
-                det_stmt = det_stmt.on_conflict_do_update(
-                    index_elements=["ccdexposure_id"],
-                    set_={col: det_stmt.excluded[col] for col in det_exposure_recs[0]},
-                )
-            else:
-                det_stmt = det_stmt.on_conflict_do_nothing()
-            conn.execute(det_stmt)
 
-        conn.commit()
+def log_update_counters() -> None:
+    """Log the totals of `update_counters`."""
+    for table, counters in update_counters.items():
         logger.info(
-            f"Committed to exposure and ccdexposure table: {resource.basename()} "
-            f"({exposure_rec['day_obs']}/{exposure_rec['seq_num']})"
+            f"{table}: {counters['compared'].value} rows compared, {counters['changed'].value} changed, "
+            f"{counters['skipped'].value} skipped"
         )
 
 
-def process_local_path(path: str) -> None:
+def write_records(
+    conn: Connection, instrument_obj: "Instrument", records: list[HeaderRecord], update: bool = False
+) -> None:
+    """Write translated header records for one instrument.
+
+    All exposure rows are written with one multi-row INSERT, followed by all
+    ccdexposure rows with another.  The caller owns the transaction.
+
+    Parameters
+    ----------
+    conn : `sqlalchemy.Connection`
+        Connection to write with.
+    instrument_obj : `Instrument`
+        The instrument whose tables the records belong in.
+    records : `list` [ `HeaderRecord` ]
+        Records to write; at most one per exposure_id.
+    update : `bool`
+        If True, update existing rows whose values differ instead of
+        skipping them.
+    """
+    start = time.perf_counter()
+    exposure_recs = [record.exposure_rec for record in records]
+    upsert(conn, instrument_obj.exposure_table, exposure_recs, "exposure_id", update)
+    exposure_insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    det_exposure_recs = [rec for record in records for rec in record.det_exposure_recs]
+    if det_exposure_recs:
+        upsert(conn, instrument_obj.ccdexposure_table, det_exposure_recs, "ccdexposure_id", update)
+    ccdexposure_insert_time = time.perf_counter() - start
+
+    # Each header waits for the whole statement it is part of.
+    for record in records:
+        record.timings["exposure_insert"] = exposure_insert_time
+        record.timings["ccdexposure_insert"] = ccdexposure_insert_time
+
+
+def log_committed(record: HeaderRecord) -> None:
+    logger.info(
+        f"Committed to exposure and ccdexposure table: {record.resource} "
+        f"({record.exposure_rec['day_obs']}/{record.exposure_rec['seq_num']})"
+    )
+
+
+def process_resource(
+    resource: ResourcePath, instrument_dict: dict, update: bool = False
+) -> HeaderRecord | None:
+    """Process a header resource.
+
+    Uses configured mappings and the ObservationInfo translator to generate
+    column values that are inserted into the exposure table.
+
+    Parameters
+    ----------
+    resource : `ResourcePath`
+        Path to the Header Service header resource.
+
+    Returns
+    -------
+    record : `HeaderRecord` or `None`
+        The rows written, or None if the controller is not handled.
+    """
+    assert engine is not None
+
+    record = translate_resource(resource, instrument_dict)
+    if record is None:
+        return None
+
+    with engine.begin() as conn:
+        write_records(conn, instrument_dict[record.controller], [record], update)
+    log_committed(record)
+    return record
+
+
+class BatchWriter:
+    """Accumulate translated headers and write them in batches.
+
+    A batch is written when it holds ``max_records`` exposures, or when its
+    oldest record is older than ``max_age_ms`` and `flush_if_due` is called.
+    Each batch is written in one transaction, with one multi-row upsert per
+    table.  If that fails, each record of the batch is retried in its own
+    transaction so that one bad header cannot lose the rest.
+
+    Parameters
+    ----------
+    instrument_dict : `dict` [ `str`, `Instrument` ]
+        A dictionary mapping a controller type to its metadata.
+    max_records : `int`
+        Maximum number of exposures in a batch.
+    max_age_ms : `int`
+        Maximum time to hold a record before writing it, in milliseconds.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+    retry_store : `RetryStore`, optional
+        If provided, records that cannot be written are scheduled for retry
+        in it, and records that are written are removed from it.
+    max_attempts : `int`
+        Without a retry store, maximum number of times a record is written
+        before `requeue` gives up on it.
+    """
+
+    def __init__(
+        self,
+        instrument_dict: dict,
+        max_records: int,
+        max_age_ms: int,
+        update: bool = False,
+        retry_store: RetryStore | None = None,
+        max_attempts: int = 3,
+    ):
+        self.instrument_dict = instrument_dict
+        self.max_records = max_records
+        self.max_age_ms = max_age_ms
+        self.update = update
+        self.retry_store = retry_store
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, int], HeaderRecord] = dict()
+        self._oldest: float | None = None
+
+    def add(self, record: HeaderRecord) -> bool:
+        """Add a record to the current batch.
+
+        A later record for the same exposure replaces an earlier one, since
+        a single upsert cannot touch the same row twice.
+
+        Returns
+        -------
+        full : `bool`
+            True if the batch should now be written with `flush`.
+        """
+        with self._lock:
+            key = (record.controller, record.exposure_rec["exposure_id"])
+            self._pending[key] = record
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            return len(self._pending) >= self.max_records
+
+    def is_due(self) -> bool:
+        """Return True if the batch is full or its oldest record too old."""
+        with self._lock:
+            if self._oldest is None:
+                return False
+            if len(self._pending) >= self.max_records:
+                return True
+            return (time.monotonic() - self._oldest) * 1000 >= self.max_age_ms
+
+    def flush_if_due(self) -> list[HeaderRecord]:
+        """Write the current batch if `is_due`; see `flush`."""
+        if self.is_due():
+            return self.flush()
+        return []
+
+    def requeue(self, records: list[HeaderRecord]) -> None:
+        """Put records that `flush` could not write back into the batch.
+
+        With a retry store, failed records are already scheduled there and
+        nothing is done.  Otherwise each record is written at most
+        ``max_attempts`` times before it is given up on, and a record of
+        the same exposure added since the failure takes precedence.
+
+        Parameters
+        ----------
+        records : `list` [ `HeaderRecord` ]
+            The failed records returned by `flush` or `flush_async`.
+        """
+        if self.retry_store is not None:
+            return
+        with self._lock:
+            for record in records:
+                if record.write_attempts >= self.max_attempts:
+                    logger.error(f"Giving up on {record.resource} after {record.write_attempts} attempts")
+                    continue
+                key = (record.controller, record.exposure_rec["exposure_id"])
+                self._pending.setdefault(key, record)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+
+    def flush_all(self) -> list[HeaderRecord]:
+        """Write all pending records, writing failed ones again as allowed
+        by `requeue`.
+
+        Returns
+        -------
+        failed : `list` [ `HeaderRecord` ]
+            Records that were given up on, or, with a retry store, that
+            were scheduled for retry in it.
+        """
+        given_up = []
+        while failed := self.flush():
+            given_up.extend(
+                record
+                for record in failed
+                if self.retry_store is not None or record.write_attempts >= self.max_attempts
+            )
+            self.requeue(failed)
+        return given_up
+
+    def _take(self) -> list[HeaderRecord]:
+        """Remove and return all pending records."""
+        with self._lock:
+            records = list(self._pending.values())
+            self._pending = dict()
+            self._oldest = None
+        return records
+
+    def _write(self, conn: Connection, records: list[HeaderRecord]) -> None:
+        """Write records of any instruments with ``conn``."""
+        by_controller: dict[str, list[HeaderRecord]] = dict()
+        for record in records:
+            by_controller.setdefault(record.controller, []).append(record)
+        for controller, controller_records in by_controller.items():
+            write_records(conn, self.instrument_dict[controller], controller_records, self.update)
+
+    def _committed(self, records: list[HeaderRecord]) -> None:
+        for record in records:
+            log_committed(record)
+            observe_timings(record.timings)
+        if self.retry_store is not None:
+            self.retry_store.remove(*(record.url for record in records))
+
+    def _failed(self, record: HeaderRecord, error: Exception) -> None:
+        record.write_attempts += 1
+        logger.error(f"Failed to write {record.resource}", exc_info=error)
+        if self.retry_store is not None:
+            self.retry_store.record_failure(record.url, error)
+
+    def flush(self) -> list[HeaderRecord]:
+        """Write all pending records.
+
+        Returns
+        -------
+        failed : `list` [ `HeaderRecord` ]
+            Records that could not be written.
+        """
+        assert engine is not None
+
+        records = self._take()
+        if not records:
+            return []
+
+        try:
+            with engine.begin() as conn:
+                self._write(conn, records)
+        except Exception:
+            logger.exception(f"Batch of {len(records)} headers failed; retrying individually")
+        else:
+            logger.info(f"Committed batch of {len(records)} headers")
+            self._committed(records)
+            return []
+
+        failed = []
+        for record in records:
+            try:
+                with engine.begin() as conn:
+                    self._write(conn, [record])
+            except Exception as e:
+                failed.append(record)
+                self._failed(record, e)
+            else:
+                self._committed([record])
+        return failed
+
+    async def flush_async(self) -> list[HeaderRecord]:
+        """Write all pending records without blocking the event loop.
+
+        Uses `async_engine` if it is configured, otherwise runs `flush` in
+        a thread.
+
+        Returns
+        -------
+        failed : `list` [ `HeaderRecord` ]
+            Records that could not be written.
+        """
+        if async_engine is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+        records = self._take()
+        if not records:
+            return []
+
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(self._write, records)
+        except Exception:
+            logger.exception(f"Batch of {len(records)} headers failed; retrying individually")
+        else:
+            logger.info(f"Committed batch of {len(records)} headers")
+            await asyncio.to_thread(self._committed, records)
+            return []
+
+        failed = []
+        for record in records:
+            try:
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(self._write, [record])
+            except Exception as e:
+                failed.append(record)
+                await asyncio.to_thread(self._failed, record, e)
+            else:
+                await asyncio.to_thread(self._committed, [record])
+        return failed
+
+
+def process_local_path(path: str, batch_writer: BatchWriter | None = None) -> None:
     """Processes all yaml files in the specified path recursively.
 
     Parameters
     -----------
     path : `str`
         Path to directory that contains yaml files.
+    batch_writer : `BatchWriter`, optional
+        If provided, headers are written in batches through it.
     """
+    instrument_dict = batch_writer.instrument_dict if batch_writer else get_instrument_dict(instrument)
+    update = exp_columns_to_update is not None
     if os.path.isdir(path):
         for root, _, files in os.walk(path):
             for file in files:
                 if file.endswith(".yaml"):
                     try:
                         logger.info(f"Processing: {file}...")
-                        process_resource(
-                            ResourcePath(os.path.join(root, file)),
-                            get_instrument_dict(instrument),
-                            exp_columns_to_update is not None,
-                        )
+                        resource = ResourcePath(os.path.join(root, file))
+                        process_or_add(resource, instrument_dict, update, batch_writer)
                     except Exception:
                         logger.exception(f"Failed to process resource {file}")
     # If a yaml file is provided on the command line, process it.
     elif os.path.isfile(path) and path.endswith(".yaml"):
-        process_resource(
-            ResourcePath(path),
-            get_instrument_dict(instrument),
-            exp_columns_to_update is not None,
-        )
+        process_or_add(ResourcePath(path), instrument_dict, update, batch_writer)
 
+    if batch_writer is not None:
+        finish_batches(batch_writer)
 
-def process_date(day_obs: str, instrument_dict: dict, update: bool = False) -> None:
+
+def process_date(
+    day_obs: str, instrument_dict: dict, update: bool = False, batch_writer: BatchWriter | None = None
+) -> None:
     """Process all headers from a given observation day (as YYYY-MM-DD).
 
     Parameters
     ----------
     day_obs : `str`
         Observation day to process, as YYYY-MM-DD.
+    batch_writer : `BatchWriter`, optional
+        If provided, headers are written in batches through it.
     """
     # global instrument
     # global bucket_prefix
@@ -743,7 +1608,179 @@ def process_date(day_obs: str, instrument_dict: dict, update: bool = False) -> N
     d = ResourcePath(f"s3://{bucket_prefix}rubinobs-lfa-cp/{TOPIC_MAPPING[instrument]}/header/{date}/")
     for dirpath, dirnames, filenames in d.walk():
         for fname in filenames:
-            process_resource(d.join(fname), instrument_dict, update)
+            process_or_add(d.join(fname), instrument_dict, update, batch_writer)
+
+    if batch_writer is not None:
+        finish_batches(batch_writer)
+
+
+def process_or_add(
+    resource: ResourcePath, instrument_dict: dict, update: bool, batch_writer: BatchWriter | None
+) -> None:
+    """Process a header resource now, or add it to the batch of
+    ``batch_writer`` if one is given.
+
+    A full batch is written, and records it could not write are put back
+    with `BatchWriter.requeue`.
+    """
+    if batch_writer is None:
+        process_resource(resource, instrument_dict, update)
+        return
+    record = translate_resource(resource, instrument_dict)
+    if record is not None and batch_writer.add(record):
+        batch_writer.requeue(batch_writer.flush())
+
+
+def finish_batches(batch_writer: BatchWriter) -> None:
+    """Write the records left in ``batch_writer`` and log those that could
+    not be written."""
+    failed = batch_writer.flush_all()
+    if failed:
+        logger.error(f"Unable to write {len(failed)} headers: {', '.join(r.url for r in failed)}")
+
+
+def list_header_urls(path: str | None = None, day_obs: str | None = None) -> Iterator[str]:
+    """List the header resources to backfill.
+
+    Parameters
+    ----------
+    path : `str`, optional
+        Local yaml file, or directory searched recursively for yaml files.
+    day_obs : `str`, optional
+        Observation day, as YYYY-MM-DD, whose headers are listed from S3.
+
+    Yields
+    ------
+    url : `str`
+        URL of a header resource.
+    """
+    if path is not None:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in sorted(files):
+                    if file.endswith(".yaml"):
+                        yield str(ResourcePath(os.path.join(root, file)))
+        elif os.path.isfile(path) and path.endswith(".yaml"):
+            yield str(ResourcePath(path))
+    if day_obs is not None:
+        date = "/".join(day_obs.split("-"))
+        d = ResourcePath(f"s3://{bucket_prefix}rubinobs-lfa-cp/{TOPIC_MAPPING[instrument]}/header/{date}/")
+        for dirpath, dirnames, filenames in d.walk():
+            for fname in sorted(filenames):
+                yield str(d.join(fname))
+
+
+# Separator between the URL and the status of a line of a backfill
+# manifest; lines without a status are those of committed headers.
+MANIFEST_SEPARATOR = "\t"
+
+
+def backfill(
+    urls: Iterable[str],
+    workers: int,
+    batch_size: int,
+    manifest_path: str | None = None,
+    update: bool = False,
+) -> None:
+    """Process many header resources in parallel.
+
+    Reading and translating headers is spread over a pool of ``workers``
+    processes, each of which builds its instrument dictionary once.  The
+    translated rows are written from this process in batches of
+    ``batch_size`` headers.
+
+    If ``manifest_path`` is given, the URL of each header is appended to it
+    once its rows are committed, and headers already listed there are
+    skipped, so an interrupted backfill can be resumed by rerunning the
+    same command.  Headers that have nothing to write, such as those of
+    controllers without a mapping, are listed with a ``skipped`` status
+    instead; they are processed again on resumption, in case the mapping
+    has since been fixed.
+
+    Parameters
+    ----------
+    urls : `Iterable` [ `str` ]
+        URLs of the header resources to process.
+    workers : `int`
+        Number of worker processes.
+    batch_size : `int`
+        Number of headers written per transaction.
+    manifest_path : `str`, optional
+        Path to the progress manifest.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+    """
+    completed: set[str] = set()
+    if manifest_path is not None and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                url, _, status = line.strip().partition(MANIFEST_SEPARATOR)
+                if url and not status:
+                    completed.add(url)
+        logger.info(f"Resuming backfill: {len(completed)} headers already done")
+
+    instrument_dict = get_instrument_dict(instrument)
+    batch_writer = BatchWriter(instrument_dict, batch_size, max_age_ms=0, update=update)
+    manifest = open(manifest_path, "a") if manifest_path is not None else None
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+
+    def mark_done(done_urls: list[str]) -> None:
+        counts["done"] += len(done_urls)
+        if manifest is not None and done_urls:
+            manifest.write("".join(f"{url}\n" for url in done_urls))
+            manifest.flush()
+
+    def mark_skipped(url: str) -> None:
+        counts["skipped"] += 1
+        if manifest is not None:
+            manifest.write(f"{url}{MANIFEST_SEPARATOR}skipped\n")
+            manifest.flush()
+
+    def flush() -> None:
+        failed = batch_writer.flush()
+        failed_urls = set(record.url for record in failed)
+        counts["failed"] += len(failed_urls)
+        mark_done([url for url in batch_urls if url not in failed_urls])
+        batch_urls.clear()
+
+    batch_urls: list[str] = []
+    worker_config = WorkerConfig(kind="process", workers=workers, max_in_flight=4 * workers)
+    try:
+        with make_executor(worker_config) as executor:
+            pending: dict[concurrent.futures.Future, str] = dict()
+            url_iter = (url for url in urls if url not in completed)
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded number of headers queued for the workers.
+                while not exhausted and len(pending) < worker_config.max_in_flight:
+                    url = next(url_iter, None)
+                    if url is None:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(translate_in_worker, url)] = url
+                if not pending:
+                    break
+
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception:
+                        logger.exception(f"Failed to process resource {url}")
+                        counts["failed"] += 1
+                        continue
+                    if record is None:
+                        mark_skipped(url)
+                        continue
+                    batch_urls.append(url)
+                    if batch_writer.add(record):
+                        flush()
+            flush()
+    finally:
+        if manifest is not None:
+            manifest.close()
+        logger.info(f"Backfill finished: {counts}")
 
 
 ##################
@@ -763,6 +1800,25 @@ class KafkaConfig:
     session_timeout_ms: int
     heartbeat_interval_ms: int
     max_poll_interval_ms: int
+    batch_max_records: int
+    batch_timeout_ms: int
+
+
+@dataclass(frozen=True)
+class BatchConfig:
+    """Class for configuring batched database writes."""
+
+    max_records: int
+    max_age_ms: int
+
+
+@dataclass(frozen=True)
+class WorkerConfig:
+    """Class for configuring the header processing worker pool."""
+
+    kind: str
+    workers: int
+    max_in_flight: int
 
 
 def get_kafka_config() -> KafkaConfig:
@@ -775,6 +1831,26 @@ def get_kafka_config() -> KafkaConfig:
         session_timeout_ms=int(os.environ.get("KAFKA_SESSION_TIMEOUT_MS", "30000")),
         heartbeat_interval_ms=int(os.environ.get("KAFKA_HEARTBEAT_INTERVAL_MS", "10000")),
         max_poll_interval_ms=int(os.environ.get("KAFKA_MAX_POLL_INTERVAL_MS", "300000")),
+        batch_max_records=int(os.environ.get("KAFKA_BATCH_SIZE", "0")),
+        batch_timeout_ms=int(os.environ.get("KAFKA_BATCH_TIMEOUT_MS", "1000")),
+    )
+
+
+def get_batch_config() -> BatchConfig:
+    return BatchConfig(
+        max_records=int(os.environ.get("HINFO_BATCH_SIZE", "1")),
+        max_age_ms=int(os.environ.get("HINFO_BATCH_MS", "1000")),
+    )
+
+
+def get_worker_config() -> WorkerConfig:
+    kind = os.environ.get("HINFO_WORKER_KIND", "thread")
+    if kind not in ("thread", "process"):
+        raise ValueError(f"Unrecognized HINFO_WORKER_KIND: {kind}")
+    return WorkerConfig(
+        kind=kind,
+        workers=int(os.environ.get("HINFO_WORKERS", "4")),
+        max_in_flight=int(os.environ.get("HINFO_MAX_IN_FLIGHT", "16")),
     )
 
 
@@ -782,12 +1858,18 @@ logger = setup_logging("consdb.hinfo")
 
 instrument = os.environ.get("INSTRUMENT", "")
 logger.info(f"{instrument=}")
+# The Kafka consumer can handle several instruments in one process; by
+# default it handles only INSTRUMENT.
+instruments = [name.strip() for name in os.environ.get("INSTRUMENTS", instrument).split(",") if name.strip()]
+logger.info(f"{instruments=}")
 bucket_prefix = os.environ.get("BUCKET_PREFIX", "")
 if bucket_prefix:
     os.environ["LSST_DISABLE_BUCKET_VALIDATION"] = "1"
 
 
 engine = None
+# If set, the Kafka consumer writes through this instead of `engine`.
+async_engine: "AsyncEngine | None" = None
 
 
 @dataclass
@@ -800,14 +1882,22 @@ class Instrument:
     metadata_obj: MetaData
     exposure_table: Table
     ccdexposure_table: Table
+    exposure_plan: ColumnPlan
+    oi_plan: ColumnPlan
+    detector_plan: ColumnPlan
 
     def __init__(self, instrument_name, translator, instrument_mapping, det_mapping, camera):
         # global engine
+        # global exp_columns_to_update
+        # global ccd_columns_to_update
         self.instrument_name = instrument_name
         self.translator = translator
         self.instrument_mapping = instrument_mapping
         self.det_mapping = det_mapping
         self.camera = camera
+        self.exposure_plan = ColumnPlan([KW_MAPPING, instrument_mapping], exp_columns_to_update)
+        self.oi_plan = ColumnPlan([OI_MAPPING], exp_columns_to_update, oi=True)
+        self.detector_plan = ColumnPlan([det_mapping], ccd_columns_to_update)
         self.metadata_obj = MetaData(schema=f"cdb_{instrument_name}")
         self.exposure_table = Table("exposure", self.metadata_obj, autoload_with=engine)
         self.ccdexposure_table = Table("ccdexposure", self.metadata_obj, autoload_with=engine)
@@ -818,50 +1908,278 @@ class Instrument:
 #################
 
 
+# Instrument classes and column mappings for each controller, by instrument.
+INSTRUMENT_SPECS: dict[str, dict[str, tuple[str, type, dict, type]]] = {
+    "LATISS": {
+        "O": ("latiss", lsst.obs.lsst.translators.LatissTranslator, LATISS_MAPPING, lsst.obs.lsst.Latiss),
+    },
+    "LSSTComCam": {
+        "O": (
+            "lsstcomcam",
+            lsst.obs.lsst.translators.LsstComCamTranslator,
+            LSSTCOMCAM_MAPPING,
+            lsst.obs.lsst.LsstComCam,
+        ),
+        "S": (
+            "lsstcomcamsim",
+            lsst.obs.lsst.translators.LsstComCamSimTranslator,
+            LSSTCOMCAMSIM_MAPPING,
+            lsst.obs.lsst.LsstComCamSim,
+        ),
+    },
+    "LSSTCam": {
+        "O": ("lsstcam", lsst.obs.lsst.translators.LsstCamTranslator, LSSTCAM_MAPPING, lsst.obs.lsst.LsstCam),
+    },
+}
+
+# Process-wide caches of Camera and Instrument objects.  Cameras are keyed by
+# instrument class; Instruments by everything that goes into building them.
+camera_registry: dict[type, "lsst.afw.cameraGeom.Camera"] = dict()
+instrument_registry: dict[tuple, Instrument] = dict()
+registry_lock = threading.Lock()
+
+
+def get_schema_version(instrument_name: str) -> str | None:
+    """Return the Alembic revision of an instrument's schema, if known.
+
+    Parameters
+    ----------
+    instrument_name : `str`
+        Lower-case instrument name, as used in the schema name.
+
+    Returns
+    -------
+    version : `str` or `None`
+        The revision, or None if the database has no version table for the
+        schema (e.g. in unit tests).
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(f"SELECT version_num FROM cdb.cdb_{instrument_name}_version").scalar()
+    except Exception:
+        return None
+
+
+def get_camera(instrument_class: type) -> "lsst.afw.cameraGeom.Camera":
+    """Return the Camera for an instrument, building it at most once.
+
+    If HINFO_CAMERA_CACHE_DIR is set, the camera is also cached there as a
+    FITS file keyed by camera name and obs_lsst version, so that restarts
+    and command-line runs skip constructing it.
+
+    Parameters
+    ----------
+    instrument_class : `type`
+        The obs_lsst instrument class, e.g. ``lsst.obs.lsst.LsstCam``.
+
+    Returns
+    -------
+    camera : `lsst.afw.cameraGeom.Camera`
+        The camera geometry.
+    """
+    if instrument_class in camera_registry:
+        return camera_registry[instrument_class]
+
+    cache_dir = os.environ.get("HINFO_CAMERA_CACHE_DIR")
+    version = getattr(lsst.obs.lsst, "__version__", "unknown")
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{instrument_class.getName()}-{version}.fits")
+
+    camera = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            camera = Camera.readFits(cache_path)
+            logger.info(f"Loaded camera from {cache_path}")
+        except Exception:
+            logger.exception(f"Unable to read cached camera {cache_path}")
+    if camera is None:
+        start = time.perf_counter()
+        camera = instrument_class.getCamera()
+        logger.info(f"Built camera {camera.getName()} in {time.perf_counter() - start:.3f}s")
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                camera.writeFits(tmp_path)
+                os.replace(tmp_path, cache_path)
+            except Exception:
+                logger.exception(f"Unable to cache camera in {cache_path}")
+
+    camera_registry[instrument_class] = camera
+    return camera
+
+
 def get_instrument_dict(instrument: str) -> dict:
-    if instrument == "LATISS":
-        instrument_dict = {
-            "O": Instrument(
-                "latiss",
-                lsst.obs.lsst.translators.LatissTranslator,
-                LATISS_MAPPING,
-                DETECTOR_MAPPING,
-                lsst.obs.lsst.Latiss.getCamera(),
-            ),
-        }
-    elif instrument == "LSSTComCam":
-        instrument_dict = {
-            "O": Instrument(
-                "lsstcomcam",
-                lsst.obs.lsst.translators.LsstComCamTranslator,
-                LSSTCOMCAM_MAPPING,
-                DETECTOR_MAPPING,
-                lsst.obs.lsst.LsstComCam.getCamera(),
-            ),
-            "S": Instrument(
-                "lsstcomcamsim",
-                lsst.obs.lsst.translators.LsstComCamSimTranslator,
-                LSSTCOMCAMSIM_MAPPING,
-                DETECTOR_MAPPING,
-                lsst.obs.lsst.LsstComCamSim.getCamera(),
-            ),
-        }
-    elif instrument == "LSSTCam":
-        instrument_dict = {
-            "O": Instrument(
-                "lsstcam",
-                lsst.obs.lsst.translators.LsstCamTranslator,
-                LSSTCAM_MAPPING,
-                DETECTOR_MAPPING,
-                lsst.obs.lsst.LsstCam.getCamera(),
-            ),
-        }
-    else:
+    """Return the `Instrument` for each controller of an instrument.
+
+    Instruments are built once per process and reused, as long as the
+    database engine and columns to update are unchanged.  A schema
+    migration therefore takes effect on restart.
+
+    Parameters
+    ----------
+    instrument : `str`
+        Name of the instrument (e.g. ``LATISS``).
+
+    Returns
+    -------
+    instrument_dict : `dict` [ `str`, `Instrument` ]
+        A dictionary mapping a controller type to its metadata.
+    """
+    if instrument not in INSTRUMENT_SPECS:
         raise ValueError(f"Unrecognized instrument: {instrument}")
 
+    instrument_dict = dict()
+    with registry_lock:
+        for controller, spec in INSTRUMENT_SPECS[instrument].items():
+            instrument_name, translator, instrument_mapping, instrument_class = spec
+            key = (
+                instrument_name,
+                engine,
+                tuple(exp_columns_to_update) if exp_columns_to_update is not None else None,
+                tuple(ccd_columns_to_update) if ccd_columns_to_update is not None else None,
+            )
+            if key not in instrument_registry:
+                logger.info(
+                    f"Building {instrument_name} for schema version {get_schema_version(instrument_name)}"
+                )
+                instrument_registry[key] = Instrument(
+                    instrument_name,
+                    translator,
+                    instrument_mapping,
+                    DETECTOR_MAPPING,
+                    get_camera(instrument_class),
+                )
+            instrument_dict[controller] = instrument_registry[key]
+
     return instrument_dict
 
 
+# Instrument dictionaries for worker processes, by instrument name, built
+# once by `init_worker`.
+worker_instrument_dicts: dict[str, dict] = dict()
+
+
+def warm_up(instrument_dict: dict) -> None:
+    """Prime lazily-initialized state so the first header is not slow.
+
+    Loads the astropy IERS tables and primes an AltAz transform at
+    `cerro_pachon`, then exercises each instrument's translator and fills
+    the focal plane vertex cache for its camera.
+
+    Parameters
+    ----------
+    instrument_dict : `dict` [ `str`, `Instrument` ]
+        A dictionary mapping a controller type to its metadata.
+    """
+    start = time.perf_counter()
+    try:
+        astropy_elapsed = warm_up_astropy(cerro_pachon)
+        for instrument_obj in instrument_dict.values():
+            instrument_obj.translator.compute_detector_exposure_id(2024080100001, 0)
+            get_vertices(instrument_obj.camera, 0.0, -30.0, 0.0)
+    except Exception:
+        # Not fatal: the same work will be retried by the first message.
+        logger.exception("Warm-up failed")
+        return
+    logger.info(f"Warm-up completed in {time.perf_counter() - start:.3f}s (astropy {astropy_elapsed:.3f}s)")
+
+
+def init_worker(
+    worker_instruments: list[str],
+    worker_exp_columns_to_update: list[str] | None,
+    worker_ccd_columns_to_update: list[str] | None,
+) -> None:
+    """Initialize a header processing worker process.
+
+    Worker processes are started with the "spawn" method, so none of the
+    module state configured in the parent is inherited.  Each worker gets
+    its own database engine and instrument dictionaries.
+
+    Parameters
+    ----------
+    worker_instruments : `list` [ `str` ]
+        Names of the instruments being processed (e.g. ``LATISS``).
+    worker_exp_columns_to_update : `list` [ `str` ] or `None`
+        Exposure columns to update, as configured in the parent.
+    worker_ccd_columns_to_update : `list` [ `str` ] or `None`
+        Ccdexposure columns to update, as configured in the parent.
+    """
+    global engine, instruments, exp_columns_to_update, ccd_columns_to_update
+
+    instruments = list(worker_instruments)
+    exp_columns_to_update = worker_exp_columns_to_update
+    ccd_columns_to_update = worker_ccd_columns_to_update
+    engine = setup_postgres()
+    for name in instruments:
+        worker_instrument_dicts[name] = get_instrument_dict(name)
+        warm_up(worker_instrument_dicts[name])
+
+
+def process_in_worker(url: str, update: bool = False) -> dict[str, float]:
+    """Process a header resource inside a worker process.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the Header Service header resource.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+
+    Returns
+    -------
+    timings : `dict` [ `str`, `float` ]
+        Time spent in each stage, for the parent to record.
+    """
+    instrument_dict = worker_instrument_dicts[instrument_for_url(url, worker_instrument_dicts)]
+    record = process_resource(ResourcePath(url), instrument_dict, update)
+    return record.timings if record is not None else dict()
+
+
+def translate_in_worker(url: str) -> HeaderRecord | None:
+    """Translate a header resource inside a worker process.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the Header Service header resource.
+
+    Returns
+    -------
+    record : `HeaderRecord` or `None`
+        The translated rows, as returned by `translate_resource`.
+    """
+    instrument_dict = worker_instrument_dicts[instrument_for_url(url, worker_instrument_dicts)]
+    return translate_resource(ResourcePath(url), instrument_dict)
+
+
+def make_executor(worker_config: WorkerConfig) -> concurrent.futures.Executor:
+    """Create the worker pool that header processing is dispatched into.
+
+    Parameters
+    ----------
+    worker_config : `WorkerConfig`
+        Kind and size of the pool.
+
+    Returns
+    -------
+    executor : `concurrent.futures.Executor`
+        A thread pool, or a process pool whose workers have been set up
+        with `init_worker`.
+    """
+    if worker_config.kind == "process":
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=worker_config.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(instruments, exp_columns_to_update, ccd_columns_to_update),
+        )
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=worker_config.workers, thread_name_prefix="hinfo-worker"
+    )
+
+
 async def wait_for_resource(resource: ResourcePath) -> None:
     """Wait for a resource to become available.
 
@@ -876,9 +2194,340 @@ async def wait_for_resource(resource: ResourcePath) -> None:
         await asyncio.sleep(random.uniform(0.1, 2.0))
 
 
+def list_prefix(prefix: ResourcePath, names: set[str]) -> set[str]:
+    """Return which of ``names`` currently exist under ``prefix``.
+
+    On S3, several names are checked with one listing of the keys that
+    sort between the first and the last of the names.  Header names of a
+    night differ only in their sequence number, so this lists the few
+    headers among the pending ones rather than the whole day directory.
+    Elsewhere, and for a single name, each name is checked with its own
+    existence request.  ``lsst.resources`` caches its S3 client, so all
+    calls share one client and its connection pool.
+
+    Parameters
+    ----------
+    prefix : `ResourcePath`
+        Directory-like resource containing the names.
+    names : `set` [ `str` ]
+        Basenames of the resources to look for.
+
+    Returns
+    -------
+    found : `set` [ `str` ]
+        The subset of ``names`` that exist.
+    """
+    if len(names) == 1 or prefix.scheme != "s3":
+        return {name for name in names if prefix.join(name).exists()}
+
+    first, last = min(names), max(names)
+    key_prefix = prefix.relativeToPathRoot
+    paginator = prefix.client.get_paginator("list_objects_v2")
+    found = set()
+    pages = paginator.paginate(
+        Bucket=prefix.netloc,
+        Prefix=key_prefix + os.path.commonprefix([first, last]),
+        # Every key after this strict prefix of the first name sorts no
+        # earlier than the first name.
+        StartAfter=key_prefix + first[:-1],
+    )
+    for page in pages:
+        for item in page.get("Contents", []):
+            name = item["Key"][len(key_prefix) :]
+            if name > last:
+                return found
+            if name in names:
+                found.add(name)
+    return found
+
+
+class ResourceWaiter:
+    """Wait for header resources to appear, sharing requests by prefix.
+
+    Waits for resources in the same directory are coalesced: one poller
+    per directory checks for all of its pending resources at once, so the
+    number of S3 requests grows with the number of directories, not with
+    the number of waiting messages.  The poller retries with exponential
+    backoff and jitter, starting again from ``initial_delay`` when a new
+    resource is added.  The blocking S3 calls run in threads.  The time
+    spent waiting is recorded by `wait_for_message_resource`, in the
+    ``s3_wait`` stage of `stage_time`.
+
+    Parameters
+    ----------
+    initial_delay : `float`
+        First delay between checks, in seconds.
+    max_delay : `float`
+        Longest delay between checks, in seconds.
+    """
+
+    def __init__(self, initial_delay: float = 0.1, max_delay: float = 2.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._waiters: dict[str, dict[str, list[asyncio.Future]]] = dict()
+        self._delays: dict[str, float] = dict()
+        self._pollers: dict[str, asyncio.Task] = dict()
+
+    async def wait(self, resource: ResourcePath) -> None:
+        """Return when ``resource`` exists.
+
+        Parameters
+        ----------
+        resource : `ResourcePath`
+            The resource to wait for.
+        """
+        prefix = resource.dirname()
+        key = str(prefix)
+        name = resource.basename()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, dict()).setdefault(name, []).append(future)
+        self._delays[key] = self.initial_delay
+        if key not in self._pollers:
+            self._pollers[key] = asyncio.create_task(self._poll(prefix))
+
+        try:
+            await future
+        finally:
+            futures = self._waiters.get(key, dict()).get(name, [])
+            if future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self._waiters[key][name]
+
+    async def _poll(self, prefix: ResourcePath) -> None:
+        loop = asyncio.get_running_loop()
+        key = str(prefix)
+        try:
+            while self._waiters.get(key):
+                waiters = self._waiters[key]
+                try:
+                    found = await loop.run_in_executor(None, list_prefix, prefix, set(waiters))
+                except Exception:
+                    logger.exception(f"Exception while checking for resources in {key}")
+                    found = set()
+                for name in found:
+                    for future in waiters.pop(name, []):
+                        if not future.done():
+                            future.set_result(None)
+                if not waiters:
+                    break
+
+                delay = self._delays[key]
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                self._delays[key] = min(delay * 2, self.max_delay)
+        finally:
+            del self._pollers[key]
+            if not self._waiters.get(key):
+                self._waiters.pop(key, None)
+                self._delays.pop(key, None)
+
+
+class SchemaCache:
+    """Deserializer for Confluent wire-format Avro messages with a local
+    cache of writer schemas.
+
+    Schemas are kept in memory by schema ID and, if ``cache_dir`` is given,
+    on disk as JSON, so that a restart does not need the schema registry for
+    any schema seen before.  Deserialization time is recorded in a
+    histogram and logged every ``report_every`` messages.
+
+    Parameters
+    ----------
+    registry : `kafkit.registry.httpx.RegistryApi`
+        The schema registry, used for schemas not in the cache.
+    cache_dir : `str`, optional
+        Directory in which to persist the schemas.
+    report_every : `int`
+        Log a summary of the deserialization times after this many messages.
+    """
+
+    def __init__(
+        self,
+        registry: kafkit.registry.httpx.RegistryApi,
+        cache_dir: str | None = None,
+        report_every: int = 1000,
+    ):
+        self.registry = registry
+        self.cache_dir = cache_dir
+        self.report_every = report_every
+        self._schemas: dict[int, Any] = dict()
+        self.deserialize_time = REGISTRY.register(
+            Histogram(
+                "hinfo_deserialize_seconds",
+                "Time spent deserializing Kafka messages",
+                (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 0.1),
+            )
+        )
+
+    def _cache_path(self, schema_id: int) -> str:
+        assert self.cache_dir is not None
+        return os.path.join(self.cache_dir, f"{schema_id}.json")
+
+    def _add(self, schema_id: int, schema: dict[str, Any], persist: bool = True) -> Any:
+        parsed = fastavro.parse_schema(schema)
+        self._schemas[schema_id] = parsed
+        if persist and self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{self._cache_path(schema_id)}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(schema, f)
+                os.replace(tmp_path, self._cache_path(schema_id))
+            except OSError:
+                logger.exception(f"Unable to cache schema {schema_id} in {self.cache_dir}")
+        return parsed
+
+    async def prefetch(self, subject: str) -> None:
+        """Load the latest schema of a subject into the cache.
+
+        Parameters
+        ----------
+        subject : `str`
+            The registry subject, e.g. ``<topic>-value``.
+        """
+        try:
+            result = await self.registry.get_schema_by_subject(subject)
+        except Exception:
+            logger.exception(f"Unable to prefetch schema for {subject}")
+            return
+        self._add(result["id"], result["schema"])
+        logger.info(f"Prefetched schema {result['id']} for {subject}")
+
+    async def get(self, schema_id: int) -> Any:
+        """Return the parsed schema with the given ID.
+
+        Looks in memory, then on disk, then asks the registry.
+        """
+        if schema_id in self._schemas:
+            return self._schemas[schema_id]
+        if self.cache_dir and os.path.exists(self._cache_path(schema_id)):
+            with open(self._cache_path(schema_id)) as f:
+                return self._add(schema_id, json.load(f), persist=False)
+        schema = await self.registry.get_schema_by_id(schema_id)
+        return self._add(schema_id, schema)
+
+    async def deserialize(self, data: bytes) -> dict[str, Any]:
+        """Deserialize a message, as `kafkit.registry.Deserializer` does.
+
+        Parameters
+        ----------
+        data : `bytes`
+            The message value: a zero magic byte, the big-endian 4-byte
+            schema ID, then the Avro-encoded body.
+
+        Returns
+        -------
+        result : `dict` [ `str`, `Any` ]
+            The schema ``id`` and the decoded ``message``.
+        """
+        start = time.perf_counter()
+        if len(data) < 5 or data[0] != 0:
+            raise ValueError("Message is not in Confluent wire format")
+        schema_id = int.from_bytes(data[1:5], "big")
+        parsed = self._schemas.get(schema_id)
+        if parsed is None:
+            parsed = await self.get(schema_id)
+            # Exclude the registry round trip from the timing.
+            start = time.perf_counter()
+        message = fastavro.schemaless_reader(io.BytesIO(data[5:]), parsed)
+        self.deserialize_time.observe(time.perf_counter() - start)
+        if self.deserialize_time.count % self.report_every == 0:
+            logger.info(self.deserialize_time.summary())
+        return {"id": schema_id, "message": message}
+
+
+class InFlightLimiter:
+    """Limit the number of messages of each instrument handled at once.
+
+    Each message is handled in its own task, which waits for a slot of its
+    instrument, so an instrument that is saturated does not hold up the
+    messages of the others.  Once ``limit`` messages of an instrument are
+    waiting for a slot, the consumer's partitions of that instrument are
+    paused, and they are resumed as soon as one of them starts.
+
+    Parameters
+    ----------
+    limits : `dict` [ `str`, `int` ]
+        Maximum number of messages handled at once, by instrument name.
+    consumer : `aiokafka.AIOKafkaConsumer`, optional
+        Consumer whose partitions are paused while an instrument is
+        saturated.
+    topics : `dict` [ `str`, `str` ], optional
+        Instrument name by topic, used to find the partitions to pause.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, int],
+        consumer: aiokafka.AIOKafkaConsumer | None = None,
+        topics: dict[str, str] | None = None,
+    ):
+        self.limits = dict(limits)
+        self.consumer = consumer
+        self.topics = topics or dict()
+        self.tasks: set[asyncio.Task] = set()
+        self._slots = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+        self._waiting = dict.fromkeys(limits, 0)
+
+    def submit(self, name: str, func: Callable[..., Awaitable], *args: Any) -> asyncio.Task:
+        """Handle a message of instrument ``name`` in a new task.
+
+        Parameters
+        ----------
+        name : `str`
+            The instrument of the message.
+        func : `~collections.abc.Callable`
+            Coroutine function called with ``args`` once a slot is free.
+        *args
+            Arguments of ``func``.
+
+        Returns
+        -------
+        task : `asyncio.Task`
+            The task handling the message.
+        """
+        task = asyncio.create_task(self._run(name, func, *args))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _run(self, name: str, func: Callable[..., Awaitable], *args: Any) -> Any:
+        slot = self._slots[name]
+        if slot.locked():
+            self._waiting[name] += 1
+            if self._waiting[name] == self.limits[name]:
+                self._set_paused(name, True)
+            try:
+                await slot.acquire()
+            finally:
+                self._waiting[name] -= 1
+                if self._waiting[name] == self.limits[name] - 1:
+                    self._set_paused(name, False)
+        else:
+            await slot.acquire()
+        try:
+            return await func(*args)
+        finally:
+            slot.release()
+
+    def _set_paused(self, name: str, paused: bool) -> None:
+        if self.consumer is None:
+            return
+        partitions = [tp for tp in self.consumer.assignment() if self.topics.get(tp.topic) == name]
+        if paused:
+            logger.debug(f"Pausing {name} partitions with {self.limits[name]} messages waiting")
+            self.consumer.pause(*partitions)
+        else:
+            self.consumer.resume(*partitions)
+
+
 async def handle_message(
     message: dict[str, Any],
     instrument_dict: dict,
+    executor: concurrent.futures.Executor | None = None,
+    batch_writer: BatchWriter | None = None,
+    resource_waiter: ResourceWaiter | None = None,
+    retry_store: RetryStore | None = None,
 ) -> None:
     """Handles the received Kafka message.
 
@@ -894,6 +2543,82 @@ async def handle_message(
 
     instrument_dict : dict[str, Instrument]
         A dictionary mapping a controller type to its metadata.
+
+    executor : concurrent.futures.Executor, optional
+        Worker pool to run the processing in, so that it does not block
+        the event loop.  If None, the processing runs on the event loop.
+
+    batch_writer : BatchWriter, optional
+        If provided, the translated header is added to its current batch
+        instead of being written immediately.
+
+    resource_waiter : ResourceWaiter, optional
+        If provided, used to wait for the resource to appear, instead of
+        polling it individually with `wait_for_resource`.
+
+    retry_store : RetryStore, optional
+        If provided, a resource that times out or fails is recorded in it
+        to be retried later, and removed from it once it is written.
+    """
+    resource = resource_from_message(message)
+    url = str(resource)
+
+    try:
+        if batch_writer is not None:
+            record = await fetch_and_translate(resource, instrument_dict, executor, resource_waiter)
+            if record is not None and batch_writer.add(record):
+                # Flush in a thread of this process, even with a process pool.
+                batch_writer.requeue(await batch_writer.flush_async())
+            return
+
+        if async_engine is not None:
+            # Translate in the pool, then write without blocking the loop.
+            record = await fetch_and_translate(resource, instrument_dict, executor, resource_waiter)
+            if record is not None:
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(write_records, instrument_dict[record.controller], [record])
+                if retry_store is not None:
+                    await asyncio.to_thread(retry_store.remove, url)
+                log_committed(record)
+                observe_timings(record.timings)
+            return
+
+        await wait_for_message_resource(resource, resource_waiter)
+        loop = asyncio.get_running_loop()
+        if executor is None:
+            record = process_resource(resource, instrument_dict)
+        elif isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            observe_timings(await loop.run_in_executor(executor, process_in_worker, url))
+            record = None
+        else:
+            record = await loop.run_in_executor(executor, process_resource, resource, instrument_dict)
+        if record is not None:
+            observe_timings(record.timings)
+        if retry_store is not None:
+            await asyncio.to_thread(retry_store.remove, url)
+    except asyncio.TimeoutError as e:
+        logger.warning(f"Timeout reached while waiting for {url}. Skipping.")
+        if retry_store is not None:
+            await asyncio.to_thread(retry_store.record_failure, url, e)
+    except Exception as e:
+        logger.exception(f"Exception while handling {url}")
+        if retry_store is not None:
+            await asyncio.to_thread(retry_store.record_failure, url, e)
+        raise
+
+
+def resource_from_message(message: dict[str, Any]) -> ResourcePath:
+    """Return the S3 location of the header announced by a Kafka message.
+
+    Parameters
+    ----------
+    message : `dict` [ `str`, `Any` ]
+        The received Kafka message.
+
+    Returns
+    -------
+    resource : `ResourcePath`
+        The header resource.
     """
     url = message["url"]
     logger.info(f"Received Kafka message for resource: {url}")
@@ -902,36 +2627,389 @@ async def handle_message(
     url = re.sub(r"https://s3\.\w+\.lsst\.org/", "s3://", url)
     if bucket_prefix:
         url = re.sub(r"s3://", "s3://" + bucket_prefix, url)
-    resource = ResourcePath(url)
+    return ResourcePath(url)
+
+
+async def wait_for_message_resource(
+    resource: ResourcePath, resource_waiter: ResourceWaiter | None = None
+) -> None:
+    """Wait up to a minute for a header resource to appear.
+
+    Raises
+    ------
+    asyncio.TimeoutError
+        Raised if the resource does not appear in time.
+    """
+    with stage_time["s3_wait"].time():
+        if resource_waiter is None:
+            await asyncio.wait_for(wait_for_resource(resource), timeout=60)
+        else:
+            await asyncio.wait_for(resource_waiter.wait(resource), timeout=60)
+
+
+async def fetch_and_translate(
+    resource: ResourcePath,
+    instrument_dict: dict,
+    executor: concurrent.futures.Executor | None = None,
+    resource_waiter: ResourceWaiter | None = None,
+) -> HeaderRecord | None:
+    """Wait for a header resource and translate it, without writing it.
+
+    Parameters are as for `handle_message`.
+
+    Returns
+    -------
+    record : `HeaderRecord` or `None`
+        The translated rows, or None if the controller is not handled.
+    """
+    await wait_for_message_resource(resource, resource_waiter)
+    loop = asyncio.get_running_loop()
+    if executor is None:
+        return translate_resource(resource, instrument_dict)
+    elif isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return await loop.run_in_executor(executor, translate_in_worker, str(resource))
+    else:
+        return await loop.run_in_executor(executor, translate_resource, resource, instrument_dict)
+
+
+async def handle_batch(
+    msgs: list[aiokafka.ConsumerRecord],
+    deserializer: SchemaCache,
+    instrument_dict: dict,
+    batch_writer: BatchWriter,
+    retry_store: RetryStore,
+    executor: concurrent.futures.Executor | None = None,
+    resource_waiter: ResourceWaiter | None = None,
+) -> None:
+    """Ingest a batch of Kafka messages in one database transaction.
+
+    The messages are deserialized, and their headers fetched and
+    translated, concurrently.  The resulting rows are then written with
+    ``batch_writer``.  Headers that time out, fail to translate or fail to
+    be written are recorded in ``retry_store``; only once this returns
+    is every header of the batch either written or recorded there, so
+    that the offsets of the batch can be committed.
+
+    Parameters
+    ----------
+    msgs : `list` [ `aiokafka.ConsumerRecord` ]
+        The Kafka messages.
+    deserializer : `SchemaCache`
+        Deserializer for the message values.
+    instrument_dict : `dict` [ `str`, `Instrument` ]
+        A dictionary mapping a controller type to its metadata.
+    batch_writer : `BatchWriter`
+        Writer used to write the whole batch at once.  It must record
+        failed writes in ``retry_store``.
+    retry_store : `RetryStore`
+        Store in which headers that fail are recorded to be retried later.
+    executor : `concurrent.futures.Executor`, optional
+        Worker pool to translate the headers in.
+    resource_waiter : `ResourceWaiter`, optional
+        Used to wait for the resources to appear.
+
+    Raises
+    ------
+    Exception
+        Any exception raised while recording a failure in ``retry_store``
+        is propagated, so that the caller does not commit the offsets of
+        the batch.
+    """
+    if batch_writer.retry_store is not retry_store:
+        raise ValueError("The batch writer must record failed writes in the retry store")
+
+    messages = await asyncio.gather(*(deserializer.deserialize(msg.value) for msg in msgs))
+
+    async def translate_one(message: dict[str, Any]) -> HeaderRecord | None:
+        resource = resource_from_message(message["message"])
+        try:
+            return await fetch_and_translate(resource, instrument_dict, executor, resource_waiter)
+        except asyncio.TimeoutError as e:
+            logger.warning(f"Timeout reached while waiting for {resource}. Skipping.")
+            await asyncio.to_thread(retry_store.record_failure, str(resource), e)
+        except Exception as e:
+            logger.exception(f"Exception while handling {resource}")
+            await asyncio.to_thread(retry_store.record_failure, str(resource), e)
+        return None
+
+    records = [r for r in await asyncio.gather(*(translate_one(m) for m in messages)) if r is not None]
+    for record in records:
+        batch_writer.add(record)
+    # Records that could not be written, even all of them during a database
+    # outage, are scheduled for retry by the batch writer.
+    failed = await batch_writer.flush_async()
+    if failed:
+        logger.warning(f"Unable to write {len(failed)} of {len(records)} headers; scheduled for retry")
+
+
+async def consume_batches(
+    consumer: aiokafka.AIOKafkaConsumer,
+    topics: dict[str, str],
+    handle: Callable[[dict[str, list[aiokafka.ConsumerRecord]]], Awaitable],
+    max_records: int,
+    timeout_ms: int,
+    initial_backoff: float = 1.0,
+    max_backoff: float = 60.0,
+) -> None:
+    """Consume messages in batches, committing the offsets of each batch
+    once it has been handled.
+
+    If handling a batch raises, its offsets are not committed: the consumer
+    seeks back to the first message of the batch in each partition, and
+    the batch is handled again after an exponential backoff, from
+    ``initial_backoff`` up to ``max_backoff`` seconds.
+
+    Parameters
+    ----------
+    consumer : `aiokafka.AIOKafkaConsumer`
+        The started consumer, without auto-commit.
+    topics : `dict` [ `str`, `str` ]
+        Instrument name by topic.
+    handle : `~collections.abc.Callable`
+        Coroutine function called with the messages of a batch by
+        instrument name.
+    max_records : `int`
+        Maximum number of messages in a batch.
+    timeout_ms : `int`
+        Maximum time to wait for a batch, in milliseconds.
+    initial_backoff : `float`
+        First delay before a failed batch is handled again, in seconds.
+    max_backoff : `float`
+        Longest delay before a failed batch is handled again, in seconds.
+    """
+    backoff = initial_backoff
+    while True:
+        partitions = await consumer.getmany(timeout_ms=timeout_ms, max_records=max_records)
+        msgs_by_instrument: dict[str, list[aiokafka.ConsumerRecord]] = dict()
+        for partition, partition_msgs in partitions.items():
+            msgs_by_instrument.setdefault(topics[partition.topic], []).extend(partition_msgs)
+        if not msgs_by_instrument:
+            continue
+        try:
+            await handle(msgs_by_instrument)
+        except Exception:
+            logger.exception(f"Exception while handling a batch; handling it again in {backoff:.0f}s")
+            for partition, partition_msgs in partitions.items():
+                consumer.seek(partition, partition_msgs[0].offset)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+            continue
+        backoff = initial_backoff
+        await consumer.commit()
+
+
+def get_retry_store() -> RetryStore | None:
+    """Return the retry store configured by HINFO_RETRY_URL, if any."""
+    url = os.environ.get("HINFO_RETRY_URL")
+    if not url:
+        return None
+    return RetryStore(
+        url,
+        initial_delay=float(os.environ.get("HINFO_RETRY_INITIAL_DELAY", "60")),
+        max_attempts=int(os.environ.get("HINFO_RETRY_MAX_ATTEMPTS", "10")),
+    )
 
+
+def retry_url(
+    url: str, instrument_dicts: dict[str, dict], retry_store: RetryStore, update: bool = False
+) -> bool:
+    """Process a header again, updating its entry in the retry store.
+
+    Parameters
+    ----------
+    url : `str`
+        The header resource to process.
+    instrument_dicts : `dict` [ `str`, `dict` [ `str`, `Instrument` ] ]
+        Instrument dictionaries by instrument name.
+    retry_store : `RetryStore`
+        The store the header came from.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+
+    Returns
+    -------
+    success : `bool`
+        True if the header was processed and removed from the store.
+    """
+    resource = ResourcePath(url)
     try:
-        await asyncio.wait_for(wait_for_resource(resource), timeout=60)
-        process_resource(resource, instrument_dict)
-    except asyncio.TimeoutError:
-        logger.warning(f"Timeout reached while waiting for {url}. Skipping.")
-    except Exception:
-        logger.exception(f"Exception while handling {url}")
-        raise
+        if not resource.exists():
+            raise FileNotFoundError(f"{url} does not exist")
+        instrument_dict = instrument_dicts[instrument_for_url(url, instrument_dicts)]
+        process_resource(resource, instrument_dict, update)
+    except Exception as e:
+        logger.exception(f"Retry of {url} failed")
+        retry_store.record_failure(url, e)
+        return False
+    retry_store.remove(url)
+    return True
+
+
+async def retry_periodically(
+    retry_store: RetryStore, instrument_dicts: dict[str, dict], interval: float = 60.0, limit: int = 100
+) -> None:
+    """Retry the headers in ``retry_store`` as they become due.
+
+    Parameters
+    ----------
+    retry_store : `RetryStore`
+        The store of failed headers.
+    instrument_dicts : `dict` [ `str`, `dict` [ `str`, `Instrument` ] ]
+        Instrument dictionaries by instrument name.
+    interval : `float`
+        Time between checks for due headers, in seconds.
+    limit : `int`
+        Maximum number of headers retried per check.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            entries = await loop.run_in_executor(None, retry_store.due, limit)
+            for entry in entries:
+                logger.info(f"Retrying {entry.url} (attempt {entry.attempts + 1})")
+                await loop.run_in_executor(None, retry_url, entry.url, instrument_dicts, retry_store)
+        except Exception:
+            logger.exception("Exception while retrying failed headers")
+
+
+def drain_retries(retry_store: RetryStore, instrument_dicts: dict[str, dict], update: bool = False) -> None:
+    """Retry every header in ``retry_store`` now, including those that
+    are no longer scheduled.
+
+    Parameters
+    ----------
+    retry_store : `RetryStore`
+        The store of failed headers.
+    instrument_dicts : `dict` [ `str`, `dict` [ `str`, `Instrument` ] ]
+        Instrument dictionaries by instrument name.
+    update : `bool`
+        If True, update existing rows instead of skipping them.
+    """
+    entries = retry_store.entries()
+    succeeded = sum(retry_url(entry.url, instrument_dicts, retry_store, update) for entry in entries)
+    logger.info(f"Drained retry store: {succeeded} of {len(entries)} headers succeeded")
+
+
+async def flush_periodically(batch_writer: BatchWriter) -> None:
+    """Write the batch of ``batch_writer`` whenever it becomes due.
+
+    Parameters
+    ----------
+    batch_writer : `BatchWriter`
+        The batch writer to flush.
+    """
+    interval = batch_writer.max_age_ms / 1000 / 4
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if batch_writer.is_due():
+                batch_writer.requeue(await batch_writer.flush_async())
+        except Exception:
+            logger.exception("Exception while flushing batch")
+
+
+async def log_metrics_periodically(interval: float) -> None:
+    """Log a summary of the stage timings every ``interval`` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        for histogram in stage_time.values():
+            if histogram.count:
+                logger.info(histogram.summary())
 
 
 async def main() -> None:
-    """Handle Header Service largeFileObjectAvailable messages."""
+    """Handle Header Service largeFileObjectAvailable messages.
+
+    The messages of every instrument in ``instruments`` are consumed in
+    this process.  Each message is routed by its topic to the instrument's
+    dictionary, batch writer and concurrency limit; the database engine,
+    worker pool, S3 client, resource waiter and schema cache are shared.
+    """
     # global logger
-    # global instrument
+    # global instruments
     # global bucket_prefix
     # global TOPIC_MAPPING
+    global async_engine
+
+    if not instruments:
+        raise RuntimeError("No instrument configured: set INSTRUMENT or INSTRUMENTS")
+
+    if os.environ.get("HINFO_ASYNC_DB", "").lower() in ("1", "true", "yes"):
+        logger.info("Writing through an asyncpg engine")
+        async_engine = setup_async_postgres()
+
+    instrument_dicts = {name: get_instrument_dict(name) for name in instruments}
+    for instrument_dict in instrument_dicts.values():
+        warm_up(instrument_dict)
+    topics = {header_topic(name): name for name in instruments}
+
+    # At most `max_in_flight` messages of each instrument are handled at
+    # once; beyond that the instrument's partitions are paused until a
+    # handler finishes, without holding up the other instruments.
+    # HINFO_MAX_IN_FLIGHT_<INSTRUMENT> overrides the limit for one instrument.
+    worker_config = get_worker_config()
+    logger.info(f"{worker_config=}")
+    executor = make_executor(worker_config)
+    max_in_flight = {
+        name: int(os.environ.get(f"HINFO_MAX_IN_FLIGHT_{name.upper()}", worker_config.max_in_flight))
+        for name in instruments
+    }
 
-    handler_task_set = set()
-    instrument_dict = get_instrument_dict(instrument)
+    resource_waiter = ResourceWaiter()
+
+    metrics_port = os.environ.get("HINFO_METRICS_PORT")
+    if metrics_port:
+        metrics_server = start_http_server(int(metrics_port))
+    metrics_log_interval = float(os.environ.get("HINFO_METRICS_LOG_INTERVAL", "0"))
+    metrics_task = None
+    if metrics_log_interval > 0:
+        metrics_task = asyncio.create_task(log_metrics_periodically(metrics_log_interval))
 
-    topic = f"lsst.sal.{TOPIC_MAPPING[instrument]}.logevent_largeFileObjectAvailable"
+    retry_store = get_retry_store()
     kafka_config = get_kafka_config()
+    if kafka_config.batch_max_records > 0 and retry_store is None:
+        # Offsets are committed after each batch, so headers that fail must
+        # be kept in the retry store to be ingested at least once.
+        raise RuntimeError("KAFKA_BATCH_SIZE requires HINFO_RETRY_URL")
+    retry_task = None
+    if retry_store is not None:
+        retry_task = asyncio.create_task(retry_periodically(retry_store, instrument_dicts))
+
+    # Controllers are only unique within an instrument, so each instrument
+    # has its own batch writer.
+    batch_config = get_batch_config()
+    batch_writers: dict[str, BatchWriter | None] = {name: None for name in instruments}
+    flush_tasks = []
+    if kafka_config.batch_max_records > 0:
+        # Each Kafka batch is written at once, then its offsets committed.
+        logger.info(f"{kafka_config.batch_max_records=} {kafka_config.batch_timeout_ms=}")
+        for name in instruments:
+            batch_writers[name] = BatchWriter(
+                instrument_dicts[name],
+                kafka_config.batch_max_records,
+                kafka_config.batch_timeout_ms,
+                retry_store=retry_store,
+            )
+    elif batch_config.max_records > 1:
+        logger.info(f"{batch_config=}")
+        for name in instruments:
+            batch_writers[name] = BatchWriter(
+                instrument_dicts[name],
+                batch_config.max_records,
+                batch_config.max_age_ms,
+                retry_store=retry_store,
+            )
+            flush_tasks.append(asyncio.create_task(flush_periodically(batch_writers[name])))
+
     async with httpx.AsyncClient() as client:
         schema_registry = kafkit.registry.httpx.RegistryApi(http_client=client, url=kafka_config.schema_url)
-        deserializer = kafkit.registry.Deserializer(registry=schema_registry)
+        deserializer = SchemaCache(schema_registry, os.environ.get("HINFO_SCHEMA_CACHE_DIR"))
+        for topic in topics:
+            await deserializer.prefetch(f"{topic}-value")
 
         consumer = aiokafka.AIOKafkaConsumer(
-            topic,
+            *topics,
             bootstrap_servers=kafka_config.bootstrap,
             group_id=kafka_config.group_id,
             auto_offset_reset="earliest",
@@ -943,23 +3021,105 @@ async def main() -> None:
             session_timeout_ms=kafka_config.session_timeout_ms,
             heartbeat_interval_ms=kafka_config.heartbeat_interval_ms,
             max_poll_interval_ms=kafka_config.max_poll_interval_ms,
+            enable_auto_commit=kafka_config.batch_max_records == 0,
         )
 
+        limiter = InFlightLimiter(max_in_flight, consumer, topics)
         await consumer.start()
-        logger.info("Consumer started")
+        logger.info(f"Consumer started for {sorted(topics)}")
         try:
-            async for msg in consumer:
-                message = (await deserializer.deserialize(msg.value))["message"]
-                logger.debug(f"Received message {message}")
-                task = asyncio.create_task(handle_message(message, instrument_dict))
-                handler_task_set.add(task)
-                task.add_done_callback(handler_task_set.discard)
+            if kafka_config.batch_max_records > 0:
+
+                async def handle_batches(
+                    msgs_by_instrument: dict[str, list[aiokafka.ConsumerRecord]],
+                ) -> None:
+                    await asyncio.gather(
+                        *(
+                            handle_batch(
+                                msgs,
+                                deserializer,
+                                instrument_dicts[name],
+                                batch_writers[name],
+                                retry_store,
+                                executor,
+                                resource_waiter,
+                            )
+                            for name, msgs in msgs_by_instrument.items()
+                        )
+                    )
+
+                await consume_batches(
+                    consumer,
+                    topics,
+                    handle_batches,
+                    kafka_config.batch_max_records,
+                    kafka_config.batch_timeout_ms,
+                )
+            else:
+                async for msg in consumer:
+                    name = topics[msg.topic]
+                    message = (await deserializer.deserialize(msg.value))["message"]
+                    logger.debug(f"Received {name} message {message}")
+                    limiter.submit(
+                        name,
+                        handle_message,
+                        message,
+                        instrument_dicts[name],
+                        executor,
+                        batch_writers[name],
+                        resource_waiter,
+                        retry_store,
+                    )
         finally:
             await consumer.stop()
 
-    while handler_task_set:
+    while limiter.tasks:
         logger.debug("Waiting for background tasks to finish...")
         await asyncio.sleep(5)
+    for flush_task in flush_tasks:
+        flush_task.cancel()
+    if flush_tasks:
+        for batch_writer in batch_writers.values():
+            finish_batches(batch_writer)
+    if retry_task is not None:
+        retry_task.cancel()
+    if metrics_task is not None:
+        metrics_task.cancel()
+    if metrics_port:
+        metrics_server.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    executor.shutdown()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Ingest Header Service headers; with no arguments, consume them from Kafka."
+    )
+    parser.add_argument("path", nargs="?", help="Local yaml file or directory of yaml files to ingest.")
+    parser.add_argument("--day-obs", help="Ingest all headers from S3 for this day, as YYYY-MM-DD.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of worker processes for a parallel backfill; default is 0 (serial).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of headers written per transaction in a parallel backfill.",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Progress manifest for a parallel backfill; completed headers are skipped on rerun.",
+    )
+    parser.add_argument(
+        "--drain-retries",
+        action="store_true",
+        help="Retry every header in the retry store given by HINFO_RETRY_URL, then exit.",
+    )
+    return parser.parse_args()
 
 
 def parse_columns_to_update(env_name: str, required_columns: list[str]) -> list[str] | None:
@@ -974,7 +3134,6 @@ def parse_columns_to_update(env_name: str, required_columns: list[str]) -> list[
 
 if __name__ == "__main__":
     import os
-    import sys
 
     exp_columns_to_update = parse_columns_to_update(
         "EXP_COLUMNS_TO_UPDATE",
@@ -999,7 +3158,36 @@ if __name__ == "__main__":
     )
 
     engine = setup_postgres()
-    if len(sys.argv) > 1:
-        process_local_path(sys.argv[1])
+    args = parse_args()
+    update = exp_columns_to_update is not None
+    if args.drain_retries:
+        retry_store = get_retry_store()
+        if retry_store is None:
+            raise RuntimeError("--drain-retries requires HINFO_RETRY_URL")
+        drain_retries(retry_store, {name: get_instrument_dict(name) for name in instruments}, update)
+    elif args.workers > 0:
+        backfill(
+            list_header_urls(args.path, args.day_obs),
+            args.workers,
+            args.batch_size,
+            args.manifest,
+            update,
+        )
+    elif args.path is not None or args.day_obs is not None:
+        batch_config = get_batch_config()
+        batch_writer = None
+        if batch_config.max_records > 1:
+            batch_writer = BatchWriter(
+                get_instrument_dict(instrument),
+                batch_config.max_records,
+                batch_config.max_age_ms,
+                update,
+            )
+        if args.path is not None:
+            process_local_path(args.path, batch_writer)
+        if args.day_obs is not None:
+            process_date(args.day_obs, get_instrument_dict(instrument), update, batch_writer)
     else:
         asyncio.run(main())
+    if update:
+        log_update_counters()
@@ -0,0 +1,278 @@
+# This file is part of consdb.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Lightweight in-process metrics for consdb services.
+"""
+import bisect
+import contextlib
+import http.server
+import logging
+import threading
+import time
+from typing import Iterator, Union
+
+__all__ = ["Counter", "Histogram", "Registry", "REGISTRY", "DEFAULT_BUCKETS", "start_http_server"]
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds, in seconds, suitable for latencies from milliseconds to
+# a minute.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """A monotonically increasing count.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the metric.
+    description : `str`
+        Human-readable description of the metric.
+    labels : `dict` [ `str`, `str` ], optional
+        Constant labels distinguishing this metric from others of the same
+        name.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: dict[str, str] | None = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or dict()
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        """Increase the count.
+
+        Parameters
+        ----------
+        amount : `int`
+            Amount to add; must not be negative.
+        """
+        if amount < 0:
+            raise ValueError(f"Counter {self.name} cannot be decreased")
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Yield the (name, labels, value) samples of the metric."""
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """A histogram of observed values with fixed bucket upper bounds.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the metric.
+    description : `str`
+        Human-readable description of the metric.
+    buckets : `tuple` [ `float`, ... ]
+        Upper bounds of the buckets.  Values above the largest bound are
+        counted in an implicit overflow bucket.
+    labels : `dict` [ `str`, `str` ], optional
+        Constant labels distinguishing this metric from others of the same
+        name.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        labels: dict[str, str] | None = None,
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.labels = labels or dict()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard all observations."""
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record one observation.
+
+        Parameters
+        ----------
+        value : `float`
+            The observed value.
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the time taken by the body of a ``with`` statement."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Yield the (name, labels, value) samples of the metric, in the
+        Prometheus layout of cumulative buckets, sum and count."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            yield f"{self.name}_bucket", {**self.labels, "le": le}, cumulative
+        yield f"{self.name}_sum", self.labels, total
+        yield f"{self.name}_count", self.labels, cumulative
+
+    def quantile(self, q: float) -> float:
+        """Return an upper bound for the ``q`` quantile of the observations.
+
+        Parameters
+        ----------
+        q : `float`
+            Quantile, between 0 and 1.
+
+        Returns
+        -------
+        bound : `float`
+            Upper bound of the bucket containing the quantile, or the
+            largest observation if it falls in the overflow bucket.
+        """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            target = q * self.count
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= target:
+                    return min(bound, self.max)
+            return self.max
+
+    def summary(self) -> str:
+        """Return a one-line summary of the observations."""
+        mean = self.sum / self.count if self.count else 0.0
+        labels = "".join(f" {key}={value}" for key, value in self.labels.items())
+        return (
+            f"{self.name}{labels}: count={self.count} mean={mean:.4g} p50<={self.quantile(0.5):.4g} "
+            f"p95<={self.quantile(0.95):.4g} p99<={self.quantile(0.99):.4g} max={self.max:.4g}"
+        )
+
+
+Metric = Union[Counter, Histogram]
+
+
+class Registry:
+    """A collection of metrics, rendered together for scraping."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: dict[tuple[str, tuple[tuple[str, str], ...]], Metric] = dict()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, replacing any with the same name and labels.
+
+        Returns
+        -------
+        metric : `Counter` or `Histogram`
+            The metric, for convenience.
+        """
+        with self._lock:
+            self._metrics[(metric.name, tuple(sorted(metric.labels.items())))] = metric
+        return metric
+
+    def metrics(self) -> list[Metric]:
+        """Return the registered metrics, sorted by name."""
+        with self._lock:
+            return [self._metrics[key] for key in sorted(self._metrics)]
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for metric in self.metrics():
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+"""The default registry."""
+
+
+def start_http_server(port: int, registry: Registry = REGISTRY) -> http.server.ThreadingHTTPServer:
+    """Serve ``registry`` at ``/metrics`` from a daemon thread.
+
+    Parameters
+    ----------
+    port : `int`
+        Port to listen on, on all interfaces.
+    registry : `Registry`
+        The metrics to serve.
+
+    Returns
+    -------
+    server : `http.server.ThreadingHTTPServer`
+        The server; call its ``shutdown`` method to stop it.
+    """
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            logger.debug(format % args)
+
+    server = http.server.ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
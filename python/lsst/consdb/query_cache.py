@@ -0,0 +1,256 @@
+# This file is part of consdb.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-process cache of read-only query results.
+"""
+import math
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable
+
+__all__ = ["ANY_TABLE", "QueryCache", "is_read_only", "normalize_sql", "referenced_tables"]
+
+
+ANY_TABLE = "*"
+"""Tag of entries that may read any table, invalidated by every write."""
+
+# Quoted strings and identifiers, which normalization leaves alone.
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+# Queries that only read: a single SELECT, VALUES, TABLE or WITH statement,
+# after any leading comments and parentheses...
+_READ_QUERY_RE = re.compile(r"^(?:\s+|--[^\n]*\n|/\*.*?\*/|\()*(?:SELECT|VALUES|TABLE|WITH)\b", re.I | re.S)
+
+# ...that does not write, lock rows, or call functions with side effects.
+# Other pg_* and lo_* functions, such as pg_size_pretty or lo_get, only read.
+_WRITE_RE = re.compile(
+    r"\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|INTO|FOR\s+(?:NO\s+KEY\s+)?UPDATE|FOR\s+(?:KEY\s+)?SHARE"
+    r"|nextval|setval|dblink\w*|set_config"
+    r"|lo_(?:import|export|unlink|creat|create|open|write|put|truncate\w*|from_bytea)"
+    r"|pg_(?:sleep\w*|(?:try_)?advisory\w*|notify|logical_emit_message|cancel_backend|terminate_backend"
+    r"|reload_conf|rotate_logfile|promote|switch_wal|create_\w+|drop_\w+|replication_\w+|stat_reset\w*"
+    r"|backup_\w+|start_backup|stop_backup|wal_replay_\w+|export_snapshot|import_system_collations"
+    r"|log_backend_memory_contexts|file_write|file_rename|file_unlink|current_xact_id))\b",
+    re.I,
+)
+
+# Schema-qualified relation names, possibly quoted.
+_QUALIFIED_NAME_RE = re.compile(r'"?(\w+)"?\s*\.\s*"?(\w+)"?')
+
+
+def normalize_sql(query: str) -> str:
+    """Return ``query`` with whitespace outside quotes collapsed and any
+    trailing semicolons removed, so that trivially different spellings of
+    a query share a cache entry."""
+    parts = _QUOTED_RE.split(query.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+
+def is_read_only(query: str) -> bool:
+    """Return True if ``query`` can be recognized as a single statement
+    that only reads from the database.
+
+    The check is conservative: queries it cannot vouch for, including any
+    that mention a writing keyword, are treated as writes.
+    """
+    if not _READ_QUERY_RE.match(query):
+        return False
+    # Strip quoted text, so that literals cannot hide a second statement.
+    unquoted = _QUOTED_RE.sub("''", query).strip().rstrip(";")
+    return ";" not in unquoted and not _WRITE_RE.search(unquoted)
+
+
+def referenced_tables(query: str) -> set[str]:
+    """Return the schema-qualified relations a query may read.
+
+    Every ``schema.name`` pair is taken, which can include some that are
+    not relations (e.g. ``alias.column``); these only cause extra, harmless
+    tags.  A query naming no qualified relation may read anything on the
+    search path, so it is tagged with `ANY_TABLE`.
+    """
+    tables = {f"{schema}.{name}".lower() for schema, name in _QUALIFIED_NAME_RE.findall(query)}
+    if not any(table.startswith(("cdb_", "efd_")) for table in tables):
+        tables.add(ANY_TABLE)
+    return tables
+
+
+def _estimate_size(value: Any, limit: float = math.inf) -> int:
+    """Return an estimate of the memory used by a result, in bytes.
+
+    The estimate stops as soon as it exceeds ``limit``, so that results too
+    large to cache are not walked in full; it is then only a lower bound.
+    """
+    size = 0
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        size += sys.getsizeof(item)
+        if size > limit:
+            break
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+    return size
+
+
+@dataclass
+class _Entry:
+    value: Any
+    tables: frozenset[str]
+    size: int
+    expires: float
+
+
+class QueryCache:
+    """A least-recently-used cache of query results, bounded in memory.
+
+    Entries expire ``ttl`` seconds after they are stored, and are dropped
+    earlier when a table they read is written.  Writes made by other
+    processes, such as ``hinfo``, are only seen once entries expire.
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        Approximate maximum memory used by cached results.
+    ttl : `float`
+        Lifetime of an entry, in seconds; zero or less disables the cache.
+    view_tables : `dict` [ `str`, `set` [ `str` ] ], optional
+        Tables read by each view, so that a write to a table also
+        invalidates queries of the views over it.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, view_tables: dict[str, set[str]] | None = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.view_tables = view_tables or dict()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether results are cached at all."""
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached result for ``key``, or None.
+
+        Parameters
+        ----------
+        key : `~collections.abc.Hashable`
+            Key of the result, e.g. normalized SQL and parameters.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, value: Any, tables: Iterable[str]) -> None:
+        """Store a result.
+
+        Results larger than the whole cache are not stored.
+
+        Parameters
+        ----------
+        key : `~collections.abc.Hashable`
+            Key of the result.
+        value : `Any`
+            The result; it must not be modified afterwards.
+        tables : `~collections.abc.Iterable` [ `str` ]
+            Schema-qualified names of the tables or views read.
+        """
+        if not self.enabled:
+            return
+        tables = set(tables)
+        for table in list(tables):
+            tables.update(self.view_tables.get(table, ()))
+        size = _estimate_size(value, self.max_bytes)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, frozenset(tables), size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tables: str) -> None:
+        """Drop the entries that read any of ``tables``.
+
+        Parameters
+        ----------
+        *tables : `str`
+            Schema-qualified names of the tables written.
+        """
+        written = {table.lower() for table in tables} | {ANY_TABLE}
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if not written.isdisjoint(entry.tables)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after a write to unknown tables."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int | float | bool]:
+        """Return counters describing the use of the cache."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
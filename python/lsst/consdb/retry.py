@@ -0,0 +1,189 @@
+# This file is part of consdb.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent store of failed work items to be retried.
+"""
+import logging
+import time
+from dataclasses import dataclass
+
+import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
+
+__all__ = ["RetryEntry", "RetryStore"]
+
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+"""INSERT constructs supporting ``ON CONFLICT`` by dialect name."""
+
+
+@dataclass(frozen=True)
+class RetryEntry:
+    """A failed item and its retry state."""
+
+    url: str
+    error_class: str
+    error_message: str
+    attempts: int
+    first_failed: float
+    last_failed: float
+    next_attempt: float | None
+    """Time of the next retry, or None once the item has been given up on
+    (a dead letter)."""
+
+
+class RetryStore:
+    """A table of failed URLs, retried with exponential backoff.
+
+    Each failure of a URL increments its attempt count and schedules the
+    next attempt ``initial_delay * 2 ** (attempts - 1)`` seconds later, up to
+    ``max_delay``.  After ``max_attempts`` failures the URL is no longer
+    scheduled but stays in the table until it is drained or removed.
+
+    Parameters
+    ----------
+    url : `str`
+        SQLAlchemy URL of the PostgreSQL or SQLite database holding the
+        table, e.g. ``sqlite:////data/hinfo_retry.sqlite3``.
+    table_name : `str`
+        Name of the table; created if it does not exist.
+    initial_delay : `float`
+        Delay before the first retry, in seconds.
+    max_delay : `float`
+        Maximum delay between retries, in seconds.
+    max_attempts : `int`
+        Number of failures after which a URL is no longer retried
+        automatically.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        table_name: str = "hinfo_retry",
+        initial_delay: float = 60.0,
+        max_delay: float = 86400.0,
+        max_attempts: int = 10,
+    ):
+        self.engine = sqlalchemy.create_engine(url, pool_pre_ping=True)
+        try:
+            self._insert = _UPSERT_INSERTS[self.engine.dialect.name]
+        except KeyError:
+            raise ValueError(f"Unsupported retry store database: {url}") from None
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        metadata = sqlalchemy.MetaData()
+        self.table = sqlalchemy.Table(
+            table_name,
+            metadata,
+            sqlalchemy.Column("url", sqlalchemy.String(1024), primary_key=True),
+            sqlalchemy.Column("error_class", sqlalchemy.String(256), nullable=False),
+            sqlalchemy.Column("error_message", sqlalchemy.Text, nullable=False),
+            sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False),
+            sqlalchemy.Column("first_failed", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Column("last_failed", sqlalchemy.Float, nullable=False),
+            sqlalchemy.Column("next_attempt", sqlalchemy.Float, nullable=True, index=True),
+        )
+        metadata.create_all(self.engine)
+
+    def _delay(self, attempts: int) -> float:
+        return min(self.initial_delay * 2 ** (attempts - 1), self.max_delay)
+
+    def record_failure(self, url: str, error: BaseException | str) -> RetryEntry:
+        """Record a failure of ``url`` and schedule its next attempt.
+
+        Parameters
+        ----------
+        url : `str`
+            The URL that failed.
+        error : `BaseException` or `str`
+            The exception raised, or a description of the failure.
+
+        Returns
+        -------
+        entry : `RetryEntry`
+            The updated retry state.
+        """
+        if isinstance(error, BaseException):
+            error_class = type(error).__name__
+            error_message = str(error)
+        else:
+            error_class = "Failure"
+            error_message = error
+        now = time.time()
+        values = dict(error_class=error_class, error_message=error_message, last_failed=now)
+        stmt = self._insert(self.table).values(url=url, attempts=1, first_failed=now, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.table.c.url], set_=dict(attempts=self.table.c.attempts + 1, **values)
+        ).returning(self.table.c.attempts, self.table.c.first_failed)
+        with self.engine.begin() as conn:
+            # The upserted row stays locked until the end of the transaction,
+            # so a concurrent failure of the same URL cannot be lost.
+            attempts, first_failed = conn.execute(stmt).one()
+            next_attempt = now + self._delay(attempts) if attempts < self.max_attempts else None
+            conn.execute(self.table.update().where(self.table.c.url == url).values(next_attempt=next_attempt))
+        if next_attempt is None:
+            logger.error(f"Giving up on {url} after {attempts} attempts: {error_class}: {error_message}")
+        else:
+            logger.warning(f"Will retry {url} (attempt {attempts}) in {next_attempt - now:.0f}s")
+        return RetryEntry(url, error_class, error_message, attempts, first_failed, now, next_attempt)
+
+    def remove(self, *urls: str) -> None:
+        """Forget URLs, typically after they have succeeded.
+
+        Parameters
+        ----------
+        *urls : `str`
+            The URLs to remove; those not present are ignored.
+        """
+        if not urls:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.url.in_(urls)))
+
+    def due(self, limit: int = 100, now: float | None = None) -> list[RetryEntry]:
+        """Return URLs whose next attempt is due, oldest first.
+
+        Parameters
+        ----------
+        limit : `int`
+            Maximum number of entries to return.
+        now : `float`, optional
+            Current time; defaults to `time.time`.
+        """
+        now = time.time() if now is None else now
+        stmt = (
+            sqlalchemy.select(self.table)
+            .where(self.table.c.next_attempt <= now)
+            .order_by(self.table.c.next_attempt)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            return [RetryEntry(**row._mapping) for row in conn.execute(stmt)]
+
+    def entries(self) -> list[RetryEntry]:
+        """Return every entry, including those no longer retried."""
+        stmt = sqlalchemy.select(self.table).order_by(self.table.c.first_failed)
+        with self.engine.connect() as conn:
+            return [RetryEntry(**row._mapping) for row in conn.execute(stmt)]
@@ -43,6 +43,7 @@ from lsst.consdb.transformed_efd.dao.influxdb import InfluxDbDao
 from lsst.consdb.transformed_efd.failure_monitor import FailureMonitor
 from lsst.consdb.transformed_efd.queue_manager import QueueManager
 from lsst.consdb.transformed_efd.transform import Transform
+from lsst.consdb.utils import warm_up_astropy
 from lsst.daf.butler import Butler
 
 
@@ -470,6 +471,13 @@ async def main() -> None:
         if args.mode == "job" and args.failure_monitor:
             raise ValueError("--failure-monitor is only supported with --mode cronjob")
 
+        # Load the IERS tables before the first time scale conversion
+        try:
+            log.info("event=astropy_warm_up elapsed_s=%.3f", warm_up_astropy())
+        except Exception as e:
+            # Not fatal: the same work will be retried by the first conversion.
+            log.warning("event=astropy_warm_up_failed error=%s", e)
+
         # Initialize core components
         butler = Butler(args.repo)
         efd = InfluxDbDao(args.efd_conn_str, logger=log, max_fields_per_query=100)
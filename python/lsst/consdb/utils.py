@@ -26,38 +26,90 @@ import logging
 import os
 import re
 import sys
+import time
+from typing import TYPE_CHECKING
 
 import sqlalchemy
 
-__all__ = ["setup_postgres", "setup_logging"]
+if TYPE_CHECKING:
+    from astropy.coordinates import EarthLocation  # type: ignore
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+__all__ = ["setup_postgres", "setup_async_postgres", "setup_logging", "warm_up_astropy"]
 
 
 logger = logging.getLogger(__name__)
 
 
-def setup_postgres() -> sqlalchemy.Engine:
-    """Set up a SQLAlchemy Engine to talk to Postgres.
+def get_postgres_url(driver: str | None = None) -> str:
+    """Return the database URL configured by environment variables.
 
-    Uses environment variables to get connection information, with an internal
-    default.
+    Parameters
+    ----------
+    driver : `str`, optional
+        DBAPI driver to use with a PostgreSQL URL, e.g. "asyncpg".
 
     Returns
     -------
-    engine: ``sqlalchemy.Engine``
-        A SQLAlchemy Engine.
+    url : `str`
+        The SQLAlchemy URL.
     """
     host = os.environ.get("DB_HOST")
     passwd = os.environ.get("DB_PASS")
     user = os.environ.get("DB_USER")
     dbname = os.environ.get("DB_NAME")
-    pg_url = ""
     if host and passwd and user and dbname:
         logger.info(f"Connecting to {host} as {user} to {dbname}")
-        pg_url = f"postgresql://{user}:{passwd}@{host}/{dbname}"
-    else:
-        pg_url = os.environ["POSTGRES_URL"]
-        logger.info(f"Using POSTGRES_URL {pg_url}")
-    engine = sqlalchemy.create_engine(pg_url, pool_pre_ping=True)
+        scheme = f"postgresql+{driver}" if driver else "postgresql"
+        return f"{scheme}://{user}:{passwd}@{host}/{dbname}"
+
+    pg_url = os.environ["POSTGRES_URL"]
+    logger.info(f"Using POSTGRES_URL {pg_url}")
+    if driver:
+        pg_url = re.sub(r"^postgresql(\+\w+)?://", f"postgresql+{driver}://", pg_url)
+    return pg_url
+
+
+def get_pool_args(pg_url: str) -> dict:
+    """Return the connection pool arguments configured by environment
+    variables, for `sqlalchemy.create_engine`."""
+    kwargs: dict = dict(
+        pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() not in ("0", "false")
+    )
+    if not pg_url.startswith("sqlite"):
+        for env_name, arg in (
+            ("DB_POOL_SIZE", "pool_size"),
+            ("DB_MAX_OVERFLOW", "max_overflow"),
+            ("DB_POOL_RECYCLE", "pool_recycle"),
+        ):
+            if os.environ.get(env_name):
+                kwargs[arg] = int(os.environ[env_name])
+    return kwargs
+
+
+def setup_postgres() -> sqlalchemy.Engine:
+    """Set up a SQLAlchemy Engine to talk to Postgres.
+
+    Uses environment variables to get connection information, with an internal
+    default.
+
+    The connection pool may be tuned with DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE (seconds) and DB_POOL_PRE_PING ("false" skips the
+    liveness check on each checkout).  DB_DRIVER selects the DBAPI driver
+    (e.g. "psycopg" for psycopg 3), and DB_PREPARE_THRESHOLD sets the
+    number of executions after which psycopg 3 prepares a statement on the
+    server.
+
+    Returns
+    -------
+    engine: ``sqlalchemy.Engine``
+        A SQLAlchemy Engine.
+    """
+    pg_url = get_postgres_url(os.environ.get("DB_DRIVER"))
+    kwargs = get_pool_args(pg_url)
+    if os.environ.get("DB_PREPARE_THRESHOLD") and pg_url.startswith("postgresql+psycopg:"):
+        kwargs["connect_args"] = {"prepare_threshold": int(os.environ["DB_PREPARE_THRESHOLD"])}
+    engine = sqlalchemy.create_engine(pg_url, **kwargs)
     if pg_url.startswith("sqlite:///"):
         # For unit tests
         start_pos = len("sqlite:///")
@@ -77,6 +129,23 @@ def setup_postgres() -> sqlalchemy.Engine:
     return engine
 
 
+def setup_async_postgres() -> "AsyncEngine":
+    """Set up an asyncio SQLAlchemy engine to talk to Postgres via asyncpg.
+
+    Uses the same environment variables as `setup_postgres`, except that
+    the driver is always asyncpg.
+
+    Returns
+    -------
+    engine: ``sqlalchemy.ext.asyncio.AsyncEngine``
+        A SQLAlchemy AsyncEngine.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    pg_url = get_postgres_url("asyncpg")
+    return create_async_engine(pg_url, **get_pool_args(pg_url))
+
+
 def setup_logging(module: str) -> logging.Logger:
     """Set up logging for a service.
 
@@ -117,3 +186,54 @@ def setup_logging(module: str) -> logging.Logger:
             logging.getLogger(component).setLevel(level)
 
     return logger
+
+
+def warm_up_astropy(location: "EarthLocation | None" = None) -> float:
+    """Load astropy's lazily-initialized state before the first message.
+
+    Time scale conversions and coordinate transforms load the IERS tables
+    on first use, and may try to download them.  Doing that at startup
+    keeps the latency spike, or the failure on a network without outside
+    access, away from the first real message.
+
+    The IERS_A_PATH environment variable may name a local IERS-A file to
+    use instead of downloading one.  If IERS_AUTO_DOWNLOAD is set, it
+    overrides astropy's ``iers.conf.auto_download`` ("0" or "false"
+    disables downloads and falls back to the bundled IERS-B table).  The
+    UT1 conversion is only primed if a local table is given or downloads
+    are allowed.
+
+    Parameters
+    ----------
+    location : `~astropy.coordinates.EarthLocation`, optional
+        If given, an AltAz transform at this location is also primed.
+
+    Returns
+    -------
+    elapsed : `float`
+        The time taken, in seconds.
+    """
+    import astropy.units as u  # type: ignore
+    from astropy.coordinates import AltAz, SkyCoord  # type: ignore
+    from astropy.time import Time  # type: ignore
+    from astropy.utils import iers  # type: ignore
+
+    start = time.perf_counter()
+    auto_download = os.environ.get("IERS_AUTO_DOWNLOAD")
+    if auto_download is not None:
+        iers.conf.auto_download = auto_download.lower() not in ("0", "false", "no")
+    iers_path = os.environ.get("IERS_A_PATH")
+    if iers_path:
+        logger.info(f"Using IERS-A table {iers_path}")
+        iers.earth_orientation_table.set(iers.IERS_A.open(iers_path))
+
+    now = Time.now()
+    # TDB loads the ERFA ephemeris.  UT1 needs the earth orientation table,
+    # which is only touched if it is local or may be downloaded.
+    _ = now.tdb
+    if iers_path or iers.conf.auto_download:
+        _ = now.ut1
+    if location is not None:
+        frame = AltAz(obstime=now, location=location)
+        SkyCoord(ra=0.0 * u.deg, dec=0.0 * u.deg, frame="icrs").transform_to(frame)
+    return time.perf_counter() - start
@@ -1,6 +1,16 @@
+import asyncio
+import concurrent.futures
+import copy
+import io
 import os
+import threading
+import types
 from pathlib import Path
 
+import aiokafka
+import fastavro
+import lsst.geom
+import lsst.obs.lsst
 import lsst.utils
 import pytest
 import sqlalchemy as sa
@@ -10,6 +20,8 @@ from felis.db.utils import DatabaseContext
 from felis.metadata import MetaDataBuilder
 from felis.tests.postgresql import setup_postgres_test_db
 from lsst.consdb import hinfo
+from lsst.consdb.retry import RetryStore
+from lsst.consdb.utils import setup_async_postgres, setup_postgres
 from lsst.resources import ResourcePath
 from sqlalchemy import MetaData, select
 
@@ -67,3 +79,596 @@ def test_process_resource(pg_engine):
     assert _header_lookup(header, "VIGN_MIN") == row.vignette_min
     assert _header_lookup(header, "DOMEAZ") == row.dome_azimuth
     assert _header_lookup(header, "OBSANNOT") == row.scheduler_note
+
+
+def test_batch_writer_isolates_failures(pg_engine):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    record = hinfo.translate_resource(ResourcePath(yaml_path), instrument_dict)
+
+    # A second record that cannot be inserted: key columns are required.
+    bad_record = copy.deepcopy(record)
+    bad_record.exposure_rec["exposure_id"] = None
+    bad_record.exposure_rec["day_obs"] = None
+    bad_record.det_exposure_recs = []
+
+    batch_writer = hinfo.BatchWriter(instrument_dict, max_records=10, max_age_ms=1000, max_attempts=2)
+    assert not batch_writer.add(record)
+    assert not batch_writer.add(bad_record)
+    failed = batch_writer.flush()
+    assert failed == [bad_record]
+
+    # Failed records are written again, up to max_attempts times.
+    batch_writer.requeue(failed)
+    assert batch_writer.flush() == [bad_record]
+    batch_writer.requeue([bad_record])
+    assert batch_writer.flush() == []
+
+    metadata_obj = MetaData(schema="cdb_latiss")
+    exposure_table = sa.Table("exposure", metadata_obj, autoload_with=pg_engine)
+    ccdexposure_table = sa.Table("ccdexposure", metadata_obj, autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        exposure_rows = conn.execute(select(exposure_table)).all()
+        ccdexposure_rows = conn.execute(select(ccdexposure_table)).all()
+
+    assert len(exposure_rows) == 1
+    assert exposure_rows[0].exposure_id == record.exposure_rec["exposure_id"]
+    assert len(ccdexposure_rows) == len(record.det_exposure_recs)
+
+
+def test_process_local_path_batches_and_retries(pg_engine, tmp_path):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    record = hinfo.translate_resource(ResourcePath(yaml_path), instrument_dict)
+    bad_record = copy.deepcopy(record)
+    bad_record.exposure_rec["exposure_id"] = None
+    bad_record.exposure_rec["day_obs"] = None
+
+    # A failed record is written again until it is given up on.
+    batch_writer = hinfo.BatchWriter(instrument_dict, max_records=10, max_age_ms=1000, max_attempts=3)
+    batch_writer.add(bad_record)
+    assert batch_writer.flush_all() == [bad_record]
+    assert bad_record.write_attempts == 3
+
+    # A single file goes through the batch writer too.
+    local_path = tmp_path / yaml_path.name
+    local_path.write_bytes(yaml_path.read_bytes())
+    hinfo.process_local_path(str(local_path), batch_writer)
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert conn.execute(select(exposure_table.c.exposure_id)).scalars().all() == [
+            record.exposure_rec["exposure_id"]
+        ]
+
+
+def test_backfill_resume_skip_and_failure(pg_engine, tmp_path, monkeypatch):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    good_path = tmp_path / yaml_path.name
+    good_path.write_bytes(yaml_path.read_bytes())
+    # A header of a controller without a mapping has nothing to write.
+    skipped_path = tmp_path / yaml_path.name.replace("_O_", "_Z_")
+    skipped_path.write_text(
+        yaml_path.read_text().replace(
+            "value: O\n  comment: The controller", "value: Z\n  comment: The controller"
+        )
+    )
+    good, skipped, missing = (
+        str(ResourcePath(p)) for p in (good_path, skipped_path, tmp_path / "missing.yaml")
+    )
+
+    # Translate in threads of this process, which share its configuration.
+    monkeypatch.setattr(
+        hinfo,
+        "make_executor",
+        lambda worker_config: concurrent.futures.ThreadPoolExecutor(worker_config.workers),
+    )
+    monkeypatch.setitem(hinfo.worker_instrument_dicts, "LATISS", hinfo.get_instrument_dict("LATISS"))
+    translated = []
+    translate_in_worker = hinfo.translate_in_worker
+
+    def spy(url):
+        translated.append(url)
+        return translate_in_worker(url)
+
+    monkeypatch.setattr(hinfo, "translate_in_worker", spy)
+
+    manifest_path = tmp_path / "manifest.txt"
+    hinfo.backfill([good, skipped, missing], workers=2, batch_size=10, manifest_path=str(manifest_path))
+    assert sorted(translated) == sorted([good, skipped, missing])
+    # Committed and skipped headers are told apart; failed ones not listed.
+    assert sorted(manifest_path.read_text().splitlines()) == sorted([good, f"{skipped}\tskipped"])
+
+    # Resuming only processes again the headers that were not committed.
+    translated.clear()
+    hinfo.backfill([good, skipped, missing], workers=2, batch_size=10, manifest_path=str(manifest_path))
+    assert sorted(translated) == sorted([skipped, missing])
+
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert len(conn.execute(select(exposure_table)).all()) == 1
+
+
+def test_update_skips_unchanged_rows(pg_engine):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    record = hinfo.translate_resource(ResourcePath(yaml_path), instrument_dict)
+    n_det = len(record.det_exposure_recs)
+
+    def write(rec):
+        before = {t: {k: c.value for k, c in cs.items()} for t, cs in hinfo.update_counters.items()}
+        with pg_engine.begin() as conn:
+            hinfo.write_records(conn, instrument_dict["O"], [rec], update=True)
+        return {
+            t: {k: c.value - before[t][k] for k, c in cs.items()} for t, cs in hinfo.update_counters.items()
+        }
+
+    assert write(record)["exposure"] == {"compared": 0, "changed": 0, "skipped": 0}
+    assert write(record) == {
+        "exposure": {"compared": 1, "changed": 0, "skipped": 1},
+        "ccdexposure": {"compared": n_det, "changed": 0, "skipped": n_det},
+    }
+
+    changed = copy.deepcopy(record)
+    changed.exposure_rec["scheduler_note"] = "reprocessed"
+    assert write(changed)["exposure"] == {"compared": 1, "changed": 1, "skipped": 0}
+
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert conn.execute(select(exposure_table.c.scheduler_note)).scalar() == "reprocessed"
+
+
+def test_upsert_with_copy(pg_engine):
+    with pg_engine.connect() as conn:
+        if not hinfo.copy_supported(conn):
+            pytest.skip("COPY not supported by the database driver")
+
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    record = hinfo.translate_resource(ResourcePath(yaml_path), instrument_dict)
+    table = instrument_dict["O"].ccdexposure_table
+    recs = record.det_exposure_recs
+    with pg_engine.begin() as conn:
+        hinfo.upsert(conn, instrument_dict["O"].exposure_table, [record.exposure_rec], "exposure_id")
+        hinfo.upsert(conn, table, recs, "ccdexposure_id", use_copy=True)
+        # The staging table is reused within the transaction.
+        hinfo.upsert(conn, table, recs, "ccdexposure_id", update=True, use_copy=True)
+
+    with pg_engine.begin() as conn:
+        rows = conn.execute(select(table)).all()
+    assert len(rows) == len(recs)
+    for column in ("ccdexposure_id", "exposure_id", "detector", "s_region"):
+        assert getattr(rows[0], column) == recs[0][column]
+
+
+@pytest.mark.parametrize(
+    "camera_class",
+    ["Latiss", "LsstComCam", "LsstCam"],
+)
+@pytest.mark.parametrize(
+    "ra,dec,rotpa",
+    [(10.0, -30.0, 0.0), (359.9, -60.0, 123.4), (200.0, 5.0, -45.0), (45.0, -89.5, 270.0)],
+)
+def test_vertices_match_wcs(camera_class, ra, dec, rotpa):
+    # The vectorized corners must agree with the per-CCD SkyWcs corners to
+    # within 1 milliarcsecond.
+    tolerance_arcsec = 1e-3
+
+    camera = getattr(lsst.obs.lsst, camera_class).getCamera()
+    vertices = hinfo.get_vertices(camera, ra, dec, rotpa)
+    expected = hinfo.get_vertices_from_wcs(camera, ra, dec, rotpa)
+
+    assert vertices.keys() == expected.keys()
+    for ccdname, corners in expected.items():
+        for (lon, lat), (expected_lon, expected_lat) in zip(vertices[ccdname], corners):
+            point = lsst.geom.SpherePoint(lon, lat, lsst.geom.degrees)
+            expected_point = lsst.geom.SpherePoint(expected_lon, expected_lat, lsst.geom.degrees)
+            assert point.separation(expected_point).asArcseconds() < tolerance_arcsec
+
+
+def test_column_plan_shares_subexpressions():
+    calls = []
+
+    def midpoint(a, b):
+        calls.append((a, b))
+        return (a + b) / 2
+
+    shared = (midpoint, "begin", "end")
+    mapping = {
+        "mid": (lambda m: m, shared),
+        "mid_twice": (lambda m: 2 * m, shared),
+        "begin": "begin",
+    }
+    plan = hinfo.ColumnPlan([mapping])
+
+    assert plan.evaluate({"begin": 1.0, "end": 3.0}) == {"mid": 2.0, "mid_twice": 4.0, "begin": 1.0}
+    assert calls == [(1.0, 3.0)]
+    assert plan.evaluate({"begin": 1.0}) == {"mid": None, "mid_twice": None, "begin": 1.0}
+    assert plan.keywords == {"begin", "end"}
+
+
+def test_instrument_registry(pg_engine, tmp_path, monkeypatch):
+    monkeypatch.setenv("HINFO_CAMERA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(hinfo, "camera_registry", dict())
+    monkeypatch.setattr(hinfo, "instrument_registry", dict())
+
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    assert hinfo.get_instrument_dict("LATISS")["O"] is instrument_dict["O"]
+    assert len(list(tmp_path.glob("LATISS-*.fits"))) == 1
+
+    # Cached instruments are returned without querying the database, also
+    # without an engine.
+    monkeypatch.setattr(hinfo, "get_schema_version", lambda name: pytest.fail("schema version queried"))
+    assert hinfo.get_instrument_dict("LATISS")["O"] is instrument_dict["O"]
+    monkeypatch.setattr(hinfo, "engine", None)
+    monkeypatch.setattr(hinfo, "get_schema_version", lambda name: None)
+    assert hinfo.get_instrument_dict("LATISS")["O"] is not instrument_dict["O"]
+
+    # A fresh process reads the camera back from the cache.
+    hinfo.camera_registry.clear()
+    camera = hinfo.get_camera(lsst.obs.lsst.Latiss)
+    assert camera is not instrument_dict["O"].camera
+    assert [d.getName() for d in camera] == [d.getName() for d in instrument_dict["O"].camera]
+
+
+def test_iter_header_sections():
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    data = yaml_path.read_bytes()
+    content = yaml.safe_load(data)
+
+    sections = dict(hinfo.iter_header_sections(data))
+    assert sections == {
+        section: {header["keyword"]: header["value"] for header in headers}
+        for section, headers in content.items()
+    }
+
+    def section_filter(section):
+        if section == "PRIMARY":
+            return None
+        return {"CCDSLOT"} if section.endswith("_PRIMARY") else False
+
+    sections = dict(hinfo.iter_header_sections(data, section_filter))
+    assert list(sections) == ["PRIMARY", "R00S00_PRIMARY"]
+    assert sections["R00S00_PRIMARY"] == {"CCDSLOT": "S00"}
+
+
+def test_schema_cache(tmp_path):
+    schema = {
+        "type": "record",
+        "name": "logevent_largeFileObjectAvailable",
+        "fields": [{"name": "url", "type": "string"}],
+    }
+
+    class Registry:
+        def __init__(self):
+            self.calls = 0
+
+        async def get_schema_by_id(self, schema_id):
+            self.calls += 1
+            return schema
+
+    body = io.BytesIO()
+    fastavro.schemaless_writer(body, fastavro.parse_schema(schema), {"url": "s3://bucket/header.yaml"})
+    data = b"\x00" + (42).to_bytes(4, "big") + body.getvalue()
+
+    registry = Registry()
+    cache = hinfo.SchemaCache(registry, str(tmp_path))
+    assert asyncio.run(cache.deserialize(data)) == {"id": 42, "message": {"url": "s3://bucket/header.yaml"}}
+    asyncio.run(cache.deserialize(data))
+    assert registry.calls == 1
+
+    # A restarted consumer finds the schema on disk.
+    registry = Registry()
+    cache = hinfo.SchemaCache(registry, str(tmp_path))
+    assert asyncio.run(cache.deserialize(data))["message"]["url"] == "s3://bucket/header.yaml"
+    assert registry.calls == 0
+
+
+def test_instrument_for_url():
+    names = ["LATISS", "LSSTCam"]
+    assert hinfo.header_topic("LSSTCam") == "lsst.sal.MTHeaderService.logevent_largeFileObjectAvailable"
+    url = "s3://rubinobs-lfa-cp/ATHeaderService/header/2024/08/01/AT_O_20240801_000302.yaml"
+    assert hinfo.instrument_for_url(url, names) == "LATISS"
+    assert hinfo.instrument_for_url(url.replace("AT", "MT"), names) == "LSSTCam"
+    assert hinfo.instrument_for_url("file:///tmp/header.yaml", ["LATISS"]) == "LATISS"
+    with pytest.raises(ValueError):
+        hinfo.instrument_for_url("file:///tmp/header.yaml", names)
+
+
+def test_in_flight_limiter():
+    class Partition:
+        def __init__(self, topic):
+            self.topic = topic
+
+    class Consumer:
+        def __init__(self, partitions):
+            self.partitions = partitions
+            self.paused = set()
+
+        def assignment(self):
+            return set(self.partitions)
+
+        def pause(self, *partitions):
+            self.paused.update(partitions)
+
+        def resume(self, *partitions):
+            self.paused.difference_update(partitions)
+
+    async def run():
+        at, mt = Partition("at"), Partition("mt")
+        consumer = Consumer([at, mt])
+        limiter = hinfo.InFlightLimiter(
+            {"LATISS": 1, "LSSTCam": 2}, consumer, {"at": "LATISS", "mt": "LSSTCam"}
+        )
+        release = asyncio.Event()
+        started = []
+
+        async def handle(name, i):
+            started.append((name, i))
+            if name == "LATISS":
+                await release.wait()
+            return i
+
+        latiss = [limiter.submit("LATISS", handle, "LATISS", i) for i in range(2)]
+        lsstcam = [limiter.submit("LSSTCam", handle, "LSSTCam", i) for i in range(3)]
+        # A saturated LATISS does not hold up LSSTCam messages.
+        assert await asyncio.gather(*lsstcam) == [0, 1, 2]
+        assert started.count(("LATISS", 0)) == 1 and ("LATISS", 1) not in started
+        assert consumer.paused == {at}
+
+        release.set()
+        assert await asyncio.gather(*latiss) == [0, 1]
+        assert consumer.paused == set()
+        assert not limiter.tasks
+
+    asyncio.run(run())
+
+
+def test_resource_waiter(tmp_path, monkeypatch):
+    calls = []
+    list_prefix = hinfo.list_prefix
+
+    def spy(prefix, names):
+        calls.append(set(names))
+        return list_prefix(prefix, names)
+
+    monkeypatch.setattr(hinfo, "list_prefix", spy)
+    waiter = hinfo.ResourceWaiter(initial_delay=0.01, max_delay=0.05)
+    paths = [tmp_path / f"AT_O_20240801_00030{i}.yaml" for i in range(2)]
+
+    async def run():
+        waits = [asyncio.create_task(waiter.wait(ResourcePath(str(path)))) for path in paths]
+        await asyncio.sleep(0.1)
+        assert not any(wait.done() for wait in waits)
+        for path in paths:
+            path.write_text("")
+        await asyncio.wait_for(asyncio.gather(*waits), 5)
+
+        # A resource that never appears times out, and its poller stops.
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(waiter.wait(ResourcePath(str(tmp_path / "missing.yaml"))), 0.1)
+        await asyncio.sleep(0.5)
+        assert waiter._pollers == {} and waiter._waiters == {}
+
+    asyncio.run(run())
+    # The resources of a directory are checked together.
+    assert calls[0] == {path.name for path in paths}
+
+
+def test_list_prefix_lists_between_names(monkeypatch):
+    keys = [f"header/2024/08/01/AT_O_20240801_{i:06d}.yaml" for i in range(1, 1000)]
+    requests = []
+
+    class Paginator:
+        def paginate(self, Bucket, Prefix, StartAfter):
+            requests.append((Bucket, Prefix, StartAfter))
+            listed = [key for key in keys if key.startswith(Prefix) and key > StartAfter]
+            for i in range(0, len(listed), 10):
+                yield {"Contents": [{"Key": key} for key in listed[i : i + 10]]}
+
+    class Client:
+        def get_paginator(self, name):
+            return Paginator()
+
+    prefix = ResourcePath("s3://bucket/header/2024/08/01/")
+    monkeypatch.setattr(type(prefix), "client", property(lambda self: Client()))
+    names = {"AT_O_20240801_000302.yaml", "AT_O_20240801_000305.yaml", "AT_O_20240801_001500.yaml"}
+    assert hinfo.list_prefix(prefix, names) == names - {"AT_O_20240801_001500.yaml"}
+    assert requests == [
+        ("bucket", "header/2024/08/01/AT_O_20240801_00", "header/2024/08/01/AT_O_20240801_000302.yam")
+    ]
+
+
+def test_handle_batch_records_failures(pg_engine, tmp_path, monkeypatch):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    good_path = tmp_path / yaml_path.name
+    good_path.write_bytes(yaml_path.read_bytes())
+    broken_path = tmp_path / "broken.yaml"
+    broken_path.write_text("PRIMARY: [")
+    good, broken = str(ResourcePath(good_path)), str(ResourcePath(broken_path))
+
+    class Deserializer:
+        async def deserialize(self, value):
+            return {"message": {"url": value}}
+
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    retry_store = RetryStore(f"sqlite:///{tmp_path}/retry.sqlite3")
+    batch_writer = hinfo.BatchWriter(instrument_dict, 10, 1000, retry_store=retry_store)
+    msgs = [types.SimpleNamespace(value=url) for url in (good, broken)]
+
+    asyncio.run(hinfo.handle_batch(msgs, Deserializer(), instrument_dict, batch_writer, retry_store))
+    assert [entry.url for entry in retry_store.entries()] == [broken]
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert len(conn.execute(select(exposure_table)).all()) == 1
+
+    # While the database is unavailable, no header can be written, but they
+    # are all kept in the retry store and the batch can be committed.
+    monkeypatch.setattr(hinfo, "engine", sa.create_engine("sqlite://"))
+    asyncio.run(hinfo.handle_batch(msgs[:1], Deserializer(), instrument_dict, batch_writer, retry_store))
+    assert sorted(entry.url for entry in retry_store.entries()) == sorted([good, broken])
+
+
+def test_consume_batches_commits_after_handling():
+    class Done(Exception):
+        pass
+
+    at, mt = aiokafka.TopicPartition("at", 0), aiokafka.TopicPartition("mt", 0)
+    batch = {
+        at: [types.SimpleNamespace(offset=0), types.SimpleNamespace(offset=1)],
+        mt: [types.SimpleNamespace(offset=5)],
+    }
+
+    class Consumer:
+        def __init__(self):
+            # The batch is fetched again after seeking back to it.
+            self.batches = [batch, batch, dict()]
+            self.seeks = []
+            self.commits = 0
+
+        async def getmany(self, timeout_ms, max_records):
+            if not self.batches:
+                raise Done()
+            return self.batches.pop(0)
+
+        def seek(self, partition, offset):
+            self.seeks.append((partition.topic, offset))
+
+        async def commit(self):
+            self.commits += 1
+
+    handled = []
+
+    async def handle(msgs_by_instrument):
+        handled.append({name: len(msgs) for name, msgs in msgs_by_instrument.items()})
+        if len(handled) == 1:
+            raise RuntimeError("database unavailable")
+
+    consumer = Consumer()
+    with pytest.raises(Done):
+        asyncio.run(
+            hinfo.consume_batches(
+                consumer, {"at": "LATISS", "mt": "LSSTCam"}, handle, 10, 100, initial_backoff=0
+            )
+        )
+    # A batch that fails is not committed, but handled again.
+    assert handled == [{"LATISS": 2, "LSSTCam": 1}] * 2
+    assert consumer.seeks == [("at", 0), ("mt", 5)]
+    assert consumer.commits == 1
+
+
+@pytest.mark.parametrize("use_executor", [False, True])
+def test_handle_message_removes_retried_header(pg_engine, tmp_path, use_executor):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    url = str(ResourcePath(yaml_path))
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    retry_store = RetryStore(f"sqlite:///{tmp_path}/retry.sqlite3")
+    retry_store.record_failure(url, "write failed")
+
+    executor = concurrent.futures.ThreadPoolExecutor(1) if use_executor else None
+    asyncio.run(hinfo.handle_message({"url": url}, instrument_dict, executor, retry_store=retry_store))
+    if executor is not None:
+        executor.shutdown()
+
+    # Once written, a header that failed before is no longer retried.
+    assert retry_store.entries() == []
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert len(conn.execute(select(exposure_table)).all()) == 1
+
+
+def test_setup_postgres_pool_settings(pg_engine, monkeypatch):
+    monkeypatch.setenv("POSTGRES_URL", pg_engine.url.render_as_string(hide_password=False))
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "2")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "600")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_DRIVER", "psycopg")
+    monkeypatch.setenv("DB_PREPARE_THRESHOLD", "2")
+    for name in ("DB_HOST", "DB_PASS", "DB_USER", "DB_NAME"):
+        monkeypatch.delenv(name, raising=False)
+
+    engine = setup_postgres()
+    assert engine.url.drivername == "postgresql+psycopg"
+    assert engine.pool.size() == 3
+    assert engine.pool._max_overflow == 2
+    assert engine.pool._recycle == 600
+    assert not engine.pool._pre_ping
+    with engine.connect() as conn:
+        assert conn.connection.dbapi_connection.prepare_threshold == 2
+    engine.dispose()
+
+
+def test_upsert_statements_are_reused(pg_engine):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    record = hinfo.translate_resource(ResourcePath(yaml_path), instrument_dict)
+
+    def write():
+        with pg_engine.begin() as conn:
+            hinfo.write_records(conn, instrument_dict["O"], [record], update=True)
+
+    write()
+    statements = dict(hinfo.upsert_statements)
+    write()
+    # The same statements are used, and compiled, again.
+    assert hinfo.upsert_statements.keys() == statements.keys()
+    assert all(hinfo.upsert_statements[key] is stmt for key, stmt in statements.items())
+    table = instrument_dict["O"].exposure_table
+    columns = tuple(record.exposure_rec)
+    assert hinfo.upsert_statement(table, columns, "exposure_id", True) is hinfo.upsert_statement(
+        table, columns, "exposure_id", True
+    )
+
+
+def test_handle_message_writes_through_async_engine(pg_engine, tmp_path, monkeypatch):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    url = str(ResourcePath(yaml_path))
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    retry_store = RetryStore(f"sqlite:///{tmp_path}/retry.sqlite3")
+    retry_store.record_failure(url, "write failed")
+    monkeypatch.setenv("POSTGRES_URL", pg_engine.url.render_as_string(hide_password=False))
+
+    async def run():
+        monkeypatch.setattr(hinfo, "async_engine", setup_async_postgres())
+        try:
+            await hinfo.handle_message({"url": url}, instrument_dict, retry_store=retry_store)
+        finally:
+            await hinfo.async_engine.dispose()
+
+    asyncio.run(run())
+    assert retry_store.entries() == []
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert len(conn.execute(select(exposure_table)).all()) == 1
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_handle_message_dispatch(pg_engine, monkeypatch, kind):
+    yaml_path = Path(__file__).parent / "ATHeaderService_header_AT_O_20240801_000302.yaml"
+    url = str(ResourcePath(yaml_path))
+    # Worker processes connect and build their instruments themselves.
+    monkeypatch.setenv("POSTGRES_URL", pg_engine.url.render_as_string(hide_password=False))
+    monkeypatch.setattr(hinfo, "instruments", ["LATISS"])
+    instrument_dict = hinfo.get_instrument_dict("LATISS")
+    threads = []
+    process_resource = hinfo.process_resource
+
+    def spy(*args):
+        threads.append(threading.current_thread().name)
+        return process_resource(*args)
+
+    monkeypatch.setattr(hinfo, "process_resource", spy)
+    inserts = hinfo.stage_time["exposure_insert"].count
+    with hinfo.make_executor(hinfo.WorkerConfig(kind=kind, workers=1, max_in_flight=1)) as executor:
+        asyncio.run(hinfo.handle_message({"url": url}, instrument_dict, executor))
+
+    # A thread pool processes the header in one of its threads, a process
+    # pool in a worker process, which reports its timings back.
+    if kind == "thread":
+        assert len(threads) == 1 and threads[0].startswith("hinfo-worker")
+    else:
+        assert threads == []
+    assert hinfo.stage_time["exposure_insert"].count == inserts + 1
+    exposure_table = sa.Table("exposure", MetaData(schema="cdb_latiss"), autoload_with=pg_engine)
+    with pg_engine.begin() as conn:
+        assert len(conn.execute(select(exposure_table)).all()) == 1
@@ -0,0 +1,42 @@
+import urllib.request
+
+from lsst.consdb.metrics import Counter, Histogram, Registry, start_http_server
+
+
+def test_histogram_quantiles():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == 5.0
+
+
+def test_registry_render():
+    registry = Registry()
+    for stage, value in (("read", 0.05), ("parse", 0.5)):
+        registry.register(Histogram("stage_seconds", "Stage time", (0.1, 1.0), {"stage": stage})).observe(
+            value
+        )
+    registry.register(Counter("rows", "Rows written")).inc(3)
+
+    text = registry.render()
+    assert text.count("# TYPE stage_seconds histogram") == 1
+    assert 'stage_seconds_bucket{stage="read",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 0' in text
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 1' in text
+    assert 'stage_seconds_count{stage="parse"} 1' in text
+    assert "\nrows 3\n" in text
+
+
+def test_http_server():
+    registry = Registry()
+    registry.register(Counter("rows", "Rows written")).inc()
+    server = start_http_server(0, registry)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            assert response.read().decode() == registry.render()
+    finally:
+        server.shutdown()
@@ -1,6 +1,12 @@
+import asyncio
+import json
 import os
+import subprocess
+import sys
+import time
 from pathlib import Path
 
+import httpx
 import lsst.utils
 import numpy as np
 import pytest
@@ -16,6 +22,7 @@ from felis.tests.postgresql import setup_postgres_test_db
 from lsst.consdb import pqserver
 from lsst.consdb.config import config
 from lsst.consdb.dependencies import reset_dependencies
+from lsst.consdb.handlers import external
 from requests import Response
 
 
@@ -463,6 +470,233 @@ def test_query_endpoint(lsstcomcamsim):
     assert response_json["data"][0][0] == 0
 
 
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_endpoint_stream(lsstcomcamsim):
+    client = lsstcomcamsim
+
+    query = "SELECT exposure_id, day_obs, obs_start FROM cdb_latiss.exposure ORDER BY exposure_id;"
+    expected = client.post("/consdb/query", json={"query": query}).json()
+
+    response = client.post("/consdb/query?stream=1", json={"query": query})
+    _assert_http_status(response, 200)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"columns": expected["columns"]}
+    assert lines[1:] == expected["data"]
+
+    # The Accept header selects streaming too.
+    response = client.post("/consdb/query", json={"query": query}, headers={"Accept": "application/x-ndjson"})
+    _assert_http_status(response, 200)
+    assert [json.loads(line) for line in response.text.splitlines()] == lines
+
+    # Statements that return no rows report the commit flag, and honor it.
+    response = client.post(
+        "/consdb/query?stream=1&commit=0", json={"query": "DELETE FROM cdb_latiss.ccdexposure_flexdata;"}
+    )
+    _assert_http_status(response, 200)
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"columns": ["commit"]}, [0]]
+    response = client.post(
+        "/consdb/query", json={"query": "SELECT count(*) FROM cdb_latiss.ccdexposure_flexdata;"}
+    )
+    assert response.json()["data"][0][0] != 0
+
+    # Errors in the query are reported before streaming starts.
+    response = client.post("/consdb/query?stream=1", json={"query": "SELECT * FROM no_such_table;"})
+    assert response.status_code >= 400
+
+
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_endpoint_columnar(lsstcomcamsim):
+    pyarrow = pytest.importorskip("pyarrow")
+    ipc = pytest.importorskip("pyarrow.ipc")
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    client = lsstcomcamsim
+
+    query = "SELECT exposure_id, exp_time, obs_start FROM cdb_latiss.exposure ORDER BY exposure_id;"
+    expected = client.post("/consdb/query", json={"query": query}).json()
+
+    response = client.post(
+        "/consdb/query", json={"query": query}, headers={"Accept": "application/vnd.apache.arrow.stream"}
+    )
+    _assert_http_status(response, 200)
+    table = ipc.open_stream(response.content).read_all()
+    assert table.column_names == expected["columns"]
+    assert table.schema.field("exposure_id").type == pyarrow.int64()
+    assert table.schema.field("exp_time").type == pyarrow.float64()
+    assert pyarrow.types.is_timestamp(table.schema.field("obs_start").type)
+    assert table.column("exposure_id").to_pylist() == [row[0] for row in expected["data"]]
+
+    response = client.post(
+        "/consdb/query", json={"query": query}, headers={"Accept": "application/vnd.apache.parquet"}
+    )
+    _assert_http_status(response, 200)
+    parquet_table = parquet.read_table(pyarrow.BufferReader(response.content))
+    assert parquet_table.equals(table)
+
+    # Numeric values are sent without loss of precision.
+    value = "0.12345678901234567890123456789"
+    response = client.post(
+        "/consdb/query",
+        json={"query": f"SELECT {value}::numeric AS value;"},
+        headers={"Accept": "application/vnd.apache.arrow.stream"},
+    )
+    _assert_http_status(response, 200)
+    assert ipc.open_stream(response.content).read_all().column("value").to_pylist() == [value]
+
+
+# Streams a query as NDJSON through the asynchronous engine, as the query
+# endpoint does, and prints the number of lines and the growth of the peak
+# RSS, in MB, of a fresh process while doing so.
+_STREAM_RSS_SCRIPT = """
+import asyncio
+import logging
+import resource
+import sys
+
+import sqlalchemy
+from lsst.consdb.dependencies import get_async_engine
+from lsst.consdb.handlers import external
+
+
+async def stream(query, server_side):
+    engine = get_async_engine()
+    connection = await engine.connect()
+    await connection.begin()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if server_side:
+        result = await connection.run_sync(external._execute_query, query)
+    else:
+        result = await connection.run_sync(sqlalchemy.Connection.exec_driver_sql, query)
+    chunks = external._stream_query(connection, result, 1, external.NDJSON_MEDIA_TYPE, logging.getLogger())
+    lines = sum([chunk.count(b"\\n") async for chunk in chunks])
+    growth_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024
+    await engine.dispose()
+    return lines, growth_mb
+
+
+print(*asyncio.run(stream(sys.argv[1], sys.argv[2] == "1")))
+"""
+
+
+def _stream_rss_growth(query: str, server_side: bool) -> tuple[int, float]:
+    env = dict(os.environ, POSTGRES_URL=config.database_url, MAX_ROWS=str(config.max_rows))
+    output = subprocess.run(
+        [sys.executable, "-c", _STREAM_RSS_SCRIPT, query, str(int(server_side))],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return int(output[0]), float(output[1])
+
+
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_server_side_cursor_bounds_memory(lsstcomcamsim, monkeypatch):
+    # About 100 MB of rows, which a client-side cursor would buffer in full.
+    n_rows = 500_000
+    query = f"SELECT g, repeat('x', 200) FROM generate_series(1, {n_rows}) AS g;"
+    monkeypatch.setattr(config, "max_rows", 2 * n_rows)
+
+    # Each measurement runs in its own process, so that the peak RSS is
+    # not one reached earlier by this one.
+    lines, growth_mb = _stream_rss_growth(query, server_side=True)
+    assert lines == n_rows + 1
+    assert growth_mb < 50, f"Peak RSS grew by {growth_mb:.0f} MB"
+    lines, client_side_growth_mb = _stream_rss_growth(query, server_side=False)
+    assert lines == n_rows + 1
+    assert client_side_growth_mb > 50, f"Peak RSS grew by only {client_side_growth_mb:.0f} MB"
+
+    # Statements that cannot be declared as a cursor still run.
+    for statement in (
+        "SELECT 1; SELECT 2;",
+        "SELECT 1 AS one INTO TEMPORARY TABLE one;",
+        "WITH d AS (DELETE FROM cdb_latiss.ccdexposure_flexdata RETURNING 1) SELECT count(*) FROM d;",
+    ):
+        response = lsstcomcamsim.post("/consdb/query?commit=0", json={"query": statement})
+        _assert_http_status(response, 200)
+
+
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_server_side_cursor_choice(lsstcomcamsim):
+    engine = sa.create_engine(config.database_url)
+    try:
+        for query, server_side in (
+            ("SELECT pg_size_pretty(pg_total_relation_size('cdb_latiss.exposure'));", True),
+            (
+                "WITH d AS (DELETE FROM cdb_latiss.ccdexposure_flexdata RETURNING 1) SELECT count(*) FROM d;",
+                False,
+            ),
+        ):
+            with engine.connect() as connection, connection.begin():
+                result = external._execute_query(connection, query)
+                assert ("yield_per" in result.context.execution_options) == server_side, query
+                result.all()
+                connection.rollback()
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_cache(lsstcomcamsim, monkeypatch):
+    client = lsstcomcamsim
+    monkeypatch.setattr(config, "query_cache_ttl_seconds", 60)
+    reset_dependencies()
+
+    count_query = {"query": "SELECT count(*) FROM cdb_latiss.ccdexposure_flexdata;"}
+    first = client.post("/consdb/query", json=count_query).json()
+    assert first["data"][0][0] != 0
+    assert client.post("/consdb/query", json={"query": " " + count_query["query"]}).json() == first
+    stats = client.get("/consdb/query/cache_stats").json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    # Uncommitted writes leave the cache alone; committed ones clear it.
+    delete = {"query": "DELETE FROM cdb_latiss.ccdexposure_flexdata;"}
+    _assert_http_status(client.post("/consdb/query?commit=0", json=delete), 200)
+    assert client.get("/consdb/query/cache_stats").json()["entries"] == 1
+    _assert_http_status(client.post("/consdb/query?commit=1", json=delete), 200)
+    assert client.get("/consdb/query/cache_stats").json()["entries"] == 0
+    assert client.post("/consdb/query", json=count_query).json()["data"][0][0] == 0
+
+
+@pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
+def test_query_concurrency(lsstcomcamsim, monkeypatch):
+    # More slow queries at once than the threadpool that used to serve them
+    # has threads (40), each holding its own pooled connection.
+    n_requests = 50
+    sleep_seconds = 2.0
+    monkeypatch.setattr(config, "async_pool_size", n_requests)
+    monkeypatch.setattr(config, "async_max_overflow", 0)
+    reset_dependencies()
+
+    async def run_load():
+        transport = httpx.ASGITransport(app=pqserver.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            start = time.monotonic()
+            queries = [
+                asyncio.create_task(
+                    client.post("/consdb/query", json={"query": f"SELECT pg_sleep({sleep_seconds}), {i}"})
+                )
+                for i in range(n_requests)
+            ]
+            # The health check is answered while every query is running.
+            await asyncio.sleep(sleep_seconds / 4)
+            root = await client.get("/consdb/")
+            root_seconds = time.monotonic() - start
+            responses = await asyncio.gather(*queries)
+            return root, root_seconds, responses, time.monotonic() - start
+
+    root, root_seconds, responses, elapsed = asyncio.run(run_load())
+
+    _assert_http_status(root, 200)
+    assert root_seconds < sleep_seconds
+    for i, response in enumerate(responses):
+        _assert_http_status(response, 200)
+        assert response.json()["data"][0][1] == i
+    # Served by threads, the queries would take at least two rounds.
+    assert elapsed < 1.5 * sleep_seconds, f"{n_requests} queries took {elapsed:.1f} s"
+
+
 @pytest.mark.parametrize("lsstcomcamsim", ["cdb_latiss"], indirect=True)
 def test_missing_primary_key(lsstcomcamsim):
     client = lsstcomcamsim
@@ -0,0 +1,94 @@
+import time
+
+from lsst.consdb.query_cache import (
+    ANY_TABLE,
+    QueryCache,
+    _estimate_size,
+    is_read_only,
+    normalize_sql,
+    referenced_tables,
+)
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT  *\n  FROM cdb_latiss.exposure ;") == "SELECT * FROM cdb_latiss.exposure"
+    # Whitespace inside literals is significant.
+    assert normalize_sql("SELECT 'a  b'") == "SELECT 'a  b'"
+    assert normalize_sql("SELECT 'a  b'") != normalize_sql("SELECT 'a b'")
+
+
+def test_is_read_only():
+    assert is_read_only("SELECT * FROM cdb_latiss.exposure;")
+    assert is_read_only(" -- latest\n(SELECT max(day_obs) FROM cdb_latiss.exposure)")
+    assert is_read_only("WITH e AS (SELECT * FROM cdb_latiss.exposure) SELECT count(*) FROM e")
+    assert is_read_only("SELECT 'DELETE; it' FROM cdb_latiss.exposure")
+    assert not is_read_only("DELETE FROM cdb_latiss.exposure")
+    assert not is_read_only("WITH d AS (DELETE FROM cdb_latiss.exposure RETURNING *) SELECT * FROM d")
+    assert not is_read_only("SELECT 1; DELETE FROM cdb_latiss.exposure")
+    assert not is_read_only("SELECT * INTO scratch FROM cdb_latiss.exposure")
+    assert not is_read_only("SELECT nextval('cdb_latiss.seq')")
+    assert not is_read_only("SELECT * FROM cdb_latiss.exposure FOR UPDATE")
+    # Only functions with side effects count as writes.
+    assert is_read_only("SELECT pg_size_pretty(pg_total_relation_size('cdb_latiss.exposure'))")
+    assert not is_read_only("SELECT pg_sleep(1)")
+    assert not is_read_only("SELECT pg_try_advisory_lock(1)")
+    assert not is_read_only("SELECT lo_unlink(42)")
+
+
+def test_referenced_tables():
+    tables = referenced_tables(
+        'SELECT e.day_obs FROM cdb_latiss.exposure e JOIN "cdb_latiss"."ccdexposure" c'
+    )
+    assert {"cdb_latiss.exposure", "cdb_latiss.ccdexposure"} <= tables
+    assert ANY_TABLE not in tables
+    assert referenced_tables("SELECT 1") == {ANY_TABLE}
+
+
+def test_cache_invalidation():
+    cache = QueryCache(1_000_000, 60, view_tables={"cdb_latiss.exposure_wide_view": {"cdb_latiss.exposure"}})
+    cache.put("a", [[1]], ["cdb_latiss.exposure"])
+    cache.put("b", [[2]], ["cdb_latiss.ccdexposure"])
+    cache.put("c", [[3]], ["cdb_latiss.exposure_wide_view"])
+    cache.put("d", [[4]], [ANY_TABLE])
+    assert cache.get("a") == [[1]]
+    assert cache.get("missing") is None
+
+    cache.invalidate("cdb_latiss.exposure")
+    assert cache.get("a") is None
+    assert cache.get("b") == [[2]]
+    assert cache.get("c") is None
+    assert cache.get("d") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"], stats["entries"]) == (2, 4, 3, 1)
+
+
+def test_cache_bounds():
+    cache = QueryCache(1_000_000, 0.05)
+    cache.put("a", [[1]], [ANY_TABLE])
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+    row = ["x" * 1000]
+    cache = QueryCache(10_000, 60)
+    for i in range(20):
+        cache.put(i, [row], [ANY_TABLE])
+    stats = cache.stats()
+    assert stats["bytes"] <= 10_000
+    assert stats["evictions"] > 0
+    assert cache.get(19) == [row]
+    assert cache.get(0) is None
+
+    # Oversized results and disabled caches store nothing.
+    cache.put("big", [row] * 100, [ANY_TABLE])
+    assert cache.get("big") is None
+    disabled = QueryCache(10_000, 0)
+    disabled.put("a", [[1]], [ANY_TABLE])
+    assert disabled.get("a") is None
+
+
+def test_estimate_size_stops_at_limit():
+    rows = [[i, "x" * 10] for i in range(1000)]
+    full = _estimate_size(rows)
+    assert _estimate_size(rows, full) == full
+    assert 100 < _estimate_size(rows, 100) < full
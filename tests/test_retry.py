@@ -0,0 +1,30 @@
+from lsst.consdb.retry import RetryStore
+
+
+def test_retry_store_backoff(tmp_path):
+    store = RetryStore(f"sqlite:///{tmp_path}/retry.sqlite3", initial_delay=10.0, max_attempts=3)
+    url = "s3://bucket/header.yaml"
+
+    first = store.record_failure(url, TimeoutError("no file"))
+    assert first.attempts == 1
+    assert first.error_class == "TimeoutError"
+    assert first.next_attempt - first.last_failed == 10.0
+    assert store.due(now=first.last_failed) == []
+    assert [e.url for e in store.due(now=first.next_attempt)] == [url]
+
+    second = store.record_failure(url, "write failed")
+    assert second.attempts == 2
+    assert second.first_failed == first.first_failed
+    assert second.next_attempt - second.last_failed == 20.0
+
+    # After max_attempts the URL is a dead letter: kept but not scheduled.
+    third = store.record_failure(url, "write failed")
+    assert third.next_attempt is None
+    assert store.due(now=third.last_failed + 1e9) == []
+    assert [e.url for e in store.entries()] == [url]
+
+    # A persistent store survives being reopened.
+    store = RetryStore(f"sqlite:///{tmp_path}/retry.sqlite3")
+    assert store.entries()[0].attempts == 3
+    store.remove(url)
+    assert store.entries() == []